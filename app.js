@@ -23,12 +23,18 @@ const PASSWORD = process.env.APP_PASS || ""
 const ALLOW_DEBUG = !!process.env.DEBUG?.length || false
 const EXTENSION_FILENAME = "app.crx"
 const PROXY = process.env.PROXY || undefined
+// lean mode (set by the manager, BOT_LEAN_MODE=1): small window, no images and background services,
+// the tab goes to about:blank once connected - the extension keeps working in its background page
+const LEAN_MODE = ["1", "true", "yes"].includes((process.env.LEAN_MODE || "").toLowerCase())
+// in lean mode the popup is reopened to refresh the status every N heartbeats (30 sec each)
+const LEAN_STATUS_EVERY = parseInt(process.env.LEAN_STATUS_EVERY || "10", 10)
 
 console.log("-> Starting...")
 console.log("-> User:", USER)
 console.log("-> Pass:", PASSWORD)
 console.log("-> Proxy:", PROXY)
 console.log("-> Debug:", ALLOW_DEBUG)
+console.log("-> Lean mode:", LEAN_MODE)
 
 if (!USER || !PASSWORD) {
   console.error("Please set APP_USER and APP_PASS env variables")
@@ -41,16 +47,69 @@ if (ALLOW_DEBUG) {
   )
 }
 
+// heartbeat for the docker healthcheck (healthcheck.js), one file per pm2 process
+const HEARTBEAT_DIR = process.env.HEARTBEAT_DIR || "/tmp/gradient-health"
+const HEARTBEAT_FILE = path.join(HEARTBEAT_DIR, `${process.env.name || "app"}.json`)
+
+function writeHeartbeat(status, title) {
+  try {
+    fs.mkdirSync(HEARTBEAT_DIR, { recursive: true })
+    fs.writeFileSync(`${HEARTBEAT_FILE}.tmp`, JSON.stringify({ time: Date.now(), status, title }))
+    fs.renameSync(`${HEARTBEAT_FILE}.tmp`, HEARTBEAT_FILE)
+  } catch (error) {
+    console.error("-> Failed to write heartbeat:", error.message)
+  }
+}
+
+// a process stopped on purpose (pm2 stop/delete) is not a dead bot, a crashed one keeps its stale heartbeat
+for (const signal of ["SIGINT", "SIGTERM"]) {
+  process.on(signal, () => {
+    try {
+      fs.unlinkSync(HEARTBEAT_FILE)
+    } catch (error) {
+      // no heartbeat yet
+    }
+    process.exit()
+  })
+}
+
+// the manager keeps a verified copy of the extension in a read-only volume shared by all containers
+const EXTENSION_CACHE_DIR = process.env.EXTENSION_CACHE_DIR || "/cache/extension"
+const EXTENSION_CACHE_MAX_AGE = 7 * 86400000
+
+function cachedExtension() {
+  try {
+    const manifest = JSON.parse(fs.readFileSync(path.join(EXTENSION_CACHE_DIR, "extension.json"), "utf-8"))
+    if (Date.now() - manifest.fetched_at * 1000 > EXTENSION_CACHE_MAX_AGE) {
+      return null
+    }
+    const file = path.join(EXTENSION_CACHE_DIR, path.basename(manifest.file))
+    const sha256 = crypto.createHash("sha256").update(fs.readFileSync(file)).digest("hex")
+    return sha256 === manifest.sha256 ? file : null
+  } catch (error) {
+    // no cache volume or it is not filled yet
+    return null
+  }
+}
+
+// returns the path of the .crx to load
 async function downloadExtension(extensionId) {
   const url = CRX_URL.replace(extensionId, extensionId)
   const headers = { "User-Agent": USER_AGENT }
+  const target = path.resolve(__dirname, EXTENSION_FILENAME)
+
+  const cached = cachedExtension()
+  if (cached) {
+    console.log("-> Extension found in shared cache! skip download...", path.basename(cached))
+    return cached
+  }
 
   console.log("-> Downloading extension from:", url)
 
   // if file exists and modify time is less than 1 day, skip download
-  if (fs.existsSync(EXTENSION_FILENAME) && fs.statSync(EXTENSION_FILENAME).mtime > Date.now() - 86400000) {
+  if (fs.existsSync(target) && fs.statSync(target).mtime > Date.now() - 86400000) {
     console.log("-> Extension already downloaded! skip download...")
-    return
+    return target
   }
 
   return new Promise((resolve, reject) => {
@@ -59,12 +118,12 @@ async function downloadExtension(extensionId) {
         console.error("Error downloading extension:", error)
         return reject(error)
       }
-      fs.writeFileSync(EXTENSION_FILENAME, body)
+      fs.writeFileSync(target, body)
       if (ALLOW_DEBUG) {
         const md5 = crypto.createHash("md5").update(body).digest("hex")
         console.log("-> Extension MD5: " + md5)
       }
-      resolve()
+      resolve(target)
     })
   })
 }
@@ -103,8 +162,12 @@ async function getDriverOptions() {
   options.addArguments("--disable-dev-shm-usage")
   // options.addArguments("--incognito")
   options.addArguments('enable-automation')
-  options.addArguments("--window-size=1920,1080")
-  options.addArguments("--start-maximized")
+  if (LEAN_MODE) {
+    options.addArguments("--window-size=800,600")
+  } else {
+    options.addArguments("--window-size=1920,1080")
+    options.addArguments("--start-maximized")
+  }
   options.addArguments("--disable-renderer-backgrounding")
   options.addArguments("--disable-background-timer-throttling")
   options.addArguments("--disable-backgrounding-occluded-windows")
@@ -131,8 +194,22 @@ async function getDriverOptions() {
   options.addArguments("--allow-running-insecure-content")
   options.addArguments("--enable-unsafe-swiftshader")
 
-  if (!ALLOW_DEBUG) {
-    // options.addArguments("--blink-settings=imagesEnabled=false")
+  if (!ALLOW_DEBUG && LEAN_MODE) {
+    // screenshots need images, so they stay on while debugging
+    options.addArguments("--blink-settings=imagesEnabled=false")
+  }
+
+  if (LEAN_MODE) {
+    options.addArguments("--disable-background-networking")
+    options.addArguments("--disable-component-update")
+    options.addArguments("--disable-domain-reliability")
+    options.addArguments("--disable-sync")
+    options.addArguments("--disable-breakpad")
+    options.addArguments("--disable-features=Translate,OptimizationHints,MediaRouter,AutofillServerCommunication")
+    options.addArguments("--metrics-recording-only")
+    options.addArguments("--mute-audio")
+    options.addArguments("--disk-cache-size=1")
+    options.addArguments("--media-cache-size=1")
   }
 
   if (PROXY) {
@@ -185,13 +262,13 @@ async function getProxyIpInfo(driver, proxyUrl) {
 }
 
 (async () => {
-  await downloadExtension(extensionId)
+  const extensionPath = await downloadExtension(extensionId)
 
   const options = await getDriverOptions()
 
-  options.addExtensions(path.resolve(__dirname, EXTENSION_FILENAME))
+  options.addExtensions(extensionPath)
 
-  console.log(`-> Extension added! ${EXTENSION_FILENAME}`)
+  console.log(`-> Extension added! ${path.basename(extensionPath)}`)
 
   // enable debug
   if (ALLOW_DEBUG) {
@@ -327,10 +404,35 @@ async function getProxyIpInfo(driver, proxyUrl) {
 
     console.log("-> Lunched!")
 
+    if (LEAN_MODE) {
+      // the popup page holds a renderer with the whole UI, a blank tab is much lighter
+      await driver.get("about:blank")
+      console.log("-> Lean mode: popup closed, running on about:blank")
+    }
+
     // keep the process running
+    let lastStatus = supportStatus
+    let beats = 0
+    writeHeartbeat(lastStatus, "")
     setInterval(() => {
-      driver.getTitle().then((title) => {
+      driver.getTitle().then(async (title) => {
         console.log(`-> [${USER}] Running...`, title)
+        try {
+          if (!LEAN_MODE) {
+            lastStatus = await driver
+              .findElement(By.css(".absolute.mt-3.right-0.z-10"))
+              .getText()
+          } else if (++beats % LEAN_STATUS_EVERY === 0) {
+            await driver.get(`chrome-extension://${extensionId}/popup.html`)
+            lastStatus = await driver
+              .wait(until.elementLocated(By.css(".absolute.mt-3.right-0.z-10")), 30000)
+              .getText()
+            await driver.get("about:blank")
+          }
+        } catch (error) {
+          // the popup may be reloading, keep the last known status
+        }
+        writeHeartbeat(lastStatus, title)
       })
 
       if (PROXY) {
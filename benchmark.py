@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""Замеры скорости bot_manager.py на поддельном Docker
+
+Менеджер работает с поддельным демоном Docker из tests/fake_docker.py
+(HTTP API на unix-сокете) или, с --backend cli, с поддельной утилитой
+docker оттуда же, которая переводит команды в запросы к тому же демону. Контейнер "подключается" через
+--start-latency секунд, доля --fail-rate контейнеров падает с критической
+ошибкой. Прокси проверяются через поддельный socks5-сервер.
+
+Для каждого размера парка в отдельном процессе замеряются: сохранение и
+загрузка конфигурации, bulk_add_bots (проверка прокси и запуск всех
+ботов), list_bots, stop_bot, start_bot одного бота и остановка всего
+парка. Отдельно замеряется запуск менеджера в новом процессе (импорт,
+BotManager() и чтение одной записи) - он не должен выходить за
+--startup-budget при любом размере парка. bulk_add_bots не должен
+тратить больше --bulk-budget секунд на бота сверх идеального запуска
+пачками по --workers ботов. Результаты пишутся в JSON.
+
+    python benchmark.py --sizes 10,100,1000,10000 --output benchmark.json
+    python benchmark.py --sizes 10,100 --compare benchmark.json
+"""
+import os
+import sys
+import io
+import json
+import math
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from contextlib import redirect_stdout
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Поведение поддельного демона задается через окружение процесса демона (см. run_size)
+START_LATENCY = float(os.environ.get("BENCH_START_LATENCY", "0.2"))
+FAIL_RATE = float(os.environ.get("BENCH_FAIL_RATE", "0"))
+API_DELAY = float(os.environ.get("BENCH_API_DELAY", "0"))
+
+OPERATIONS = ("config_save", "config_load", "startup", "bulk_add_bots", "list_bots", "stop_bot", "start_bot",
+              "teardown_all")
+# Бюджет запуска менеджера: скрипты и cron вызывают его много раз
+STARTUP_BUDGET = float(os.environ.get("BENCH_STARTUP_BUDGET", "0.1"))
+# Накладные расходы bulk_add_bots на бота сверх идеала (пачки по workers ботов, каждая за start_latency):
+# квадратичная работа на каждом запуске выходит за бюджет уже на 1000 ботов
+BULK_BUDGET = float(os.environ.get("BENCH_BULK_BUDGET", "0.01"))
+
+
+# ---------------------------------------------------------------- поддельный демон
+
+def serve_fake_dockerd(path):
+    """Демон из tests/fake_docker.py - в отдельном процессе, чтобы не делить GIL с менеджером"""
+    from tests.fake_docker import FakeDockerd
+
+    if os.path.exists(path):
+        os.remove(path)
+    FakeDockerd(mem_total=64 << 30, cpus=32, start_latency=START_LATENCY, fail_rate=FAIL_RATE,
+                api_delay=API_DELAY).start(path)
+    threading.Event().wait()
+
+
+# ---------------------------------------------------------------- поддельный socks5-прокси
+
+async def _socks5_session(reader, writer):
+    """Принимает любой логин, на CONNECT сразу отвечает как сервис проверки IP"""
+    try:
+        _, count = await reader.readexactly(2)
+        methods = await reader.readexactly(count)
+        if 2 in methods:
+            writer.write(b"\x05\x02")
+            await reader.readexactly(1)
+            await reader.readexactly((await reader.readexactly(1))[0])
+            await reader.readexactly((await reader.readexactly(1))[0])
+            writer.write(b"\x01\x00")
+        else:
+            writer.write(b"\x05\x00")
+        header = await reader.readexactly(4)
+        if header[3] == 3:
+            await reader.readexactly((await reader.readexactly(1))[0] + 2)
+        else:
+            await reader.readexactly((4 if header[3] == 1 else 16) + 2)
+        writer.write(b"\x05\x00\x00\x01\x7f\x00\x00\x01\x00\x00")
+        await reader.readuntil(b"\r\n\r\n")
+        body = b'{"ip":"203.0.113.1"}'
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n"
+                     b"Connection: close\r\n\r\n%s" % (len(body), body))
+        await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def start_fake_proxy():
+    """Запускает socks5-сервер в фоне, возвращает его порт"""
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    port = []
+
+    async def main():
+        server = await asyncio.start_server(_socks5_session, "127.0.0.1", 0, backlog=1024)
+        port.append(server.sockets[0].getsockname()[1])
+        ready.set()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=lambda: loop.run_until_complete(main()), daemon=True).start()
+    ready.wait()
+    return port[0]
+
+
+# ---------------------------------------------------------------- замеры
+
+def measure_startup(runs=3):
+    """Лучшее из runs время запуска менеджера в новом процессе, сек
+
+    Байткод кэшируется в рабочем каталоге, как при повторных вызовах из cron.
+    """
+    code = ("import time; started = time.perf_counter(); import bot_manager; "
+            "manager = bot_manager.BotManager(echo=None); manager.config['bots'].get('bot0'); "
+            "print(time.perf_counter() - started)")
+    env = dict(os.environ, PYTHONPATH=HERE, PYTHONPYCACHEPREFIX=os.path.abspath("pycache"))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    # Первый запуск только компилирует модуль
+    subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True)
+    return min(float(subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True,
+                                    text=True).stdout) for _ in range(runs))
+
+
+def measure_size(size, result_file, workers):
+    """Выполняется в отдельном процессе, в рабочем каталоге прогона"""
+    proxy_port = start_fake_proxy()
+    # Адрес сервиса проверки не резолвится - запрос обслуживает сам поддельный прокси
+    os.environ["BOT_PROXY_CHECK_URL"] = "http://ip-check.bench/"
+    sys.path.insert(0, HERE)
+    import bot_manager
+
+    timings = {}
+
+    def timed(operation, function, *args, **kwargs):
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            result = function(*args, **kwargs)
+        timings[operation] = round(time.perf_counter() - started, 4)
+        return result
+
+    bots = {f"bot{index}": {"email": f"user{index}@example.com", "password": f"pass{index}",
+                            "proxy_file": f"proxies_bot{index}.txt"} for index in range(size)}
+
+    def save():
+        store = bot_manager.open_config_store("bench_store.json")
+        with store.batch():
+            for bot_id, bot in bots.items():
+                store[bot_id] = bot
+        store.close()
+
+    def load():
+        store = bot_manager.open_config_store("bench_store.json")
+        count = sum(1 for _ in store.items())
+        store.close()
+        return count
+
+    timed("config_save", save)
+    timed("config_load", load)
+
+    # Запуск менеджера на конфигурации парка этого размера
+    store = bot_manager.open_config_store("bot_config.json")
+    with store.batch():
+        for bot_id, bot in bots.items():
+            store[bot_id] = bot
+    store.close()
+    timings["startup"] = round(measure_startup(), 4)
+
+    manager = bot_manager.BotManager()
+    lines = "".join(f"{bot_id}|{bot['email']}|{bot['password']}|127.0.0.1:{proxy_port}:u{index}:p\n"
+                    for index, (bot_id, bot) in enumerate(bots.items()))
+    sys.stdin = io.StringIO(lines + "\n")
+    timed("bulk_add_bots", manager.bulk_add_bots, workers=workers)
+    states = manager.container_states()
+    running = sum(1 for container in states.values() if container["state"] == "running")
+
+    manager._status_cache = None
+    timed("list_bots", manager.list_bots)
+    timed("stop_bot", manager.stop_bot, "bot0")
+    started = timed("start_bot", manager.start_bot, "bot0", verbose=False)
+    timed("teardown_all", manager.teardown_bots)
+
+    with open(result_file, "w") as f:
+        json.dump({"timings": timings, "running": running, "start_bot_ok": started}, f)
+
+
+def run_size(size, args):
+    workdir = tempfile.mkdtemp(prefix=f"bench-{size}-")
+    socket_path = os.path.join(workdir, "docker.sock")
+    env = dict(os.environ,
+               BENCH_START_LATENCY=str(args.start_latency),
+               BENCH_FAIL_RATE=str(args.fail_rate),
+               BENCH_API_DELAY=str(args.api_delay),
+               BOT_DOCKER_BACKEND=args.backend,
+               BOT_DOCKER_SOCKET=socket_path,
+               BOT_BULK_WORKERS=str(args.workers),
+               BOT_CONFIG_STORE=args.store,
+               BOT_POOL_SIZE="0",
+               # Расширение не скачивается - замер не должен зависеть от сети
+               BOT_CRX_CACHE_TTL="0",
+               # Поддельные контейнеры почти ничего не потребляют - емкость машины не должна ограничивать прогон
+               BOT_EXPECTED_MEMORY="1m",
+               BOT_EXPECTED_CPU="0.1",
+               # Запущенные боты резервируют CPU до следующего docker stats, а на машине
+               # с одним ядром 0.1% на бота ограничили бы прогон 900 ботами
+               BOT_CPU_HEADROOM="-100")
+    env.pop("DOCKER_HOST", None)
+    env.pop("BOT_DOCKER_HOSTS", None)
+    if args.backend == "cli":
+        from tests.fake_docker import install_cli
+
+        shim_dir = os.path.join(workdir, "bin")
+        os.makedirs(shim_dir)
+        install_cli(shim_dir, socket_path)
+        env["PATH"] = shim_dir + os.pathsep + env.get("PATH", "")
+
+    daemon = subprocess.Popen([sys.executable, os.path.abspath(__file__), "fake-dockerd", socket_path], env=env)
+    try:
+        deadline = time.monotonic() + 10
+        while not os.path.exists(socket_path):
+            if time.monotonic() > deadline or daemon.poll() is not None:
+                raise RuntimeError("поддельный демон не запустился")
+            time.sleep(0.05)
+
+        result_file = os.path.join(workdir, "result.json")
+        with open(os.path.join(workdir, "manager.log"), "w") as log:
+            subprocess.run([sys.executable, os.path.abspath(__file__), "measure", str(size), result_file,
+                            str(args.workers)], env=env, cwd=workdir, stdout=log, stderr=subprocess.STDOUT,
+                           timeout=args.size_timeout)
+        if not os.path.exists(result_file):
+            raise RuntimeError(f"прогон не завершился, см. {workdir}/manager.log")
+        with open(result_file) as f:
+            return json.load(f)
+    finally:
+        daemon.kill()
+        daemon.wait()
+        if args.keep:
+            print(f"  рабочий каталог: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bulk_budget(size, args):
+    """Предельное время bulk_add_bots: идеальный запуск пачками плюс бюджет на каждого бота"""
+    return math.ceil(size / args.workers) * args.start_latency + size * args.bulk_budget
+
+
+def compare(results, baseline_file, threshold, noise):
+    """Печатает операции, ставшие медленнее базового прогона; возвращает их число"""
+    with open(baseline_file) as f:
+        baseline = {(item["bots"], item["operation"]): item["seconds"] for item in json.load(f)["results"]}
+    regressions = 0
+    for item in results:
+        before = baseline.get((item["bots"], item["operation"]))
+        if before is None:
+            continue
+        after = item["seconds"]
+        if after > before * (1 + threshold) and after - before > noise:
+            regressions += 1
+            print(f"РЕГРЕССИЯ {item['operation']} ({item['bots']} ботов): {before:.3f} -> {after:.3f} сек")
+    return regressions
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Служебные режимы: демон и замер одного размера
+    if argv[:1] == ["fake-dockerd"]:
+        serve_fake_dockerd(argv[1])
+        return 0
+    if argv[:1] == ["measure"]:
+        measure_size(int(argv[1]), argv[2], int(argv[3]))
+        return 0
+
+    parser = argparse.ArgumentParser(description="Замеры bot_manager.py на поддельном Docker")
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="размеры парка через запятую")
+    parser.add_argument("--backend", choices=("api", "cli"), default="api", help="клиент Docker менеджера")
+    parser.add_argument("--store", choices=("sqlite", "json"), default="sqlite", help="хранилище конфигурации")
+    parser.add_argument("--workers", type=int, default=50, help="число параллельных запусков")
+    parser.add_argument("--start-latency", type=float, default=START_LATENCY, help="время подключения бота, сек")
+    parser.add_argument("--fail-rate", type=float, default=FAIL_RATE, help="доля падающих контейнеров (0..1)")
+    parser.add_argument("--api-delay", type=float, default=API_DELAY, help="задержка каждого запроса к демону, сек")
+    parser.add_argument("--size-timeout", type=int, default=3600, help="предел на один размер парка, сек")
+    parser.add_argument("--output", default="benchmark_results.json", help="файл результатов")
+    parser.add_argument("--compare", metavar="FILE", help="сравнить с прошлыми результатами")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление (доля)")
+    parser.add_argument("--noise", type=float, default=0.05, help="разница, которая не считается регрессией, сек")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET,
+                        help="предельное время запуска менеджера, сек")
+    parser.add_argument("--bulk-budget", type=float, default=BULK_BUDGET,
+                        help="накладные расходы массового запуска на бота сверх идеала, сек (0 - не проверять)")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочие каталоги")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = []
+    runs = {}
+    over_budget = 0
+    for size in sizes:
+        print(f"Парк из {size} ботов ({args.backend})...", flush=True)
+        run = run_size(size, args)
+        runs[size] = {"running": run["running"], "start_bot_ok": run["start_bot_ok"]}
+        for operation in OPERATIONS:
+            if operation in run["timings"]:
+                seconds = run["timings"][operation]
+                results.append({"bots": size, "operation": operation, "seconds": seconds})
+                print(f"  {operation:<14} {seconds:>10.3f} сек")
+        startup = run["timings"].get("startup")
+        if startup is not None and startup > args.startup_budget:
+            over_budget += 1
+            print(f"  ПРЕВЫШЕН БЮДЖЕТ запуска: {startup:.3f} > {args.startup_budget:.3f} сек")
+        bulk = run["timings"].get("bulk_add_bots")
+        limit = bulk_budget(size, args)
+        if bulk is not None and args.bulk_budget > 0 and bulk > limit:
+            over_budget += 1
+            print(f"  ПРЕВЫШЕН БЮДЖЕТ bulk_add_bots: {bulk:.3f} > {limit:.3f} сек "
+                  f"({(bulk - limit) / size * 1000:.1f} мс на бота сверх бюджета)")
+        print(f"  запущено ботов: {run['running']} из {size}", flush=True)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {"backend": args.backend, "store": args.store, "workers": args.workers,
+                    "start_latency": args.start_latency, "fail_rate": args.fail_rate, "api_delay": args.api_delay,
+                    "startup_budget": args.startup_budget, "bulk_budget": args.bulk_budget},
+        "runs": runs,
+        "results": results,
+    }
+    regressions = compare(results, args.compare, args.threshold, args.noise) if args.compare else 0
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Результаты записаны в {args.output}")
+    return 1 if regressions or over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
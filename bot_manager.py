@@ -10,63 +10,2794 @@ import time
 import io
 import getpass
 import re
+import csv
+import calendar
+import math
+import copy
+import functools
+import atexit
+from collections import deque, namedtuple
+import argparse
+import threading
+import queue
+import asyncio
+import ssl
+import hashlib
+import shutil
+import sqlite3
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+import socket
+import http.client
+import urllib.request
+from urllib.parse import quote, urlencode, urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Параметры массового запуска (можно переопределить через переменные окружения)
+BULK_WORKERS = int(os.environ.get("BOT_BULK_WORKERS", "5"))
+START_TIMEOUT = int(os.environ.get("BOT_START_TIMEOUT", "180"))
+
+# Параметры массовой остановки: grace-период docker stop и размер пачки
+STOP_TIMEOUT = int(os.environ.get("BOT_STOP_TIMEOUT", "10"))
+STOP_BATCH = int(os.environ.get("BOT_STOP_BATCH", "20"))
+ALL_BOTS = "all"
+
+# Наблюдение за ботами: период проверки, экспоненциальная задержка перезапуска,
+# карантин при циклических падениях и лимит одновременных перезапусков
+SUPERVISE_INTERVAL = int(os.environ.get("BOT_SUPERVISE_INTERVAL", "30"))
+RESTART_BACKOFF_BASE = int(os.environ.get("BOT_RESTART_BACKOFF_BASE", "10"))
+RESTART_BACKOFF_MAX = int(os.environ.get("BOT_RESTART_BACKOFF_MAX", "900"))
+CRASH_LOOP_LIMIT = int(os.environ.get("BOT_CRASH_LOOP_LIMIT", "5"))
+CRASH_LOOP_WINDOW = int(os.environ.get("BOT_CRASH_LOOP_WINDOW", "1800"))
+QUARANTINE_TIME = int(os.environ.get("BOT_QUARANTINE_TIME", "3600"))
+MAX_CONCURRENT_RESTARTS = int(os.environ.get("BOT_MAX_CONCURRENT_RESTARTS", "5"))
+
+# Плавный перезапуск: сколько ботов может быть недоступно одновременно
+ROLLING_MAX_UNAVAILABLE = int(os.environ.get("BOT_ROLLING_MAX_UNAVAILABLE", "1"))
+
+# Результаты плавного перезапуска бота
+ROLL_RESTARTED = "restarted"
+ROLL_ROLLED_BACK = "rolled_back"
+ROLL_FAILED = "failed"
+ROLL_SKIPPED = "skipped"
+
+# Проверка здоровья силами Docker: app.js раз в 30 сек пишет файл-пульс с
+# статусом расширения, healthcheck.js в контейнере проверяет его свежесть.
+# Политика перезапуска поднимает контейнеры и без работающего менеджера.
+HEALTH_INTERVAL = int(os.environ.get("BOT_HEALTH_INTERVAL", "30"))
+HEALTH_TIMEOUT = int(os.environ.get("BOT_HEALTH_TIMEOUT", "10"))
+HEALTH_RETRIES = int(os.environ.get("BOT_HEALTH_RETRIES", "3"))
+HEARTBEAT_MAX_AGE = int(os.environ.get("BOT_HEARTBEAT_MAX_AGE", "90"))
+HEARTBEAT_DIR = "/tmp/gradient-health"
+RESTART_POLICY = os.environ.get("BOT_RESTART_POLICY", "unless-stopped")
+
+# Результаты остановки бота
+TEARDOWN_REMOVED = "removed"
+TEARDOWN_NOT_FOUND = "not_found"
+
+# Результаты запуска бота
+STATUS_STARTED = "started"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+
+# Состояния healthcheck для list_bots
+CONTAINER_HEALTH = {
+    "healthy": "здоров",
+    "unhealthy": "нет пульса",
+    "starting": "запуск",
+}
+
+# Состояния контейнеров для list_bots
+CONTAINER_STATES = {
+    "running": "работает",
+    "restarting": "перезапуск",
+    "exited": "остановлен",
+    "dead": "остановлен",
+    "created": "создан",
+    "paused": "на паузе",
+}
+
+# События в логах app.js и start.js: тип события -> шаблон маркера.
+# Все маркеры собраны в одно выражение, строка лога проверяется за один поиск.
+LOG_EVENT_STARTING = "starting"
+LOG_EVENT_LOGIN = "login"
+LOG_EVENT_EXTENSION = "extension"
+LOG_EVENT_STATUS = "status"
+LOG_EVENT_CONNECTED = "connected"
+LOG_EVENT_RUNNING = "running"
+LOG_EVENT_REGION = "region"
+LOG_EVENT_FATAL = "fatal"
+LOG_EVENT_ERROR = "error"
+LOG_MARKERS = {
+    LOG_EVENT_STARTING: r"-> Starting\.\.\.",
+    LOG_EVENT_LOGIN: r"Logged in! Waiting for open extension\.\.\.",
+    LOG_EVENT_EXTENSION: r"Extension loaded!",
+    # Статус поддержки: "-> Status: Good" или "{ support_status: 'Good' }"
+    LOG_EVENT_STATUS: r"(?:-> Status:\s*|support_status: ')(?P<support>[^'\n]+)",
+    LOG_EVENT_CONNECTED: r"Connected! Starting rolling\.\.\.",
+    LOG_EVENT_RUNNING: r"-> \[[^\]]*\] Running",
+    LOG_EVENT_REGION: r"Gradient is not yet available in your region",
+    LOG_EVENT_FATAL: r"No proxies\.txt found|Please set APP_USER",
+    LOG_EVENT_ERROR: r"Error occurred:",
+}
+LOG_EVENT_PATTERN = re.compile("|".join(f"(?P<{kind}>{marker})" for kind, marker in LOG_MARKERS.items()))
+# События, после которых бот не подключится без вмешательства
+LOG_FAILURES = (LOG_EVENT_FATAL, LOG_EVENT_REGION)
+
+# Событие лога: тип (LOG_EVENT_*), время по метке console-stamp или None,
+# значение (статус поддержки, для остальных событий None) и строка
+LogEvent = namedtuple("LogEvent", "kind time value line")
+
+# Метка времени console-stamp в логах app.js: [2024/11/22 10:00:00.123]
+LOG_TIMESTAMP = re.compile(r"\[(\d{4})/(\d{2})/(\d{2}) (\d{2}):(\d{2}):(\d{2})\.(\d{3})\]")
+
+# Метрики запуска: файл для textfile-коллектора Prometheus и сохраненное состояние
+METRICS_FILE = os.environ.get("BOT_METRICS_FILE", "bot_metrics.prom")
+METRICS_STATE_FILE = os.environ.get("BOT_METRICS_STATE", "bot_metrics.json")
+METRICS_BUCKETS = (5, 10, 20, 30, 45, 60, 90, 120, 180, 300)
+# Как часто (сек) сбрасывать метрики на диск во время запусков и сколько последних
+# запусков ботов хранить для gradient_bot_last_startup_seconds
+METRICS_FLUSH_INTERVAL = float(os.environ.get("BOT_METRICS_FLUSH", "5"))
+METRICS_MAX_BOTS = int(os.environ.get("BOT_METRICS_MAX_BOTS", "10000"))
+
+# Доступ к Docker: auto - API через сокет, если он доступен, иначе docker CLI
+DOCKER_BACKEND = os.environ.get("BOT_DOCKER_BACKEND", "auto")
+DOCKER_SOCKET = os.environ.get("BOT_DOCKER_SOCKET", "/var/run/docker.sock")
+
+# Образ собирается из этого каталога (docker build -t gradient-bot:local .): паки, пул,
+# healthcheck, кэш расширения и экономный режим работают только с его app.js и entrypoint.sh
+BOT_IMAGE = os.environ.get("BOT_IMAGE", "gradient-bot:local")
+# Тег локально собранных образов: такие образы не скачиваются из реестра
+LOCAL_IMAGE_TAG = "local"
+# Образ, из которого боты запускались раньше: его контейнеры тоже находятся при очистке
+LEGACY_BOT_IMAGE = "overtrue/gradient-bot"
+
+# Проверка прокси: адрес, таймаут на один прокси, срок жизни результата и параллельность
+PROXY_CHECK_URL = os.environ.get("BOT_PROXY_CHECK_URL", "https://api.ipify.org?format=json")
+PROXY_CHECK_TIMEOUT = float(os.environ.get("BOT_PROXY_CHECK_TIMEOUT", "20"))
+PROXY_CHECK_TTL = int(os.environ.get("BOT_PROXY_CHECK_TTL", "3600"))
+PROXY_CHECK_CONCURRENCY = int(os.environ.get("BOT_PROXY_CHECK_CONCURRENCY", "50"))
+
+# Ресурсы хоста: ограничения контейнера бота, запас памяти/CPU, который нельзя занимать,
+# ожидаемое потребление бота до появления замеров и частота замеров docker stats
+BOT_MEMORY_LIMIT = os.environ.get("BOT_MEMORY_LIMIT", "")
+BOT_CPU_LIMIT = os.environ.get("BOT_CPU_LIMIT", "")
+MEMORY_HEADROOM = float(os.environ.get("BOT_MEMORY_HEADROOM", "0.10"))
+CPU_HEADROOM = float(os.environ.get("BOT_CPU_HEADROOM", "0.10"))
+EXPECTED_BOT_MEMORY = os.environ.get("BOT_EXPECTED_MEMORY", "700m")
+EXPECTED_BOT_CPU = float(os.environ.get("BOT_EXPECTED_CPU", "25"))
+RESOURCE_SAMPLE_TTL = int(os.environ.get("BOT_RESOURCE_SAMPLE_TTL", "30"))
+RESOURCE_WINDOW = int(os.environ.get("BOT_RESOURCE_WINDOW", "10"))
+
+# Экономный режим браузера (app.js, LEAN_MODE): маленькое окно, без картинок и фоновых
+# служб, после подключения вкладка уходит на about:blank. Меньше памяти на бота.
+LEAN_MODE = os.environ.get("BOT_LEAN_MODE", "0") == "1"
+
+# Прогрев: как часто обновлять образ бота (0 - не обновлять, только скачать при отсутствии),
+# размер пула заранее созданных остановленных контейнеров (0 - пул выключен),
+# через сколько секунд свободный контейнер пула пересоздается и где лежат его файлы
+IMAGE_REFRESH = int(os.environ.get("BOT_IMAGE_REFRESH", "21600"))
+IMAGE_STATE_FILE = os.environ.get("BOT_IMAGE_STATE", "bot_image.json")
+POOL_SIZE = int(os.environ.get("BOT_POOL_SIZE", "0"))
+POOL_REFRESH = int(os.environ.get("BOT_POOL_REFRESH", "86400"))
+POOL_DIR = os.environ.get("BOT_POOL_DIR", "pool")
+
+# Общий кэш расширения: менеджер раз в CRX_CACHE_TTL секунд (0 - кэш выключен)
+# обновляет app.crx в CRX_CACHE_DIR, каталог монтируется во все контейнеры
+# локального хоста только для чтения, и app.js не скачивает расширение сам
+CRX_CACHE_DIR = os.environ.get("BOT_CRX_CACHE", "crx_cache")
+CRX_CACHE_TTL = int(os.environ.get("BOT_CRX_CACHE_TTL", "86400"))
+CRX_URL = os.environ.get(
+    "BOT_CRX_URL",
+    "https://clients2.google.com/service/update2/crx?response=redirect&prodversion=98.0.4758.102"
+    "&acceptformat=crx2,crx3&x=id%3Dcaacbgbklghmpodbdafajbgdnegacfmo%26uc&nacl_arch=x86-64")
+CRX_USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/98.0.4758.102 Safari/537.36")
+CRX_CONTAINER_DIR = "/cache/extension"
+
+# Состояние контейнеров в памяти по docker events (0 - выключено, каждый раз docker ps)
+# и наибольшая пауза перед переподключением к потоку событий
+WATCH_EVENTS = os.environ.get("BOT_WATCH_EVENTS", "1") != "0"
+EVENTS_RECONNECT_MAX = int(os.environ.get("BOT_EVENTS_RECONNECT_MAX", "60"))
+
+# Несколько Docker-хостов: "имя=адрес,..." (unix://, tcp://, ssh://, context:имя; пусто - только
+# локальный демон), через сколько секунд недоступности боты переносятся с хоста
+# и как долго помнить результат проверки хоста
+DOCKER_HOSTS = os.environ.get("BOT_DOCKER_HOSTS", "")
+HOST_FAILOVER = int(os.environ.get("BOT_HOST_FAILOVER", "300"))
+HOST_CHECK_TTL = int(os.environ.get("BOT_HOST_CHECK_TTL", "10"))
+
+# Хранилище конфигурации ботов: sqlite (по умолчанию) или json
+CONFIG_STORE = os.environ.get("BOT_CONFIG_STORE", "sqlite")
+
+# Упаковка: сколько аккаунтов запускать в одном контейнере (1 - контейнер на бота),
+# каталог с accounts.json паков и сколько строк логов пака просматривать при перезапуске бота
+PACK_SIZE = int(os.environ.get("BOT_PACK_SIZE", "1"))
+PACK_DIR = os.environ.get("BOT_PACK_DIR", "packs")
+PACK_LOG_TAIL = int(os.environ.get("BOT_PACK_LOG_TAIL", "2000"))
+
+# Сколько секунд list_bots использует уже полученное состояние контейнеров
+STATUS_CACHE_TTL = float(os.environ.get("BOT_STATUS_TTL", "5"))
+
+# Сколько последних строк логов каждого бота держать в памяти при просмотре логов парка
+LOG_BUFFER_LINES = int(os.environ.get("BOT_LOG_BUFFER", "200"))
+
+# Префикс строки pm2 logs в контейнере-паке: "3|bot1      | ..."
+PM2_LOG_PREFIX = re.compile(r"^\s*\d+\|(?P<name>[^\s|]+)\s*\| ?")
+
+# Метки, по которым менеджер находит контейнеры своих ботов
+LABEL_MANAGED = "gradient-bot.managed"
+LABEL_BOT_ID = "gradient-bot.id"
+LABEL_PACK = "gradient-bot.pack"
+LABEL_PACK_BOTS = "gradient-bot.bots"
+LABEL_POOL = "gradient-bot.pool"
+LABEL_POOL_IMAGE = "gradient-bot.pool-image"
+LABEL_POOL_CREATED = "gradient-bot.pool-created"
+# Режим браузера в контейнере: "1" - экономный (LEAN_MODE), "0" - обычный
+LABEL_LEAN = "gradient-bot.lean"
+
+
+class DockerError(Exception):
+    pass
+
+
+def parse_size(value):
+    """Переводит размер вида 512m, 1.5g, 1.2GiB или 123456 в байты"""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([kmgt]?)(i?b?)\s*", str(value).lower())
+    if not match:
+        raise ValueError(f"неверный размер: {value}")
+    number, unit, _ = match.groups()
+    return int(float(number) * 1024 ** " kmgt".index(unit or " "))
+
+
+def parse_log_timestamp(line):
+    """Возвращает время строки лога по метке console-stamp (UTC, как в контейнере) или None"""
+    match = LOG_TIMESTAMP.search(line)
+    if not match:
+        return None
+    year, month, day, hour, minute, second, millis = map(int, match.groups())
+    return calendar.timegm((year, month, day, hour, minute, second)) + millis / 1000
+
+
+def parse_docker_time(value):
+    """Время из docker inspect (2024-11-22T10:00:00.123456789Z) в секундах UTC или None"""
+    match = re.match(r"(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(\.\d+)?", value or "")
+    if not match or match.group(1) == "0001":
+        return None
+    seconds = calendar.timegm(tuple(map(int, match.groups()[:6])))
+    return seconds + float(match.group(7) or 0)
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days:
+        return f"{days}д {hours}ч"
+    if hours:
+        return f"{hours}ч {minutes:02d}м"
+    return f"{minutes}м {seconds:02d}с"
+
+
+def _inspect_details(item):
+    state = item.get("State") or {}
+    health = state.get("Health") or {}
+    # healthcheck.js печатает {процесс pm2: {"ok", "age", "status"}} - по нему видно здоровье ботов пака
+    report = None
+    if health.get("Log"):
+        try:
+            report = json.loads(health["Log"][-1].get("Output") or "")
+        except ValueError:
+            pass
+    return {item["Id"]: {"started": parse_docker_time(state.get("StartedAt")),
+                         "restarts": item.get("RestartCount", 0),
+                         "exit_code": state.get("ExitCode"),
+                         "health": health.get("Status"),
+                         "health_report": report if isinstance(report, dict) else None}}
+
+
+def container_health_options():
+    """Healthcheck и политика перезапуска для контейнеров ботов"""
+    options = {"restart": RESTART_POLICY or None}
+    if HEALTH_INTERVAL > 0:
+        # Старый образ без healthcheck.js считается здоровым
+        options["health"] = {
+            "command": f"test ! -f /app/healthcheck.js || node /app/healthcheck.js {HEARTBEAT_MAX_AGE}",
+            "interval": HEALTH_INTERVAL,
+            "timeout": HEALTH_TIMEOUT,
+            "retries": HEALTH_RETRIES,
+            # Пока бот входит в аккаунт, пульса еще нет
+            "start_period": START_TIMEOUT,
+        }
+    return options
+
+
+def lean_label():
+    """Метка режима браузера для новых контейнеров"""
+    return {LABEL_LEAN: "1" if LEAN_MODE else "0"}
+
+
+def lean_env():
+    """Окружение app.js для экономного режима (пустое в обычном)"""
+    return {"LEAN_MODE": "1"} if LEAN_MODE else {}
+
+
+def _parse_labels(value):
+    """Разбирает метки из вывода docker ps (k1=v1,k2=v2) в словарь"""
+    if isinstance(value, dict):
+        return value
+    labels = {}
+    for item in (value or "").split(","):
+        if item:
+            key, _, val = item.partition("=")
+            labels[key] = val
+    return labels
+
+
+class DockerBackend:
+    """Общая часть клиентов Docker: поток логов и массовые операции"""
+
+    def stop_many(self, container_ids, timeout=None):
+        """Останавливает контейнеры параллельно, возвращает {ID: ошибка}"""
+        errors = {}
+        if not container_ids:
+            return errors
+
+        def stop(container_id):
+            try:
+                self.stop(container_id, timeout)
+            except (DockerError, TimeoutError) as e:
+                errors[container_id] = str(e)
+
+        with ThreadPoolExecutor(max_workers=len(container_ids)) as pool:
+            list(pool.map(stop, container_ids))
+        return errors
+
+    def remove_many(self, container_ids, force=False):
+        """Удаляет контейнеры, возвращает {ID: ошибка}"""
+        errors = {}
+        for container_id in container_ids:
+            try:
+                self.remove(container_id, force)
+            except DockerError as e:
+                errors[container_id] = str(e)
+        return errors
+
+    def follow_logs(self, container_id, deadline=None, poll_interval=1.0, tail=None):
+        """Читает поток логов контейнера построчно до дедлайна
+
+        Отдает None каждые poll_interval секунд без новых строк, чтобы
+        вызывающий код мог сообщать о прогрессе.
+        """
+        stream, close = self._open_log_stream(container_id, tail)
+        lines = queue.Queue()
+
+        def reader():
+            try:
+                for line in stream:
+                    lines.put(line)
+            except (OSError, ValueError, http.client.HTTPException):
+                pass
+            lines.put(None)
+
+        threading.Thread(target=reader, daemon=True).start()
+        try:
+            while True:
+                wait = poll_interval
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    wait = min(poll_interval, remaining)
+                try:
+                    line = lines.get(timeout=wait)
+                except queue.Empty:
+                    yield None
+                    continue
+                if line is None:
+                    # Поток логов закрылся - контейнер завершился
+                    return
+                yield line
+        finally:
+            close()
+
+
+class DockerCLI(DockerBackend):
+    """Клиент Docker через утилиту docker (запасной вариант)
+
+    host - адрес демона для docker -H (например, ssh://user@server),
+    context - имя контекста docker.
+    """
+
+    name = "cli"
+
+    def __init__(self, host=None, context=None):
+        self.command = ["docker"]
+        if context:
+            self.command += ["--context", context]
+        elif host:
+            self.command += ["-H", host]
+
+    def _run(self, args, timeout=None):
+        try:
+            result = subprocess.run(self.command + args, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f"docker {args[0]}: таймаут")
+        except FileNotFoundError:
+            raise DockerError("docker не установлен")
+        if result.returncode != 0:
+            raise DockerError(result.stderr.strip() or f"docker {args[0]}: код {result.returncode}")
+        return result.stdout
+
+    def ping(self):
+        try:
+            self._run(["version", "--format", "{{.Server.Version}}"], timeout=10)
+            return True
+        except (DockerError, TimeoutError):
+            return False
+
+    @staticmethod
+    def _container_args(name, image, env=None, binds=None, labels=None, memory=None, cpus=None, health=None,
+                        restart=None):
+        args = ["--name", name]
+        for key, value in (env or {}).items():
+            args += ["-e", f"{key}={value}"]
+        for key, value in (labels or {}).items():
+            args += ["--label", f"{key}={value}"]
+        for bind in binds or []:
+            args += ["-v", bind]
+        if memory:
+            args += ["--memory", str(memory)]
+        if cpus:
+            args += ["--cpus", str(cpus)]
+        if health:
+            args += ["--health-cmd", health["command"],
+                     "--health-interval", f"{health['interval']}s",
+                     "--health-timeout", f"{health['timeout']}s",
+                     "--health-retries", str(health["retries"]),
+                     "--health-start-period", f"{health['start_period']}s"]
+        if restart:
+            args += ["--restart", restart]
+        if not is_registry_image(image):
+            # Иначе docker run пытается скачать локальный образ с Docker Hub
+            args += ["--pull", "never"]
+        return args + [image]
+
+    def run(self, name, image, timeout=None, **options):
+        return self._run(["run", "-d"] + self._container_args(name, image, **options), timeout=timeout).strip()
+
+    def create(self, name, image, timeout=None, **options):
+        return self._run(["create"] + self._container_args(name, image, **options), timeout=timeout).strip()
+
+    def start(self, container_id, timeout=None):
+        self._run(["start", container_id], timeout=timeout)
+
+    def rename(self, container_id, name):
+        self._run(["rename", container_id, name], timeout=30)
+
+    def image_id(self, image):
+        """ID локального образа или None, если образа нет"""
+        try:
+            return self._run(["image", "inspect", "--format", "{{.Id}}", image], timeout=30).strip() or None
+        except DockerError:
+            return None
+
+    def pull(self, image, timeout=None):
+        self._run(["pull", "-q", image], timeout=timeout or 600)
+
+    def info(self):
+        """Память (байты) и число CPU хоста Docker"""
+        info = json.loads(self._run(["info", "--format", "{{json .}}"], timeout=30))
+        return {"mem_total": info.get("MemTotal", 0), "cpus": info.get("NCPU", 1)}
+
+    def stats(self, container_ids):
+        """Снимает CPU (%) и память (байты) контейнеров одним вызовом docker stats"""
+        if not container_ids:
+            return {}
+        output = self._run(["stats", "--no-stream", "--no-trunc", "--format", "{{json .}}"] + list(container_ids),
+                           timeout=60)
+        stats = {}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            try:
+                stats[item["ID"]] = {
+                    "cpu": float(item["CPUPerc"].rstrip("%") or 0),
+                    "memory": parse_size(item["MemUsage"].split("/")[0]),
+                }
+            except (KeyError, ValueError):
+                continue
+        return stats
+
+    def inspect_many(self, container_ids):
+        """Время запуска и число перезапусков контейнеров одним вызовом docker inspect"""
+        if not container_ids:
+            return {}
+        output = self._run(["inspect", "--format", "{{json .}}"] + list(container_ids), timeout=60)
+        details = {}
+        for line in output.splitlines():
+            if line.strip():
+                details.update(_inspect_details(json.loads(line)))
+        return details
+
+    def logs(self, container_id, tail=None):
+        args = ["logs"]
+        if tail is not None:
+            args += ["--tail", str(tail)]
+        result = subprocess.run(self.command + args + [container_id],
+                                capture_output=True, text=True, encoding="utf-8", errors="replace")
+        return result.stdout + result.stderr
+
+    def _open_log_stream(self, container_id, tail=None):
+        args = self.command + ["logs", "-f"]
+        if tail is not None:
+            args += ["--tail", str(tail)]
+        process = subprocess.Popen(
+            args + [container_id],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+
+        def close():
+            process.kill()
+            process.wait()
+
+        return process.stdout, close
+
+    def _open_event_stream(self, filters=None):
+        """Поток docker events: (итератор событий-словарей, функция закрытия)"""
+        args = self.command + ["events", "--format", "{{json .}}"]
+        for key, values in (filters or {}).items():
+            for value in values:
+                args += ["--filter", f"{key}={value}"]
+        try:
+            process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                       encoding="utf-8", errors="replace")
+        except FileNotFoundError:
+            raise DockerError("docker не установлен")
+
+        def events():
+            for line in process.stdout:
+                if line.strip():
+                    yield json.loads(line)
+            if process.wait() > 0:
+                raise DockerError(f"docker events: код {process.returncode}")
+
+        def close():
+            process.kill()
+            process.wait()
+
+        return events(), close
+
+    def ps(self, all=True, filters=None):
+        args = ["ps", "--no-trunc", "--format", "{{json .}}"]
+        if all:
+            args.append("-a")
+        for key, values in (filters or {}).items():
+            for value in values:
+                args += ["-f", f"{key}={value}"]
+        containers = []
+        for line in self._run(args).splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            containers.append({
+                "id": item["ID"],
+                "image": item["Image"],
+                "name": item["Names"].split(",")[0],
+                "state": item.get("State", ""),
+                "status": item.get("Status", ""),
+                "labels": _parse_labels(item.get("Labels")),
+            })
+        return containers
+
+    def stop(self, container_id, timeout=None):
+        args = ["stop"]
+        if timeout is not None:
+            args += ["-t", str(timeout)]
+        self._run(args + [container_id])
+
+    def remove(self, container_id, force=False):
+        self._run(["rm"] + (["-f"] if force else []) + [container_id])
+
+    def exec(self, container_id, command, env=None, timeout=None):
+        args = ["exec"]
+        for key, value in (env or {}).items():
+            args += ["-e", f"{key}={value}"]
+        return self._run(args + [container_id] + list(command), timeout=timeout)
+
+    def _run_many(self, args, container_ids, timeout=None):
+        """Выполняет команду сразу для нескольких контейнеров, возвращает {ID: ошибка}"""
+        if not container_ids:
+            return {}
+        try:
+            result = subprocess.run(self.command + args + list(container_ids),
+                                    capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return {container_id: "таймаут" for container_id in container_ids}
+        # docker печатает в stdout ID каждого обработанного контейнера
+        done = set(result.stdout.split())
+        errors = {}
+        for container_id in container_ids:
+            if container_id not in done:
+                messages = [line for line in result.stderr.splitlines() if container_id in line]
+                errors[container_id] = messages[0] if messages else result.stderr.strip() or "ошибка"
+        return errors
+
+    def stop_many(self, container_ids, timeout=None):
+        # docker stop останавливает переданные контейнеры параллельно
+        args = ["stop"] + (["-t", str(timeout)] if timeout is not None else [])
+        return self._run_many(args, container_ids, timeout=(timeout or 10) + 60)
+
+    def remove_many(self, container_ids, force=False):
+        return self._run_many(["rm"] + (["-f"] if force else []), container_ids, timeout=120)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP-соединение поверх unix-сокета"""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerAPI(DockerBackend):
+    """Клиент Docker Engine API через unix-сокет с постоянным соединением
+
+    Каждый поток держит свое keep-alive соединение, поэтому параллельные
+    запуски не мешают друг другу и не открывают сокет на каждый вызов.
+    """
+
+    name = "api"
+
+    def __init__(self, socket_path=DOCKER_SOCKET, timeout=60, address=None):
+        self.socket_path = socket_path
+        # (хост, порт) для демона, слушающего tcp:// без TLS
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _new_connection(self, timeout):
+        if self.address:
+            return http.client.HTTPConnection(*self.address, timeout=timeout)
+        return UnixHTTPConnection(self.socket_path, timeout=timeout)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._new_connection(self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method, path, params=None, body=None, timeout=None, raw=False):
+        """Выполняет запрос; raw - вернуть тело ответа без разбора JSON"""
+        url = path + ("?" + urlencode(params) if params else "")
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        for attempt in range(2):
+            conn = self._connection()
+            conn.timeout = timeout or self.timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(conn.timeout)
+            try:
+                conn.request(method, url, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except socket.timeout:
+                conn.close()
+                raise TimeoutError(f"{method} {path}: таймаут")
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    ConnectionError, http.client.BadStatusLine):
+                # Демон закрыл keep-alive соединение - переподключаемся один раз
+                conn.close()
+                if attempt:
+                    raise DockerError(f"{method} {path}: соединение с Docker потеряно")
+            except OSError as e:
+                conn.close()
+                raise DockerError(f"{method} {path}: {e}")
+
+        if response.status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode("utf-8", "replace")
+            raise DockerError(f"{response.status}: {message}")
+        if not raw and response.getheader("Content-Type", "").startswith("application/json") and data:
+            return json.loads(data)
+        return data
+
+    def ping(self):
+        try:
+            return self._request("GET", "/_ping", timeout=5) == b"OK"
+        except (DockerError, TimeoutError):
+            return False
+
+    def pull(self, image, timeout=None):
+        name, tag, digest = split_image(image)
+        data = self._request("POST", "/images/create", {"fromImage": name, "tag": digest or tag or "latest"},
+                             timeout=timeout or 600, raw=True)
+        # Ответ - поток JSON-строк о прогрессе; ошибка скачивания приходит в нем же, уже со статусом 200
+        for line in data.splitlines():
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(message, dict) and message.get("error"):
+                raise DockerError(f"{image}: {message['error']}")
+
+    def _create(self, name, image, body, timeout=None):
+        params = {"name": name} if name else None
+        try:
+            return self._request("POST", "/containers/create", params, body, timeout)["Id"]
+        except DockerError as e:
+            if not str(e).startswith("404"):
+                raise
+        if not is_registry_image(image):
+            raise DockerError(f"404: образ {image} не найден - соберите его: docker build -t {image} .")
+        # Как и docker run, скачиваем отсутствующий образ
+        self.pull(image)
+        return self._request("POST", "/containers/create", params, body, timeout)["Id"]
+
+    def info(self):
+        """Память (байты) и число CPU хоста Docker"""
+        info = self._request("GET", "/info", timeout=30)
+        return {"mem_total": info.get("MemTotal", 0), "cpus": info.get("NCPU", 1)}
+
+    def image_id(self, image):
+        """ID локального образа или None, если образа нет"""
+        try:
+            return self._request("GET", f"/images/{quote(image, safe='/:')}/json", timeout=30)["Id"]
+        except DockerError:
+            return None
+
+    def create(self, name, image, env=None, binds=None, labels=None, memory=None, cpus=None, health=None,
+               restart=None, timeout=None):
+        body = {
+            "Image": image,
+            "Env": [f"{key}={value}" for key, value in (env or {}).items()],
+            "Labels": dict(labels or {}),
+            "HostConfig": {"Binds": list(binds or [])},
+        }
+        if memory:
+            body["HostConfig"]["Memory"] = parse_size(memory)
+        if cpus:
+            body["HostConfig"]["NanoCpus"] = int(float(cpus) * 1e9)
+        if health:
+            body["Healthcheck"] = {
+                "Test": ["CMD-SHELL", health["command"]],
+                "Interval": health["interval"] * 10**9,
+                "Timeout": health["timeout"] * 10**9,
+                "Retries": health["retries"],
+                "StartPeriod": health["start_period"] * 10**9,
+            }
+        if restart:
+            policy, _, retries = restart.partition(":")
+            body["HostConfig"]["RestartPolicy"] = {"Name": policy, "MaximumRetryCount": int(retries or 0)}
+        return self._create(name, image, body, timeout)
+
+    def start(self, container_id, timeout=None):
+        self._request("POST", f"/containers/{quote(container_id)}/start", timeout=timeout)
+
+    def run(self, name, image, timeout=None, **options):
+        container_id = self.create(name, image, timeout=timeout, **options)
+        self.start(container_id, timeout=timeout)
+        return container_id
+
+    def rename(self, container_id, name):
+        self._request("POST", f"/containers/{quote(container_id)}/rename", {"name": name}, timeout=30)
+
+    def stats(self, container_ids):
+        """Снимает CPU (%) и память (байты) контейнеров параллельными запросами"""
+        def sample(container_id):
+            try:
+                data = self._request("GET", f"/containers/{quote(container_id)}/stats", {"stream": 0})
+            except (DockerError, TimeoutError):
+                return container_id, None
+            cpu, precpu = data.get("cpu_stats", {}), data.get("precpu_stats", {})
+            cpu_delta = cpu.get("cpu_usage", {}).get("total_usage", 0) - precpu.get("cpu_usage", {}).get("total_usage", 0)
+            system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+            online = cpu.get("online_cpus") or len(cpu.get("cpu_usage", {}).get("percpu_usage") or [1])
+            memory = data.get("memory_stats", {})
+            # Как и docker stats, не учитываем страничный кэш
+            cache = memory.get("stats", {}).get("inactive_file", memory.get("stats", {}).get("cache", 0))
+            return container_id, {
+                "cpu": cpu_delta / system_delta * online * 100 if system_delta > 0 else 0.0,
+                "memory": max(memory.get("usage", 0) - cache, 0),
+            }
+
+        if not container_ids:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(len(container_ids), 32)) as pool:
+            return {container_id: value for container_id, value in pool.map(sample, container_ids) if value}
+
+    def inspect_many(self, container_ids):
+        """Время запуска и число перезапусков контейнеров параллельными запросами"""
+        def inspect(container_id):
+            try:
+                return self._request("GET", f"/containers/{quote(container_id)}/json")
+            except (DockerError, TimeoutError):
+                # Контейнер мог исчезнуть после docker ps
+                return None
+
+        if not container_ids:
+            return {}
+        details = {}
+        with ThreadPoolExecutor(max_workers=min(len(container_ids), 32)) as pool:
+            for item in pool.map(inspect, container_ids):
+                if item:
+                    details.update(_inspect_details(item))
+        return details
+
+    def logs(self, container_id, tail=None):
+        params = {"stdout": 1, "stderr": 1}
+        if tail is not None:
+            params["tail"] = tail
+        raw = self._request("GET", f"/containers/{quote(container_id)}/logs", params)
+        return "".join(chunk.decode("utf-8", "replace") for _, chunk in _demux_frames(raw))
+
+    def _open_log_stream(self, container_id, tail=None):
+        # Для потока нужно отдельное соединение: ответ читается до конца жизни контейнера
+        conn = self._new_connection(None)
+        params = {"follow": 1, "stdout": 1, "stderr": 1}
+        if tail is not None:
+            params["tail"] = tail
+        try:
+            conn.request("GET", f"/containers/{quote(container_id)}/logs?{urlencode(params)}")
+            response = conn.getresponse()
+        except OSError as e:
+            conn.close()
+            raise DockerError(f"logs {container_id}: {e}")
+        if response.status >= 400:
+            conn.close()
+            raise DockerError(f"logs {container_id}: {response.status}")
+
+        def lines():
+            buffer = b""
+            for _, chunk in _demux_frames(response):
+                buffer += chunk
+                *complete, buffer = buffer.split(b"\n")
+                for line in complete:
+                    yield line.decode("utf-8", "replace") + "\n"
+            if buffer:
+                yield buffer.decode("utf-8", "replace")
+
+        def close():
+            try:
+                conn.sock and conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+        return lines(), close
+
+    def _open_event_stream(self, filters=None):
+        """Поток /events: (итератор событий-словарей, функция закрытия)"""
+        conn = self._new_connection(None)
+        params = {"filters": json.dumps(filters)} if filters else {}
+        try:
+            conn.request("GET", f"/events?{urlencode(params)}")
+            response = conn.getresponse()
+        except OSError as e:
+            conn.close()
+            raise DockerError(f"events: {e}")
+        if response.status >= 400:
+            conn.close()
+            raise DockerError(f"events: {response.status}")
+
+        def events():
+            # События идут JSON-объектами по одному на строку
+            for line in iter(response.readline, b""):
+                if line.strip():
+                    yield json.loads(line)
+
+        def close():
+            try:
+                conn.sock and conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+        return events(), close
+
+    def ps(self, all=True, filters=None):
+        params = {"all": 1 if all else 0}
+        if filters:
+            params["filters"] = json.dumps(filters)
+        return [{
+            "id": item["Id"],
+            "image": item["Image"],
+            "name": item["Names"][0].lstrip("/") if item.get("Names") else "",
+            "state": item.get("State", ""),
+            "status": item.get("Status", ""),
+            "labels": item.get("Labels") or {},
+        } for item in self._request("GET", "/containers/json", params)]
+
+    def stop(self, container_id, timeout=None):
+        params = {"t": timeout} if timeout is not None else None
+        # Ждем дольше, чем длится grace-период остановки
+        self._request("POST", f"/containers/{quote(container_id)}/stop", params,
+                      timeout=(timeout if timeout is not None else 10) + self.timeout)
+
+    def remove(self, container_id, force=False):
+        self._request("DELETE", f"/containers/{quote(container_id)}", {"force": 1 if force else 0})
+
+    def exec(self, container_id, command, env=None, timeout=None):
+        body = {
+            "Cmd": list(command),
+            "Env": [f"{key}={value}" for key, value in (env or {}).items()],
+            "AttachStdout": True,
+            "AttachStderr": True,
+        }
+        exec_id = self._request("POST", f"/containers/{quote(container_id)}/exec", body=body, timeout=timeout)["Id"]
+        raw = self._request("POST", f"/exec/{exec_id}/start", body={"Detach": False, "Tty": False}, timeout=timeout)
+        output = "".join(chunk.decode("utf-8", "replace") for _, chunk in _demux_frames(raw))
+        exit_code = self._request("GET", f"/exec/{exec_id}/json").get("ExitCode")
+        if exit_code:
+            raise DockerError(f"exec {' '.join(command)}: код {exit_code}: {output.strip()}")
+        return output
+
+
+def _demux_frames(source):
+    """Разбирает мультиплексированный поток логов Docker на (поток, данные)
+
+    Принимает bytes или объект с методом read(). Если поток не
+    мультиплексирован (контейнер с TTY), отдает его целиком как stdout.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    header = source.read(8)
+    if len(header) == 8 and header[0] in (0, 1, 2) and header[1:4] == b"\x00\x00\x00":
+        while len(header) == 8:
+            size = int.from_bytes(header[4:], "big")
+            payload = source.read(size)
+            yield header[0], payload
+            header = source.read(8)
+        return
+    while header:
+        yield 1, header
+        header = source.read1(65536) if hasattr(source, "read1") else source.read(65536)
+
+
+def get_docker_client(endpoint=None):
+    """Выбирает клиент Docker: API через сокет или docker CLI
+
+    endpoint - адрес демона: unix:///путь, tcp://хост:порт, ssh://... или
+    context:имя. Без него используется локальный демон.
+    """
+    if endpoint is None:
+        if DOCKER_BACKEND != "cli" and not os.environ.get("DOCKER_HOST"):
+            if os.path.exists(DOCKER_SOCKET):
+                api = DockerAPI(DOCKER_SOCKET)
+                if DOCKER_BACKEND == "api" or api.ping():
+                    return api
+        return DockerCLI()
+
+    if endpoint.startswith("context:"):
+        return DockerCLI(context=endpoint[len("context:"):])
+    if DOCKER_BACKEND != "cli":
+        if endpoint.startswith("unix://"):
+            return DockerAPI(endpoint[len("unix://"):])
+        if endpoint.startswith("tcp://"):
+            address = urlsplit(endpoint)
+            return DockerAPI(address=(address.hostname, address.port or 2375))
+    return DockerCLI(host=endpoint)
+
+
+def parse_docker_hosts(spec):
+    """Разбирает список хостов "имя=адрес,адрес2" в [(имя, адрес)]"""
+    hosts = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, endpoint = item.partition("=") if "=" in item.split("://")[0] else ("", "", item)
+        if not name:
+            address = urlsplit(endpoint)
+            name = address.hostname or os.path.basename(address.path) or endpoint.split(":", 1)[-1]
+        hosts.append((name, endpoint))
+    return hosts
+
+class ProxyChecker:
+    """Проверяет socks5-прокси прямо из менеджера, без контейнеров alpine/curl
+
+    Прокси проверяются параллельно в одном event loop: через каждый
+    устанавливается туннель, по нему делается запрос к PROXY_CHECK_URL,
+    замеряется задержка и внешний IP. Успешные результаты кэшируются в
+    файле на PROXY_CHECK_TTL секунд (ключ - хэш строки прокси).
+    """
+
+    def __init__(self, url=PROXY_CHECK_URL, timeout=PROXY_CHECK_TIMEOUT, ttl=PROXY_CHECK_TTL,
+                 concurrency=PROXY_CHECK_CONCURRENCY, cache_file='proxy_cache.json'):
+        self.url = urlsplit(url)
+        self.timeout = timeout
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._cache = None
+        # Один TLS-контекст на все проверки: сертификаты загружаются один раз, при первой проверке
+        self._ssl = None
+
+    def check(self, proxy, use_cache=True):
+        return self.check_many([proxy], use_cache)[proxy]
+
+    def check_many(self, proxies, use_cache=True):
+        """Проверяет прокси параллельно, возвращает {прокси: результат}
+
+        Результат - словарь с ключами ok, latency, ip, error, checked_at
+        и cached (результат взят из кэша).
+        """
+        return asyncio.run(self.check_many_async(proxies, use_cache))
+
+    async def check_many_async(self, proxies, use_cache=True):
+        """То же, что check_many, внутри уже работающего цикла событий"""
+        if self._ssl is None and self.url.scheme == "https":
+            self._ssl = ssl.create_default_context()
+        results = {}
+        pending = []
+        for proxy in dict.fromkeys(proxies):
+            cached = self._cached(proxy) if use_cache else None
+            if cached:
+                results[proxy] = dict(cached, cached=True)
+            else:
+                pending.append(proxy)
+        if pending:
+            checked = await self._check_all(pending)
+            for proxy, result in checked.items():
+                results[proxy] = dict(result, cached=False)
+            self._remember(checked)
+        return results
+
+    async def _check_all(self, proxies):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(proxy):
+            async with semaphore:
+                return proxy, await self._check_one(proxy)
+
+        return dict(await asyncio.gather(*(limited(proxy) for proxy in proxies)))
+
+    async def _check_one(self, proxy):
+        started = time.monotonic()
+        result = {"ok": False, "latency": None, "ip": None, "error": None, "checked_at": time.time()}
+        try:
+            body = await asyncio.wait_for(self._fetch(proxy), self.timeout)
+            result["latency"] = round(time.monotonic() - started, 3)
+            try:
+                result["ip"] = json.loads(body).get("ip")
+            except (ValueError, AttributeError):
+                result["ip"] = body.strip()[:64]
+            result["ok"] = True
+        except asyncio.TimeoutError:
+            result["error"] = f"таймаут {self.timeout:g} сек"
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            result["error"] = str(e) or e.__class__.__name__
+        return result
+
+    async def _fetch(self, proxy):
+        """Открывает туннель через socks5-прокси и выполняет GET-запрос"""
+        parts = urlsplit(proxy)
+        if parts.scheme not in ("socks5", "socks5h"):
+            raise ValueError(f"неподдерживаемая схема прокси: {parts.scheme}")
+        host = self.url.hostname
+        port = self.url.port or (443 if self.url.scheme == "https" else 80)
+
+        loop = asyncio.get_running_loop()
+        family, kind, proto, _, address = (await loop.getaddrinfo(
+            parts.hostname, parts.port, type=socket.SOCK_STREAM))[0]
+        sock = socket.socket(family, kind, proto)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, address)
+            await self._socks5_handshake(loop, sock, parts.username, parts.password, host, port)
+            reader, writer = await asyncio.open_connection(
+                sock=sock, ssl=self._ssl, server_hostname=host if self._ssl else None)
+        except BaseException:
+            sock.close()
+            raise
+
+        try:
+            path = self.url.path or "/"
+            if self.url.query:
+                path += "?" + self.url.query
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: bot-manager\r\n"
+                         f"Connection: close\r\n\r\n".encode("ascii"))
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+
+        head, _, body = response.partition(b"\r\n\r\n")
+        status_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+        if len(status_line.split()) < 2 or status_line.split()[1] != "200":
+            raise ValueError(f"ответ {status_line or 'пустой'}")
+        if b"transfer-encoding: chunked" in head.lower():
+            body = _unchunk(body)
+        return body.decode("utf-8", "replace")
+
+    async def _socks5_handshake(self, loop, sock, username, password, host, port):
+        async def recv_exactly(size):
+            data = b""
+            while len(data) < size:
+                chunk = await loop.sock_recv(sock, size - len(data))
+                if not chunk:
+                    raise ConnectionError("прокси закрыл соединение")
+                data += chunk
+            return data
+
+        methods = b"\x00\x02" if username else b"\x00"
+        await loop.sock_sendall(sock, b"\x05" + bytes([len(methods)]) + methods)
+        version, method = await recv_exactly(2)
+        if version != 5 or method == 0xFF:
+            raise ConnectionError("прокси не принял способ авторизации")
+        if method == 2:
+            user = (username or "").encode("utf-8")
+            secret = (password or "").encode("utf-8")
+            await loop.sock_sendall(sock, b"\x01" + bytes([len(user)]) + user + bytes([len(secret)]) + secret)
+            if (await recv_exactly(2))[1] != 0:
+                raise ConnectionError("неверный логин или пароль прокси")
+
+        target = host.encode("idna")
+        await loop.sock_sendall(sock, b"\x05\x01\x00\x03" + bytes([len(target)]) + target + port.to_bytes(2, "big"))
+        reply = await recv_exactly(4)
+        if reply[1] != 0:
+            raise ConnectionError(f"прокси отклонил соединение (код {reply[1]})")
+        # Пропускаем адрес, к которому привязался прокси
+        if reply[3] == 1:
+            await recv_exactly(4 + 2)
+        elif reply[3] == 4:
+            await recv_exactly(16 + 2)
+        else:
+            await recv_exactly((await recv_exactly(1))[0] + 2)
+
+    def _key(self, proxy):
+        return hashlib.sha256(f"{self.url.geturl()} {proxy}".encode("utf-8")).hexdigest()
+
+    def _load_cache(self):
+        if self._cache is None:
+            try:
+                with open(self.cache_file, 'r') as f:
+                    self._cache = json.load(f)
+            except (OSError, ValueError):
+                self._cache = {}
+        return self._cache
+
+    def _cached(self, proxy):
+        with self._lock:
+            result = self._load_cache().get(self._key(proxy))
+        if result and time.time() - result["checked_at"] < self.ttl:
+            return result
+        return None
+
+    def _remember(self, results):
+        with self._lock:
+            cache = self._load_cache()
+            now = time.time()
+            for key in [key for key, result in cache.items() if now - result["checked_at"] >= self.ttl]:
+                del cache[key]
+            for proxy, result in results.items():
+                # Неудачные проверки не кэшируем, чтобы исправленный прокси проверился заново
+                if result["ok"]:
+                    cache[self._key(proxy)] = result
+            tmp_path = f"{self.cache_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.cache_file)
+
+
+def _unchunk(body):
+    """Собирает тело HTTP-ответа с Transfer-Encoding: chunked"""
+    result = b""
+    while body:
+        size_line, _, body = body.partition(b"\r\n")
+        size = int(size_line.split(b";")[0] or b"0", 16)
+        if not size:
+            break
+        result += body[:size]
+        body = body[size + 2:]
+    return result
+
+
+def spec_hash(email, password, proxy):
+    """Хэш желаемого состояния бота: по нему apply понимает, что запись изменилась"""
+    payload = json.dumps([email, password, proxy], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def read_manifest(path):
+    """Построчно читает манифест ботов (CSV с заголовком или JSONL)
+
+    Каждая запись - словарь с полями bot_id, email, password, proxy;
+    вместо строки JSONL, которая не разбирается или не является объектом, - None.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.endswith((".jsonl", ".json")):
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield record if isinstance(record, dict) else None
+        else:
+            for row in csv.DictReader(f):
+                yield row
+
+
+def check_bot_record(bot_id, bot):
+    """Проверяет запись бота перед сохранением; ValueError, если ее нельзя вывести или запустить
+
+    Записи проверяются при изменении, а не при каждом старте менеджера.
+    """
+    if not isinstance(bot_id, str) or not bot_id:
+        raise ValueError(f"неверный ID бота: {bot_id!r}")
+    if not isinstance(bot, dict):
+        raise ValueError(f"запись бота {bot_id} - не словарь")
+    for field in ("email", "proxy_file"):
+        if not isinstance(bot.get(field), str):
+            raise ValueError(f"у бота {bot_id} нет поля {field}")
+
+
+class JSONBotStore(MutableMapping):
+    """Боты в bot_config.json: изменения пишутся в файл целиком при commit()
+
+    Запись атомарная - через временный файл и os.replace, поэтому сбой
+    посреди сохранения не портит конфигурацию.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self._dirty = False
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self._data = json.load(f)
+        else:
+            self._data = {}
+        self._data.setdefault("bots", {})
+        self._bots = self._data["bots"]
+
+    def __getitem__(self, bot_id):
+        return self._bots[bot_id]
+
+    def __setitem__(self, bot_id, bot):
+        check_bot_record(bot_id, bot)
+        with self._lock:
+            self._bots[bot_id] = bot
+            self._dirty = True
+
+    def __delitem__(self, bot_id):
+        with self._lock:
+            del self._bots[bot_id]
+            self._dirty = True
+
+    def __iter__(self):
+        return iter(list(self._bots))
+
+    def __len__(self):
+        return len(self._bots)
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+            self.commit()
+
+    def commit(self):
+        with self._lock:
+            if not self._dirty or self._batch_depth:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def close(self):
+        self.commit()
+
+
+class SQLiteBotStore(MutableMapping):
+    """Боты в SQLite (WAL): каждая запись - отдельная строка
+
+    Добавление, изменение и удаление бота затрагивают одну строку и
+    сразу фиксируются; внутри batch() изменения копятся в одной транзакции.
+    База создается (и bot_config.json переносится в нее) только при первой
+    записи: до этого боты читаются из bot_config.json, а запуск менеджера
+    ничего не пишет на диск.
+    """
+
+    def __init__(self, path, legacy_json=None, echo=print):
+        self.path = path
+        self.legacy_json = legacy_json
+        self.echo = echo
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self._db = None
+        self._writable = False
+        # Боты из bot_config.json, пока база не создана
+        self._legacy = None
+
+    def _connect(self, write=False):
+        """Соединение с базой; без write - None, если базы еще нет"""
+        with self._lock:
+            if self._db is None:
+                if not write and not os.path.exists(self.path):
+                    return None
+                is_new = not os.path.exists(self.path)
+                self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                if is_new:
+                    self._prepare()
+                    if self.legacy_json and os.path.exists(self.legacy_json):
+                        self._migrate(self.legacy_json)
+            elif write and not self._writable:
+                self._prepare()
+            return self._db
+
+    def _prepare(self):
+        # Режим WAL сохраняется в самом файле базы
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS bots (bot_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self._writable = True
+
+    def _legacy_bots(self):
+        """Боты из bot_config.json (только корректные записи - как при переносе)"""
+        if self._legacy is None:
+            bots = {}
+            if self.legacy_json and os.path.exists(self.legacy_json):
+                with open(self.legacy_json, 'r') as f:
+                    for bot_id, bot in json.load(f).get("bots", {}).items():
+                        try:
+                            check_bot_record(bot_id, bot)
+                        except ValueError:
+                            continue
+                        bots[bot_id] = bot
+            self._legacy = bots
+        return self._legacy
+
+    def _migrate(self, json_path):
+        """Однократно переносит ботов из bot_config.json"""
+        with open(json_path, 'r') as f:
+            bots = json.load(f).get("bots", {})
+        skipped = []
+        with self.batch():
+            for bot_id, bot in bots.items():
+                try:
+                    self[bot_id] = bot
+                except ValueError:
+                    skipped.append(bot_id)
+        os.replace(json_path, f"{json_path}.migrated")
+        self._legacy = None
+        self.echo(f"Конфигурация {len(bots) - len(skipped)} ботов перенесена из {json_path} в {self.path}")
+        if skipped:
+            self.echo(f"Пропущены проблемные записи: {len(skipped)} (остались в {json_path}.migrated)")
+
+    def _execute(self, sql, params=(), write=False):
+        """Результат запроса; None, если базы еще нет и запрос только читает"""
+        with self._lock:
+            db = self._connect(write)
+            if db is None:
+                return None
+            return db.execute(sql, params).fetchall()
+
+    def __getitem__(self, bot_id):
+        rows = self._execute("SELECT data FROM bots WHERE bot_id = ?", (bot_id,))
+        if rows is None:
+            return copy.deepcopy(self._legacy_bots()[bot_id])
+        if not rows:
+            raise KeyError(bot_id)
+        return json.loads(rows[0][0])
+
+    def __setitem__(self, bot_id, bot):
+        check_bot_record(bot_id, bot)
+        self._execute("INSERT OR REPLACE INTO bots (bot_id, data) VALUES (?, ?)", (bot_id, json.dumps(bot)),
+                      write=True)
+
+    def __delitem__(self, bot_id):
+        with self._lock:
+            if self._connect(write=True).execute("DELETE FROM bots WHERE bot_id = ?", (bot_id,)).rowcount == 0:
+                raise KeyError(bot_id)
+
+    def __contains__(self, bot_id):
+        rows = self._execute("SELECT 1 FROM bots WHERE bot_id = ?", (bot_id,))
+        return bot_id in self._legacy_bots() if rows is None else bool(rows)
+
+    def __iter__(self):
+        rows = self._execute("SELECT bot_id FROM bots ORDER BY rowid")
+        return iter(list(self._legacy_bots()) if rows is None else [row[0] for row in rows])
+
+    def __len__(self):
+        rows = self._execute("SELECT COUNT(*) FROM bots")
+        return len(self._legacy_bots()) if rows is None else rows[0][0]
+
+    def items(self):
+        rows = self._execute("SELECT bot_id, data FROM bots ORDER BY rowid")
+        if rows is None:
+            return list(copy.deepcopy(self._legacy_bots()).items())
+        return [(bot_id, json.loads(data)) for bot_id, data in rows]
+
+    def values(self):
+        return [bot for _, bot in self.items()]
+
+    @contextmanager
+    def batch(self):
+        """Объединяет изменения в одну транзакцию"""
+        with self._lock:
+            if not self._batch_depth:
+                self._connect(write=True).execute("BEGIN")
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self._db.execute("ROLLBACK")
+                raise
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._db.execute("COMMIT")
+
+    def commit(self):
+        # Изменения вне batch() фиксируются сразу
+        pass
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+                self._writable = False
+
+
+def open_config_store(config_file, echo=print):
+    """Открывает хранилище ботов, выбранное через BOT_CONFIG_STORE"""
+    if CONFIG_STORE == "json":
+        return JSONBotStore(config_file)
+    return SQLiteBotStore(os.path.splitext(config_file)[0] + ".db", legacy_json=config_file, echo=echo)
+
+
+def split_image(image):
+    """Делит ссылку на образ на имя, тег и digest: registry:5000/org/img:1.0@sha256:..."""
+    image, _, digest = image.partition("@")
+    name, sep, tag = image.rpartition(":")
+    # Двоеточие до последнего "/" отделяет порт реестра, а не тег
+    if not sep or "/" in tag:
+        name, tag = image, ""
+    return name, tag, digest
+
+
+def is_registry_image(image):
+    """Образ из реестра, а не собранный локально (с тегом LOCAL_IMAGE_TAG) - его можно скачать"""
+    _, tag, digest = split_image(image)
+    return bool(digest) or tag != LOCAL_IMAGE_TAG
+
+
+def read_host_resources():
+    """Возвращает память (байты) и число CPU хоста или None, если /proc недоступен"""
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            meminfo = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in f}
+    except (OSError, ValueError, IndexError):
+        return None
+    return {
+        "mem_total": meminfo.get("MemTotal", 0),
+        "mem_available": meminfo.get("MemAvailable", meminfo.get("MemFree", 0)),
+        "cpus": os.cpu_count() or 1,
+    }
+
+
+class ResourceMonitor:
+    """Замеры CPU/памяти ботов и оценка, сколько еще ботов поместится на хост
+
+    Все контейнеры ботов хоста замеряются одним вызовом docker stats не
+    чаще раза в RESOURCE_SAMPLE_TTL секунд; по каждому боту хранится
+    скользящее окно из RESOURCE_WINDOW замеров. Запуски, которые еще идут,
+    резервируют ресурсы заранее, чтобы параллельный запуск не перебрал память.
+    """
+
+    def __init__(self, manager, host):
+        self.manager = manager
+        self.host = host
+        self._lock = threading.Lock()
+        self._samples = {}
+        # bot_id -> работает ли бот в экономном режиме браузера (метка LABEL_LEAN)
+        self._lean = {}
+        self._sampled_at = 0
+        self._pending = 0
+        # Запуски, завершенные после последнего замера: их контейнеров еще нет в замере,
+        # поэтому до следующего docker stats они учитываются как резерв
+        self._unsampled = 0
+
+    def sample(self, force=False):
+        if not force and time.monotonic() - self._sampled_at < RESOURCE_SAMPLE_TTL:
+            return
+        self._sampled_at = time.monotonic()
+        with self._lock:
+            unsampled = self._unsampled
+        # В контейнере-паке несколько ботов: его потребление делится между ними поровну
+        running = {}
+        lean = {}
+        for bot_id, container in self.manager.container_states(hosts=[self.host.name]).items():
+            if container["state"] == "running":
+                running.setdefault(container["id"], []).append(bot_id)
+                lean[bot_id] = container["labels"].get(LABEL_LEAN) == "1"
+        try:
+            stats = self.host.docker.stats(list(running))
+        except (DockerError, TimeoutError) as e:
+            self.manager.echo(f"Не удалось получить docker stats: {e}")
+            return
+        with self._lock:
+            for container_id, values in stats.items():
+                # docker stats может вернуть укороченный ID
+                bot_ids = running.get(container_id) or next(
+                    (bots for cid, bots in running.items() if cid.startswith(container_id)), [])
+                for bot_id in bot_ids:
+                    window = self._samples.setdefault(bot_id, deque(maxlen=RESOURCE_WINDOW))
+                    window.append((values["cpu"] / len(bot_ids), values["memory"] / len(bot_ids)))
+            alive = {bot_id for bot_ids in running.values() for bot_id in bot_ids}
+            for bot_id in [bot_id for bot_id in self._samples if bot_id not in alive]:
+                del self._samples[bot_id]
+            # Запуски, завершенные во время замера, остаются в резерве до следующего
+            self._unsampled = max(self._unsampled - unsampled, 0)
+            self._lean = lean
+
+    def per_bot(self):
+        """Средние CPU (%) и память (байты) по каждому боту за окно"""
+        with self._lock:
+            return {
+                bot_id: (sum(cpu for cpu, _ in window) / len(window), sum(mem for _, mem in window) / len(window))
+                for bot_id, window in self._samples.items() if window
+            }
+
+    def is_lean(self, bot_id):
+        return self._lean.get(bot_id, False)
+
+    def per_mode(self):
+        """Средняя память на бота по режимам браузера: {"lean"/"full": (число ботов, байты)}"""
+        modes = {}
+        for bot_id, (_, memory) in self.per_bot().items():
+            mode = "lean" if self.is_lean(bot_id) else "full"
+            count, total = modes.get(mode, (0, 0))
+            modes[mode] = (count + 1, total + memory)
+        return {mode: (count, total / count) for mode, (count, total) in modes.items()}
+
+    def plan(self):
+        """Оценка емкости хоста: сколько еще ботов можно запустить"""
+        host = self.host.host_resources()
+        if host is None:
+            return None
+        usage = self.per_bot()
+        if "mem_available" not in host:
+            # У удаленного хоста свободную память оцениваем по потреблению его ботов
+            host["mem_available"] = host["mem_total"] - sum(mem for _, mem in usage.values())
+        if usage:
+            bot_cpu = sum(cpu for cpu, _ in usage.values()) / len(usage)
+            bot_memory = sorted(mem for _, mem in usage.values())[len(usage) // 2]
+        else:
+            bot_cpu, bot_memory = EXPECTED_BOT_CPU, parse_size(EXPECTED_BOT_MEMORY)
+        if BOT_MEMORY_LIMIT:
+            bot_memory = max(bot_memory, parse_size(BOT_MEMORY_LIMIT))
+        bot_memory = max(bot_memory, 1)
+        bot_cpu = max(bot_cpu, 0.1)
+
+        with self._lock:
+            pending = self._pending + self._unsampled
+        free_memory = host["mem_available"] - host["mem_total"] * MEMORY_HEADROOM - pending * bot_memory
+        cpu_capacity = host["cpus"] * 100 * (1 - CPU_HEADROOM)
+        free_cpu = cpu_capacity - sum(cpu for cpu, _ in usage.values()) - pending * bot_cpu
+        fit_memory = max(math.floor(free_memory / bot_memory), 0)
+        fit_cpu = max(math.floor(free_cpu / bot_cpu), 0)
+        return dict(host, running=len(usage), pending=pending, bot_memory=bot_memory, bot_cpu=bot_cpu,
+                    fit_memory=fit_memory, fit_cpu=fit_cpu, fits=min(fit_memory, fit_cpu))
+
+    def acquire(self, deadline=None, count=1):
+        """Резервирует место под запуск count ботов; с deadline ждет освобождения ресурсов"""
+        while True:
+            try:
+                self.sample()
+            except (DockerError, TimeoutError):
+                pass
+            plan = self.plan()
+            with self._lock:
+                if plan is None or plan["fits"] >= count:
+                    self._pending += count
+                    return True
+            if deadline is None or time.monotonic() + 5 >= deadline:
+                return False
+            time.sleep(5)
+
+    def release(self, count=1):
+        # Новый docker stats не нужен: запущенный бот остается в резерве до планового замера
+        # (RESOURCE_SAMPLE_TTL), иначе каждый запуск замерял бы весь парк заново
+        with self._lock:
+            released = min(count, self._pending)
+            self._pending -= released
+            self._unsampled += released
+
+
+class ImageWarmer:
+    """Проверка и скачивание образа бота в фоне
+
+    Если образа нет, запуск ботов ждет окончания скачивания, но не тратит
+    на него свой таймаут готовности. Если образ есть, запуск не ждет, а
+    образ обновляется в фоне не чаще раза в IMAGE_REFRESH секунд.
+    Локально собранный образ (с тегом :local) не скачивается.
+    """
+
+    def __init__(self, docker, image=BOT_IMAGE, refresh=IMAGE_REFRESH, state_file=IMAGE_STATE_FILE, host=None,
+                 echo=print):
+        self.docker = docker
+        self.echo = echo
+        self.image = image
+        # Время скачивания хранится отдельно для каждого удаленного хоста
+        self.key = f"{host}/{image}" if host else image
+        self.refresh = refresh
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._thread = None
+        self._checked_at = None
+        self._ready = threading.Event()
+
+    def start(self):
+        """Запускает проверку образа, если она еще не шла или пора обновить образ"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            if self._checked_at is not None and (
+                    self.refresh <= 0 or time.monotonic() - self._checked_at < self.refresh):
+                return
+            self._checked_at = time.monotonic()
+            self._thread = threading.Thread(target=self._warm, daemon=True)
+            self._thread.start()
+
+    def wait(self):
+        """Ждет, пока образ появится локально (или скачать его не удастся)"""
+        self.start()
+        self._ready.wait()
+
+    def _last_pull(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f).get(self.key, 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _save_pull(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state[self.key] = time.time()
+        with open(self.state_file, 'w') as f:
+            json.dump(state, f)
+
+    def _warm(self):
+        present = None
+        try:
+            present = self.docker.image_id(self.image)
+            if present:
+                self._ready.set()
+                if (self.refresh <= 0 or not is_registry_image(self.image)
+                        or time.time() - self._last_pull() < self.refresh):
+                    return
+            elif not is_registry_image(self.image):
+                self.echo(f"Образ {self.image} не найден - соберите его: docker build -t {self.image} .")
+                return
+            self.echo(f"{'Обновление' if present else 'Скачивание'} образа {self.image}...")
+            started = time.monotonic()
+            self.docker.pull(self.image)
+            self._save_pull()
+            self.echo(f"Образ {self.image} готов ({time.monotonic() - started:.1f} сек)")
+        except (DockerError, TimeoutError) as e:
+            self.echo(f"Не удалось {'обновить' if present else 'скачать'} образ {self.image}: {e}")
+        finally:
+            self._ready.set()
+
+
+class ExtensionCache:
+    """Общий для всех контейнеров кэш расширения app.crx
+
+    Файл лежит под именем с хэшем содержимого, extension.json указывает на
+    текущий файл и его sha256 и заменяется атомарно, так что контейнер
+    никогда не увидит недописанный файл. Скачанный файл, совпавший по хэшу
+    с текущим, не переписывается - обновляется только время проверки.
+    """
+
+    MANIFEST = "extension.json"
+
+    def __init__(self, directory=CRX_CACHE_DIR, url=CRX_URL, ttl=CRX_CACHE_TTL, echo=print):
+        self.directory = os.path.abspath(directory)
+        self.url = url
+        self.ttl = ttl
+        self.echo = echo
+        self._lock = threading.Lock()
+        self._thread = None
+        self._checked_at = None
+        self._ready = threading.Event()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def bind(self):
+        """Монтирование кэша в контейнер или None, если кэш выключен"""
+        if not self.enabled:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        return f"{self.directory}:{CRX_CONTAINER_DIR}:ro"
+
+    def start(self):
+        """Запускает проверку кэша в фоне, если пора"""
+        if not self.enabled:
+            self._ready.set()
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.ttl:
+                return
+            self._checked_at = time.monotonic()
+            self._thread = threading.Thread(target=self._refresh_quietly, daemon=True)
+            self._thread.start()
+
+    def wait(self):
+        """Ждет первой проверки кэша; если скачать не удалось, контейнеры скачают расширение сами"""
+        self.start()
+        self._ready.wait()
+
+    def manifest(self):
+        """Текущая запись кэша, если файл на месте и совпадает по хэшу, иначе None"""
+        try:
+            with open(os.path.join(self.directory, self.MANIFEST), 'r') as f:
+                manifest = json.load(f)
+            with open(os.path.join(self.directory, manifest["file"]), 'rb') as f:
+                if hashlib.sha256(f.read()).hexdigest() != manifest["sha256"]:
+                    return None
+            return manifest
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def refresh(self, force=False):
+        """Скачивает расширение, если кэш устарел или поврежден; возвращает запись кэша"""
+        manifest = self.manifest()
+        if manifest and not force and time.time() - manifest["fetched_at"] < self.ttl:
+            return manifest
+        request = urllib.request.Request(self.url, headers={"User-Agent": CRX_USER_AGENT})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            body = response.read()
+        if not body.startswith(b"Cr24"):
+            raise ValueError(f"ответ не похож на crx ({len(body)} байт)")
+        digest = hashlib.sha256(body).hexdigest()
+        filename = f"app-{digest[:16]}.crx"
+        path = os.path.join(self.directory, filename)
+        os.makedirs(self.directory, exist_ok=True)
+        previous = manifest["file"] if manifest else None
+        if manifest is None or manifest["sha256"] != digest:
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(body)
+            os.replace(f"{path}.tmp", path)
+            self.echo(f"Расширение обновлено в кэше: {filename} ({len(body)} байт)")
+        manifest = {"file": filename, "sha256": digest, "size": len(body), "fetched_at": time.time(), "url": self.url}
+        manifest_path = os.path.join(self.directory, self.MANIFEST)
+        with open(f"{manifest_path}.tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        self._cleanup({filename, previous})
+        return manifest
+
+    def _cleanup(self, keep):
+        """Удаляет старые версии; предыдущая остается - ее может читать запускающийся контейнер"""
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".crx") and filename not in keep:
+                os.remove(os.path.join(self.directory, filename))
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            self.echo(f"Не удалось обновить кэш расширения: {e}")
+        finally:
+            self._ready.set()
+
+
+def _dotenv_line(key, value):
+    """Строка .env, которую dotenv прочитает без изменений, или None"""
+    if "\n" in value:
+        return None
+    # dotenv не раскрывает экранирование, поэтому подбираем незанятые кавычки
+    for quote_char in ("'", "`", '"'):
+        if quote_char not in value:
+            return f"{key}={quote_char}{value}{quote_char}\n"
+    return None
+
+
+class ContainerPool:
+    """Пул заранее созданных остановленных контейнеров бота
+
+    Контейнер пула создается с пустыми .env и proxies.txt из каталога
+    POOL_DIR. Бот забирает свободный контейнер: в эти файлы пишутся его
+    учетные данные и прокси, контейнер переименовывается и запускается,
+    так что на запуск уходит только старт контейнера и вход в аккаунт.
+    """
+
+    def __init__(self, manager, host, size=POOL_SIZE, refresh=POOL_REFRESH):
+        self.manager = manager
+        self.host = host
+        self.docker = host.docker
+        self.size = size
+        self.refresh = refresh
+        self.directory = os.path.join(POOL_DIR, host.name)
+        # Выдача и удаление свободных контейнеров не должны пересекаться
+        self._lock = threading.Lock()
+        self._refilling = threading.Lock()
+
+    def _idle(self):
+        return [
+            container for container in self.docker.ps(all=True, filters={"label": [LABEL_POOL]})
+            if container["name"].startswith("gradient-pool-") and container["state"] == "created"
+        ]
+
+    def fill(self):
+        """Пересоздает устаревшие контейнеры и дополняет пул до size, возвращает число свободных"""
+        if self.size <= 0:
+            return 0
+        with self._refilling:
+            self.host.images.wait()
+            image_id = self.docker.image_id(BOT_IMAGE)
+            now = time.time()
+            with self._lock:
+                idle, stale = [], []
+                for container in self._idle():
+                    labels = container["labels"]
+                    # Контейнер от старой версии образа, другого режима браузера или слишком давний пересоздается
+                    if labels.get(LABEL_POOL_IMAGE) != (image_id or "") or \
+                            labels.get(LABEL_LEAN, "0") != lean_label()[LABEL_LEAN] or \
+                            now - float(labels.get(LABEL_POOL_CREATED) or 0) > self.refresh:
+                        stale.append(container["id"])
+                    else:
+                        idle.append(container)
+                if stale:
+                    self.docker.remove_many(stale, force=True)
+
+            created = 0
+            missing = self.size - len(idle)
+            if missing > 0:
+                with ThreadPoolExecutor(max_workers=min(missing, BULK_WORKERS)) as pool:
+                    created = sum(pool.map(lambda _: self._create(image_id), range(missing)))
+            self._cleanup_slots()
+            return len(idle) + created
+
+    def _create(self, image_id):
+        slot = os.urandom(4).hex()
+        directory = os.path.abspath(os.path.join(self.directory, slot))
+        os.makedirs(directory, exist_ok=True)
+        for filename in (".env", "proxies.txt"):
+            open(os.path.join(directory, filename), 'w').close()
+        binds = [f"{directory}/.env:/app/.env", f"{directory}/proxies.txt:/app/proxies.txt"]
+        if self.manager.extension_cache.enabled:
+            binds.append(self.manager.extension_cache.bind())
+        try:
+            self.docker.create(
+                f"gradient-pool-{slot}", BOT_IMAGE,
+                binds=binds,
+                labels={LABEL_MANAGED: "true", LABEL_POOL: slot, LABEL_POOL_IMAGE: image_id or "",
+                        LABEL_POOL_CREATED: str(int(time.time())), **lean_label()},
+                memory=BOT_MEMORY_LIMIT or None,
+                cpus=BOT_CPU_LIMIT or None,
+                timeout=120,
+                **container_health_options(),
+            )
+            return 1
+        except (DockerError, TimeoutError) as e:
+            self.manager.echo(f"Не удалось создать контейнер пула: {e}")
+            shutil.rmtree(directory, ignore_errors=True)
+            return 0
+
+    def _cleanup_slots(self):
+        """Удаляет файлы пула, контейнеров которых больше нет"""
+        if not os.path.isdir(self.directory):
+            return
+        used = {container["labels"].get(LABEL_POOL)
+                for container in self.docker.ps(all=True, filters={"label": [LABEL_POOL]})}
+        for slot in os.listdir(self.directory):
+            if slot not in used:
+                shutil.rmtree(os.path.join(self.directory, slot), ignore_errors=True)
+
+    def refill_async(self):
+        if self.size <= 0 or self._refilling.locked():
+            return
+        threading.Thread(target=self._refill_quietly, daemon=True).start()
+
+    def _refill_quietly(self):
+        try:
+            self.fill()
+        except (DockerError, TimeoutError, OSError) as e:
+            self.manager.echo(f"Не удалось пополнить пул контейнеров: {e}")
+
+    def claim(self, bot_id, bot, proxy_file_path, deadline):
+        """Забирает свободный контейнер пула под бота и запускает его
+
+        Возвращает ID контейнера или None, если свободных контейнеров нет.
+        """
+        if self.size <= 0:
+            return None
+        env = [_dotenv_line("APP_USER", bot["email"]), _dotenv_line("APP_PASS", bot["password"])]
+        if None in env:
+            return None
+        name = f"gradient-bot-{bot_id}"
+        with self._lock:
+            idle = self._idle()
+            if not idle:
+                self.refill_async()
+                return None
+            container = idle[0]
+            directory = os.path.join(self.directory, container["labels"][LABEL_POOL])
+            # Режим браузера - как в метке контейнера, чтобы замеры памяти относились к верному режиму
+            if container["labels"].get(LABEL_LEAN) == "1":
+                env.append(_dotenv_line("LEAN_MODE", "1"))
+            try:
+                # Файлы смонтированы в контейнер - пишем на месте
+                with open(os.path.join(directory, ".env"), 'w', encoding='utf-8') as f:
+                    f.write("".join(env))
+                with open(proxy_file_path, 'r', encoding='utf-8') as src, \
+                        open(os.path.join(directory, "proxies.txt"), 'w', encoding='utf-8') as dst:
+                    dst.write(src.read())
+            except OSError as e:
+                self.manager.echo(f"Контейнер пула {container['name']} поврежден ({e}), удаляем")
+                self.manager._remove_container(container["id"], self.docker)
+                return None
+            try:
+                self.docker.rename(container["id"], name)
+            except DockerError as e:
+                if "409" not in str(e) and "already in use" not in str(e):
+                    raise
+                # От прошлого запуска остался контейнер с тем же именем - заменяем его
+                self.manager.echo(f"Удаляем старый контейнер {name}...")
+                self.manager._remove_container(name, self.docker)
+                self.docker.rename(container["id"], name)
+        self.docker.start(container["id"], timeout=max(deadline - time.monotonic(), 1))
+        self.refill_async()
+        return container["id"]
+
+    def drain(self):
+        """Удаляет все свободные контейнеры пула"""
+        with self._lock:
+            idle = [container["id"] for container in self._idle()]
+            if idle:
+                self.docker.remove_many(idle, force=True)
+        self._cleanup_slots()
+        return len(idle)
+
+
+class DockerHost:
+    """Docker-хост парка: клиент, замеры ресурсов, образ и пул контейнеров
+
+    Локальный хост (unix-сокет на этой машине) видит файлы менеджера, и
+    прокси с аккаунтами монтируются в контейнеры файлами. Удаленному хосту
+    они передаются через переменные окружения, а пул на нем не ведется.
+    """
+
+    def __init__(self, manager, name, docker, local=True):
+        self.name = name
+        self.docker = docker
+        self.local = local
+        self.resources = ResourceMonitor(manager, self)
+        self.images = ImageWarmer(docker, host=None if local else name, echo=manager.echo)
+        self.pool = ContainerPool(manager, self, size=POOL_SIZE if local else 0)
+        self._checked_at = None
+        self._reachable = True
+        # Время (monotonic) первой неудачной проверки подряд
+        self.down_since = None
+
+    def available(self, force=False):
+        """Доступен ли демон; результат проверки помнится HOST_CHECK_TTL секунд"""
+        if force or self._checked_at is None or time.monotonic() - self._checked_at >= HOST_CHECK_TTL:
+            self.mark(self.docker.ping())
+        return self._reachable
+
+    def mark(self, reachable):
+        self._checked_at = time.monotonic()
+        if reachable:
+            self.down_since = None
+        elif self.down_since is None:
+            self.down_since = self._checked_at
+        self._reachable = reachable
+
+    def failed_over(self):
+        """Хост недоступен дольше HOST_FAILOVER - его ботов пора переносить"""
+        return self.down_since is not None and time.monotonic() - self.down_since >= HOST_FAILOVER
+
+    def host_resources(self):
+        if self.local:
+            return read_host_resources()
+        try:
+            return self.docker.info()
+        except (DockerError, TimeoutError, ValueError):
+            return None
+
+
+class StartupMetrics:
+    """Время фаз запуска ботов и счетчики ошибок в формате Prometheus
+
+    Фазы: создание контейнера -> вход -> загрузка расширения -> подключение.
+    Состояние хранится в METRICS_STATE_FILE, чтобы гистограммы копились
+    между запусками менеджера, и в METRICS_FILE для textfile-коллектора
+    node_exporter. Запуски копятся в памяти, а файлы переписываются не чаще
+    раза в METRICS_FLUSH_INTERVAL секунд, после пачки запусков (flush) и
+    при выходе. Хранятся последние METRICS_MAX_BOTS запусков ботов.
+    """
+
+    PHASES = (
+        ("create_to_login", "created", "login"),
+        ("login_to_extension", "login", "extension"),
+        ("extension_to_connected", "extension", "connected"),
+        ("create_to_connected", "created", "connected"),
+    )
+
+    def __init__(self, state_file=METRICS_STATE_FILE, prom_file=METRICS_FILE,
+                 flush_interval=METRICS_FLUSH_INTERVAL, max_bots=METRICS_MAX_BOTS, echo=print):
+        self.state_file = state_file
+        self.prom_file = prom_file
+        self.flush_interval = flush_interval
+        self.max_bots = max_bots
+        self.echo = echo
+        self._lock = threading.Lock()
+        self._state = None
+        self._dirty = False
+        self._flushed_at = 0
+        self._atexit = False
+
+    def _load(self):
+        if self._state is None:
+            try:
+                with open(self.state_file, 'r') as f:
+                    self._state = json.load(f)
+            except (OSError, ValueError):
+                self._state = {}
+            self._state.setdefault("histograms", {})
+            self._state.setdefault("results", {})
+            self._state.setdefault("failures", {})
+            self._state.setdefault("bots", {})
+        return self._state
+
+    def record(self, bot_id, created, phases, result, cause=None):
+        """Сохраняет запуск бота: phases - {фаза: время}, cause - причина ошибки"""
+        moments = dict(phases, created=created)
+        durations = {}
+        for name, start, end in self.PHASES:
+            if moments.get(start) is not None and moments.get(end) is not None:
+                durations[name] = max(moments[end] - moments[start], 0.0)
+
+        with self._lock:
+            state = self._load()
+            for name, value in durations.items():
+                histogram = state["histograms"].setdefault(
+                    name, {"buckets": [0] * len(METRICS_BUCKETS), "sum": 0.0, "count": 0})
+                for index, bound in enumerate(METRICS_BUCKETS):
+                    if value <= bound:
+                        histogram["buckets"][index] += 1
+                histogram["sum"] += value
+                histogram["count"] += 1
+            state["results"][result] = state["results"].get(result, 0) + 1
+            if cause:
+                state["failures"][cause] = state["failures"].get(cause, 0) + 1
+            state["bots"][bot_id] = {
+                "created": created,
+                "phases": phases,
+                "durations": durations,
+                "result": result,
+                "cause": cause,
+            }
+            self._dirty = True
+            if not self._atexit:
+                # Несохраненные запуски записываются при выходе из менеджера
+                atexit.register(self.flush)
+                self._atexit = True
+            if time.monotonic() - self._flushed_at >= self.flush_interval:
+                self._save()
+
+    def flush(self):
+        """Записывает накопленные запуски в файлы метрик"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def bot_record(self, bot_id):
+        with self._lock:
+            return self._load()["bots"].get(bot_id)
+
+    def _save(self):
+        bots = self._state["bots"]
+        if len(bots) > self.max_bots:
+            # Старые записи (по времени создания контейнера) вытесняются новыми
+            for bot_id in sorted(bots, key=lambda bot_id: bots[bot_id].get("created") or 0)[:len(bots) - self.max_bots]:
+                del bots[bot_id]
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._state, f)
+        os.replace(tmp_path, self.state_file)
+        tmp_path = f"{self.prom_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self._render())
+        os.replace(tmp_path, self.prom_file)
+        self._dirty = False
+        self._flushed_at = time.monotonic()
+
+    def render(self):
+        with self._lock:
+            if self._dirty:
+                self._save()
+            else:
+                # Метрики могли обновиться в другом процессе менеджера
+                self._state = None
+                self._load()
+            return self._render()
+
+    def _render(self):
+        state = self._state
+        lines = [
+            "# HELP gradient_bot_startup_phase_seconds Длительность фаз запуска бота",
+            "# TYPE gradient_bot_startup_phase_seconds histogram",
+        ]
+        for name, histogram in sorted(state["histograms"].items()):
+            for bound, count in zip(METRICS_BUCKETS, histogram["buckets"]):
+                lines.append(f'gradient_bot_startup_phase_seconds_bucket{{phase="{name}",le="{bound}"}} {count}')
+            lines.append(f'gradient_bot_startup_phase_seconds_bucket{{phase="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'gradient_bot_startup_phase_seconds_sum{{phase="{name}"}} {histogram["sum"]:.3f}')
+            lines.append(f'gradient_bot_startup_phase_seconds_count{{phase="{name}"}} {histogram["count"]}')
+
+        lines += [
+            "# HELP gradient_bot_starts_total Запуски ботов по результату",
+            "# TYPE gradient_bot_starts_total counter",
+        ]
+        for result, count in sorted(state["results"].items()):
+            lines.append(f'gradient_bot_starts_total{{result="{result}"}} {count}')
+
+        lines += [
+            "# HELP gradient_bot_start_failures_total Неудачные запуски ботов по причине",
+            "# TYPE gradient_bot_start_failures_total counter",
+        ]
+        for cause, count in sorted(state["failures"].items()):
+            lines.append(f'gradient_bot_start_failures_total{{cause="{cause}"}} {count}')
+
+        lines += [
+            "# HELP gradient_bot_last_startup_seconds Фазы последнего запуска каждого бота",
+            "# TYPE gradient_bot_last_startup_seconds gauge",
+        ]
+        for bot_id, record in sorted(state["bots"].items()):
+            for name, value in sorted(record["durations"].items()):
+                lines.append(f'gradient_bot_last_startup_seconds{{bot_id="{bot_id}",phase="{name}"}} {value:.3f}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Отдает метрики по HTTP на /metrics"""
+        metrics = self
+
+        # HTTP-сервер нужен только здесь - модуль не импортируется при каждом запуске менеджера
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        self.echo(f"Метрики доступны на http://{host}:{port}/metrics (Ctrl+C для выхода)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+class Supervisor:
+    """Цикл сверки: перезапускает упавших ботов с экспоненциальной задержкой
+
+    На каждом шаге желаемый набор ботов из конфигурации сравнивается с
+    контейнерами, полученными одним запросом docker ps. Бот, упавший
+    CRASH_LOOP_LIMIT раз за CRASH_LOOP_WINDOW секунд, уходит в карантин.
+    Одновременно выполняется не больше max_restarts перезапусков.
+    Контейнеры ботов, которых нет в конфигурации, удаляются только с
+    prune_orphans и только если конфигурация не пуста.
+    """
+
+    def __init__(self, manager, interval=SUPERVISE_INTERVAL, max_restarts=MAX_CONCURRENT_RESTARTS,
+                 prune_orphans=False):
+        self.manager = manager
+        self.interval = interval
+        self.max_restarts = max(1, max_restarts)
+        self.prune_orphans = prune_orphans
+        self._pool = ThreadPoolExecutor(max_workers=self.max_restarts)
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        # bot_id -> {"failures": [время падений], "next_attempt": ..., "quarantined_until": ...}
+        self._state = {}
+
+    def run(self, once=False):
+        if not once:
+            self.manager.watch_events()
+        self.manager.echo(f"\n=== Наблюдение за ботами (каждые {self.interval} сек, Ctrl+C для выхода) ===")
+        try:
+            while True:
+                self.tick()
+                if once:
+                    break
+                # Падение контейнера (событие die) будит наблюдателя раньше срока
+                if self.manager.events.exited.wait(self.interval):
+                    self.manager.events.exited.clear()
+        except KeyboardInterrupt:
+            self.manager.echo("\nНаблюдение остановлено")
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def tick(self):
+        # Метрики перезапусков прошлого шага - на диск (flush ничего не делает, если их нет)
+        self.manager.metrics.flush()
+        now = time.time()
+        desired = set(self.manager.config["bots"])
+        strays = []
+        try:
+            actual = self.manager.container_states(processes=True, strays=strays)
+        except (DockerError, TimeoutError) as e:
+            self.manager.echo(f"Не удалось получить состояние контейнеров: {e}")
+            return
+
+        unhealthy = self._unhealthy(actual)
+        running = dead = 0
+        for bot_id in desired:
+            container = actual.get(bot_id)
+            if container and container["state"] in ("running", "restarting") and bot_id not in unhealthy:
+                running += 1
+                self._mark_stable(bot_id, now)
+                continue
+            if bot_id in unhealthy:
+                container = dict(container, status="нет пульса")
+
+            dead += 1
+            with self._lock:
+                if bot_id in self._in_flight:
+                    continue
+            host = self.manager.host_of(bot_id)
+            if not host.available() and not host.failed_over():
+                # Хост временно недоступен: ждем его возвращения или переноса ботов (HOST_FAILOVER)
+                continue
+            state = self._state.setdefault(bot_id, {"failures": [], "next_attempt": 0, "quarantined_until": 0})
+            if state["quarantined_until"] > now or state["next_attempt"] > now:
+                continue
+            if state["quarantined_until"]:
+                # Карантин истек - начинаем отсчет падений заново
+                state.update(failures=[], quarantined_until=0)
+            with self._lock:
+                if len(self._in_flight) >= self.max_restarts:
+                    continue
+            if self._record_failure(bot_id):
+                continue
+            with self._lock:
+                self._in_flight.add(bot_id)
+            self._pool.submit(self._restart, bot_id, container)
+
+        # Образ и кэш расширения обновляются, а пул пополняется в фоне
+        self.manager.extension_cache.start()
+        for host in self.manager.hosts.values():
+            if host.available():
+                host.images.start()
+                host.pool.refill_async()
+
+        # Копии перенесенных ботов на вернувшемся хосте
+        by_host = {}
+        for bot_id, container in strays:
+            by_host.setdefault(container["host"], []).append((bot_id, container))
+        for name, containers in by_host.items():
+            self.manager.echo(f"Удаляем на хосте {name} контейнеры перенесенных ботов: "
+                              f"{', '.join(sorted({bot_id for bot_id, _ in containers}))}")
+            self.manager.teardown_containers(self.manager.hosts[name].docker, containers)
+
+        # Контейнеры ботов, удаленных из конфигурации. Пустая конфигурация - скорее
+        # запуск не из того каталога, чем удаление всех ботов: ничего не трогаем
+        orphans = [bot_id for bot_id in actual if bot_id not in desired]
+        if orphans and not self.prune_orphans:
+            self.manager.echo(f"Контейнеры ботов, которых нет в конфигурации (удалить: --prune-orphans): "
+                              f"{', '.join(sorted(orphans))}")
+        elif orphans and not desired:
+            self.manager.echo(f"Конфигурация пуста - контейнеры не удаляются: {', '.join(sorted(orphans))}")
+        elif orphans:
+            self.manager.echo(f"Останавливаем контейнеры ботов, которых нет в конфигурации: {', '.join(sorted(orphans))}")
+            self.manager.teardown_bots(orphans)
+
+        quarantined = sum(1 for state in self._state.values() if state["quarantined_until"] > now)
+        self.manager.echo(f"[{time.strftime('%H:%M:%S')}] работает: {running}, не работает: {dead}, "
+                          f"перезапускается: {len(self._in_flight)}, в карантине: {quarantined}")
+
+    def _unhealthy(self, actual):
+        """Работающие боты, у которых healthcheck Docker не видит пульса
+
+        Для отдельных контейнеров хватает docker ps, контейнеры паков
+        проверяются одним docker inspect на хост - по отчету healthcheck.js.
+        """
+        unhealthy = set()
+        packs = {}
+        for bot_id, container in actual.items():
+            if container["state"] != "running":
+                continue
+            if container["labels"].get(LABEL_PACK):
+                packs.setdefault(container["host"], {}).setdefault(container["id"], []).append(bot_id)
+            elif "(unhealthy)" in (container["status"] or ""):
+                unhealthy.add(bot_id)
+        for name, containers in packs.items():
+            try:
+                details = self.manager.hosts[name].docker.inspect_many(sorted(containers))
+            except (DockerError, TimeoutError) as e:
+                self.manager.echo(f"Не удалось проверить здоровье паков на хосте {name}: {e}")
+                continue
+            for container_id, bot_ids in containers.items():
+                info = details.get(container_id, {})
+                for bot_id in bot_ids:
+                    if self.manager._bot_health(bot_id, actual[bot_id], info) == "unhealthy":
+                        unhealthy.add(bot_id)
+        return unhealthy
+
+    def _mark_stable(self, bot_id, now):
+        state = self._state.get(bot_id)
+        # Бот, проработавший без падений дольше окна, считается восстановившимся
+        if state and state["failures"] and now - state["failures"][-1] > CRASH_LOOP_WINDOW:
+            del self._state[bot_id]
+
+    def _restart(self, bot_id, container):
+        try:
+            if container and container["labels"].get(LABEL_PACK):
+                # Контейнер пака общий - перезапускается только процесс бота (или пак, если он упал)
+                self.manager.echo(f"Бот {bot_id} не работает ({container['status'] or container['state']}), перезапуск в паке...")
+                if container["state"] == "running":
+                    # Процесс жив, но пульса нет - удаляем его, иначе запуск только дождется готовности
+                    self.manager._stop_packed_bots(container["id"], [bot_id], self.manager.hosts[container["host"]].docker)
+            elif container:
+                self.manager.echo(f"Бот {bot_id} не работает ({container['status'] or container['state']}), перезапуск...")
+                self.manager._remove_container(container["id"], self.manager.hosts[container["host"]].docker)
+                self.manager._forget_container(bot_id)
+            else:
+                self.manager.echo(f"Контейнер бота {bot_id} не найден, запуск...")
+            status = self.manager._start_bot(bot_id, verbose=False)
+        except Exception as e:
+            self.manager.echo(f"Ошибка при перезапуске бота {bot_id}: {e}")
+            status = STATUS_FAILED
+        finally:
+            with self._lock:
+                self._in_flight.discard(bot_id)
+        self.manager.echo(f"Бот {bot_id}: {status}")
+        return status
+
+    def _record_failure(self, bot_id):
+        """Учитывает падение бота и назначает задержку до следующей попытки
+
+        Возвращает True, если бот отправлен в карантин.
+        """
+        now = time.time()
+        state = self._state.setdefault(bot_id, {"failures": [], "next_attempt": 0, "quarantined_until": 0})
+        state["failures"] = [moment for moment in state["failures"] if now - moment < CRASH_LOOP_WINDOW]
+        state["failures"].append(now)
+        attempts = len(state["failures"])
+        if attempts >= CRASH_LOOP_LIMIT:
+            state["quarantined_until"] = now + QUARANTINE_TIME
+            self.manager.echo(f"⚠️ Бот {bot_id} падает циклически ({attempts} раз за {CRASH_LOOP_WINDOW} сек), "
+                              f"карантин на {QUARANTINE_TIME} сек")
+            return True
+        delay = min(RESTART_BACKOFF_BASE * 2 ** (attempts - 1), RESTART_BACKOFF_MAX)
+        state["next_attempt"] = now + delay
+        return False
+
+
+class LogParser:
+    """Разбор лога одного бота: события по мере поступления строк и состояние бота
+
+    Каждая строка проверяется одним поиском по LOG_EVENT_PATTERN, метка
+    console-stamp разбирается только у строк с событием, так что разбор
+    линеен по размеру лога. Состояние идет по цепочке starting -> login ->
+    extension -> connected, fatal и region переводят бота в failed, а новый
+    "Starting..." (перезапуск процесса) начинает цепочку заново.
+    Время фаз попадает в phases - тот же словарь, что уходит в метрики запуска.
+    """
+
+    def __init__(self, phases=None):
+        self.phases = {} if phases is None else phases
+        self.state = None
+        self.support_status = None
+        self.error = None
+        # Время последнего события (метка строки) - для статуса "последняя активность"
+        self.last_seen = None
+
+    def feed(self, line):
+        """Разбирает строку; возвращает LogEvent или None, если маркера в строке нет"""
+        match = LOG_EVENT_PATTERN.search(line)
+        if match is None:
+            return None
+        kind = match.lastgroup
+        stamp = parse_log_timestamp(line)
+        event = LogEvent(kind, stamp, match.group("support").strip() if kind == LOG_EVENT_STATUS else None, line)
+        self._advance(event, stamp or time.time())
+        return event
+
+    def _advance(self, event, moment):
+        kind = event.kind
+        self.last_seen = moment
+        if kind == LOG_EVENT_STARTING:
+            if self.state is not None:
+                for phase in (LOG_EVENT_LOGIN, LOG_EVENT_EXTENSION, LOG_EVENT_CONNECTED):
+                    self.phases.pop(phase, None)
+                self.support_status = self.error = None
+            self.state = LOG_EVENT_STARTING
+        elif kind in (LOG_EVENT_LOGIN, LOG_EVENT_EXTENSION, LOG_EVENT_CONNECTED):
+            self.phases.setdefault(kind, moment)
+            self.state = kind
+        elif kind == LOG_EVENT_STATUS:
+            self.support_status = event.value
+        elif kind == LOG_EVENT_RUNNING:
+            # Строка "Running..." пишется только подключившимся ботом
+            self.state = LOG_EVENT_CONNECTED
+        elif kind in LOG_FAILURES:
+            self.state = STATUS_FAILED
+            self.error = event.line.strip()
+        elif kind == LOG_EVENT_ERROR:
+            # Процесс упал, pm2 его перезапустит - ожидание продолжается
+            self.error = event.line.strip()
+
+    @property
+    def connected(self):
+        return self.state == LOG_EVENT_CONNECTED
+
+    @property
+    def failed(self):
+        return self.state == STATUS_FAILED
+
+    @property
+    def disconnected(self):
+        return "Disconnected" in (self.support_status or "")
+
+    def summary(self):
+        """Состояние бота по логам: {"state", "phases", "support_status", "error", "last_seen"}"""
+        return {
+            "state": self.state,
+            "phases": dict(self.phases),
+            "support_status": self.support_status,
+            "error": self.error,
+            "last_seen": self.last_seen,
+        }
+
+
+class LogAggregator:
+    """Одновременный просмотр логов многих ботов
+
+    На каждый контейнер открывается один поток логов (у пака - общий на
+    его ботов, строки разбираются по префиксу pm2) с последних buffer_size
+    строк на бота, а не со всего лог-файла Docker. Фильтр применяется в
+    потоке чтения, до буферов и вывода. Прошедшие строки попадают в
+    кольцевой буфер бота и в общую очередь как (bot_id, строка). Все строки
+    (и до фильтра) разбирает LogParser бота - см. state.
+    """
+
+    def __init__(self, manager, bot_ids, pattern=None, buffer_size=LOG_BUFFER_LINES):
+        self.manager = manager
+        self.pattern = re.compile(pattern) if pattern else None
+        self.buffer_size = buffer_size
+        self.buffers = {bot_id: deque(maxlen=buffer_size) for bot_id in bot_ids}
+        self.parsers = {bot_id: LogParser() for bot_id in bot_ids}
+        self.lines = queue.Queue()
+        self._lock = threading.Lock()
+        self._closers = []
+        self._active = 0
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Открывает потоки логов; возвращает ботов, у которых нет контейнера"""
+        states = self.manager.container_states()
+        containers = {}
+        for bot_id in self.buffers:
+            container = states.get(bot_id)
+            if container:
+                containers.setdefault(container["id"], (container, []))[1].append(bot_id)
+        self._active = len(containers)
+        for container, bot_ids in containers.values():
+            threading.Thread(target=self._follow, args=(container, bot_ids), daemon=True).start()
+        found = {bot_id for _, bot_ids in containers.values() for bot_id in bot_ids}
+        return [bot_id for bot_id in self.buffers if bot_id not in found]
+
+    def _follow(self, container, bot_ids):
+        docker = self.manager.hosts[container["host"]].docker
+        packed = bool(container["labels"].get(LABEL_PACK))
+        # В логе пака перемешаны строки всех его ботов, а не только выбранных
+        members = len(self.manager._container_bot_ids(container, self.manager._pack_index())) if packed else 1
+        wanted = set(bot_ids)
+        close = None
+        try:
+            stream, close = docker._open_log_stream(container["id"], tail=self.buffer_size * max(members, 1))
+            with self._lock:
+                self._closers.append(close)
+            if self._stopped.is_set():
+                return
+            for line in stream:
+                if packed:
+                    match = PM2_LOG_PREFIX.match(line)
+                    if match is None or match.group("name") not in wanted:
+                        continue
+                    bot_id, line = match.group("name"), line[match.end():]
+                else:
+                    bot_id = bot_ids[0]
+                self.parsers[bot_id].feed(line)
+                if self.pattern and not self.pattern.search(line):
+                    continue
+                line = line.rstrip("\n")
+                self.buffers[bot_id].append(line)
+                self.lines.put((bot_id, line))
+        except DockerError as e:
+            self.lines.put((bot_ids[0], f"Не удалось открыть логи: {e}"))
+        except (OSError, ValueError, http.client.HTTPException):
+            pass
+        finally:
+            if close:
+                close()
+            # None - поток логов контейнера закрылся
+            self.lines.put((None, None))
+
+    def follow(self):
+        """Отдает (bot_id, строка) по мере поступления, пока открыт хоть один поток"""
+        while self._active and not self._stopped.is_set():
+            bot_id, line = self.lines.get()
+            if bot_id is None:
+                self._active -= 1
+                continue
+            yield bot_id, line
+
+    def state(self, bot_id):
+        """Состояние бота по прочитанным строкам лога (см. LogParser.summary)"""
+        return self.parsers[bot_id].summary()
+
+    def tail(self, bot_id, count=None):
+        """Последние строки бота из буфера, без обращения к Docker"""
+        lines = list(self.buffers.get(bot_id, ()))
+        return lines[-count:] if count else lines
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            closers, self._closers = self._closers, []
+        for close in closers:
+            close()
+
+
+class ContainerStateCache:
+    """Состояние контейнеров ботов в памяти, обновляемое по docker events
+
+    На каждый хост - фоновый поток: подписка на события управляемых
+    контейнеров, затем полный снимок (docker ps и один docker inspect), а
+    дальше каждое событие меняет запись контейнера. После разрыва потока
+    снимок снимается заново. Пока подписка хоста жива, состояние его
+    контейнеров читается из памяти без обращения к Docker.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        # {хост: {ID контейнера: контейнер}} в формате docker ps плюс started, restarts, exit_code, health
+        self._containers = {}
+        self._synced = set()
+        self._threads = {}
+        self._closers = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        # Выставляется при падении контейнера - наблюдатель проверяет ботов сразу
+        self.exited = threading.Event()
+
+    def start(self):
+        """Запускает подписку на события хостов, у которых ее еще нет"""
+        self._stopped.clear()
+        for host in self.manager.hosts.values():
+            thread = self._threads.get(host.name)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=self._watch, args=(host,), daemon=True)
+                self._threads[host.name] = thread
+                thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            closers = list(self._closers.values())
+            self._synced.clear()
+        for close in closers:
+            close()
+
+    def synced(self, host_name):
+        """Жива ли подписка хоста (состояние в памяти актуально)"""
+        return host_name in self._synced
+
+    def containers(self, host_names):
+        """Копии записей контейнеров перечисленных хостов"""
+        with self._lock:
+            return [dict(container) for name in host_names
+                    for container in self._containers.get(name, {}).values()]
+
+    def _watch(self, host):
+        delay = 1
+        while not self._stopped.is_set():
+            close = None
+            try:
+                # Сначала подписка, потом снимок: события между ними не теряются
+                events, close = host.docker._open_event_stream({"type": ["container"], "label": [LABEL_MANAGED]})
+                with self._lock:
+                    self._closers[host.name] = close
+                self._snapshot(host)
+                delay = 1
+                for event in events:
+                    self._apply(host.name, event)
+            except (DockerError, TimeoutError, OSError, ValueError, http.client.HTTPException) as e:
+                if not self._stopped.is_set():
+                    self.manager.echo(f"Поток событий Docker-хоста {host.name} прерван: {e}")
+            finally:
+                with self._lock:
+                    self._synced.discard(host.name)
+                    self._closers.pop(host.name, None)
+                if close:
+                    close()
+            self._stopped.wait(delay)
+            delay = min(delay * 2, EVENTS_RECONNECT_MAX)
+
+    def _snapshot(self, host):
+        containers = host.docker.ps(all=True, filters={"label": [LABEL_MANAGED]})
+        details = host.docker.inspect_many([container["id"] for container in containers])
+        snapshot = {}
+        for container in containers:
+            info = details.get(container["id"], {})
+            snapshot[container["id"]] = dict(
+                container, host=host.name, started=info.get("started"), restarts=info.get("restarts") or 0,
+                exit_code=info.get("exit_code"), health=info.get("health"), stopping=False, crashed=False)
+        with self._lock:
+            self._containers[host.name] = snapshot
+            self._synced.add(host.name)
+        self.manager._status_cache = None
+
+    def _apply(self, host_name, event):
+        action = event.get("Action") or event.get("status") or ""
+        actor = event.get("Actor") or {}
+        container_id = actor.get("ID") or event.get("id")
+        attributes = actor.get("Attributes") or {}
+        moment = event.get("timeNano", 0) / 1e9 or event.get("time") or time.time()
+        if not container_id:
+            return
+        with self._lock:
+            containers = self._containers.setdefault(host_name, {})
+            if action == "destroy":
+                containers.pop(container_id, None)
+                self.manager._status_cache = None
+                return
+            container = containers.get(container_id)
+            if container is None:
+                container = {
+                    "id": container_id, "image": attributes.get("image", ""), "name": attributes.get("name", ""),
+                    "state": "created", "status": "", "host": host_name,
+                    "labels": {key: value for key, value in attributes.items() if key.startswith("gradient-bot.")},
+                    "started": None, "restarts": 0, "exit_code": None, "health": None,
+                    "stopping": False, "crashed": False,
+                }
+            if action == "start":
+                # Старт после падения без docker stop - перезапуск по политике
+                if container["crashed"]:
+                    container["restarts"] += 1
+                container.update(state="running", started=moment, health=None, stopping=False, crashed=False)
+            elif action == "die":
+                container.update(state="exited", exit_code=int(attributes.get("exitCode") or 0), health=None,
+                                 crashed=not container["stopping"], stopping=False)
+            elif action in ("kill", "stop"):
+                container["stopping"] = True
+            elif action == "pause":
+                container["state"] = "paused"
+            elif action == "unpause":
+                container["state"] = "running"
+            elif action == "rename":
+                container["name"] = attributes.get("name", container["name"]).lstrip("/")
+            elif action.startswith("health_status"):
+                container["health"] = action.partition(":")[2].strip()
+            elif action != "create":
+                # exec_*, attach и прочие события состояние не меняют
+                return
+            container["status"] = self._status_text(container)
+            containers[container_id] = container
+            crashed = action == "die" and container["crashed"]
+        self.manager._status_cache = None
+        if crashed:
+            self.exited.set()
+
+    @staticmethod
+    def _status_text(container):
+        """Строка состояния как в docker ps (без длительности)"""
+        state = container["state"]
+        if state == "running":
+            health = container["health"]
+            return "Up" + (f" (health: {health})" if health == "starting" else f" ({health})" if health else "")
+        if state == "exited":
+            return f"Exited ({container['exit_code']})"
+        return {"created": "Created", "paused": "Up (Paused)"}.get(state, state)
+
 
 class BotManager:
-    def __init__(self):
+    def __init__(self, echo=print):
+        """echo - куда выводить сообщения (по умолчанию print); None отключает вывод"""
+        self.echo = echo or (lambda *args, **kwargs: None)
         self.config_file = 'bot_config.json'
+        self._config_lock = threading.RLock()
+        # Docker-хосты парка; первый - хост по умолчанию
+        self.hosts = {}
+        for name, endpoint in parse_docker_hosts(DOCKER_HOSTS) or [("local", None)]:
+            local = endpoint is None or endpoint.startswith("unix://")
+            self.hosts[name] = DockerHost(self, name, get_docker_client(endpoint), local)
+        self.default_host = next(iter(self.hosts.values()))
+        self.docker = self.default_host.docker
+        self._placement_lock = threading.Lock()
+        self.proxy_checker = ProxyChecker()
+        self.extension_cache = ExtensionCache(echo=self.echo)
+        # Состояние контейнеров по docker events - см. watch_events
+        self.events = ContainerStateCache(self)
+        self.metrics = StartupMetrics(echo=self.echo)
+        # Кэш bot_id -> ID контейнера, чтобы не искать контейнер повторно
+        self._container_ids = {}
+        # (время, состояние парка) для list_bots - см. fleet_status
+        self._status_cache = None
+        # Блокировки паков: контейнер пака создает только один поток
+        self._pack_locks = {}
         
-        # Настройка кодировки для всего скрипта
-        import sys
-        import io
-        import locale
-        
-        # Устанавливаем локаль
-        locale.setlocale(locale.LC_ALL, 'C.UTF-8')
-        
-        # Настраиваем кодировку для stdout и stderr
-        sys.stdout = io.TextIOWrapper(
-            sys.stdout.buffer,
-            encoding='utf-8',
-            errors='replace',
-            line_buffering=True
-        )
-        sys.stderr = io.TextIOWrapper(
-            sys.stderr.buffer,
-            encoding='utf-8',
-            errors='replace',
-            line_buffering=True
-        )
-        
+        # Записи ботов читаются по требованию; проверяются они при сохранении (check_bot_record),
+        # поэтому при старте конфигурация не перебирается и не перезаписывается
         self.load_config()
-        
-        # Очистка конфигурации от проблемных записей при старте
-        if hasattr(self, 'config') and "bots" in self.config:
-            clean_bots = {}
-            for bot_id, bot_data in self.config["bots"].items():
-                try:
-                    bot_id.encode('ascii', 'ignore')
-                    bot_data['email'].encode('ascii', 'ignore')
-                    bot_data['proxy_file'].encode('ascii', 'ignore')
-                    clean_bots[bot_id] = bot_data
-                except:
-                    continue
-            self.config["bots"] = clean_bots
-            self.save_config()
 
     def check_and_install_requirements(self):
-        print("\n=== Проверка и установка требований ===")
+        self.echo("\n=== Проверка и установка требований ===")
         
         # Проверяем операционную систему
         if platform.system() != "Linux":
-            print("Скрипт предназначен для работы на Linux системах!")
+            self.echo("Скрипт предназначен для работы на Linux системах!")
             sys.exit(1)
 
         try:
             # Проверка наличия sudo прав
             subprocess.run(["sudo", "-n", "true"], check=True, capture_output=True)
         except subprocess.CalledProcessError:
-            print("Для установки компонентов требуются права sudo!")
-            print("Пожалуйста, введите пароль при запросе.")
+            self.echo("Для установки компонентов требуются права sudo!")
+            self.echo("Пожалуйста, введите пароль при запросе.")
 
         requirements = {
             "docker": {
@@ -92,18 +2823,18 @@ class BotManager:
         need_relogin = False
 
         for component, cmds in requirements.items():
-            print(f"\nПроверка {component}...")
+            self.echo(f"\nПроверка {component}...")
             try:
                 subprocess.run(cmds["check_cmd"], check=True, capture_output=True)
-                print(f"✓ {component} уже установлен")
+                self.echo(f"✓ {component} уже установлен")
             except (subprocess.CalledProcessError, FileNotFoundError):
-                print(f"✗ {component} не найден. Установка...")
+                self.echo(f"✗ {component} не найден. Установка...")
                 for cmd in cmds["install_cmd"]:
                     try:
                         subprocess.run(cmd.split(), check=True)
                     except subprocess.CalledProcessError as e:
-                        print(f"Ошибка при выполнении команды {cmd}")
-                        print(e)
+                        self.echo(f"Ошибка при выполнении команды {cmd}")
+                        self.echo(e)
                         return False
                 if component == "docker":
                     need_relogin = True
@@ -112,31 +2843,44 @@ class BotManager:
         try:
             subprocess.run(["docker", "ps"], check=True, capture_output=True)
         except subprocess.CalledProcessError:
-            print("\nЗапуск Docker демона...")
+            self.echo("\nЗапуск Docker демона...")
             subprocess.run(["sudo", "systemctl", "start", "docker"], check=True)
 
         if need_relogin:
-            print("\n⚠️ ВАЖНО: Вы были добавлены в группу docker.")
-            print("Необходимо перелогиниться в систему для применения изменений.")
-            print("После этого запустите скрипт снова.")
+            self.echo("\n⚠️ ВАЖНО: Вы были добавлены в группу docker.")
+            self.echo("Необходимо перелогиниться в систему для применения изменений.")
+            self.echo("После этого запустите скрипт снова.")
             sys.exit(0)
 
-        print("\n✓ Все необходимые компоненты установлены и гоовы к работе!")
+        self.echo("\n✓ Все необходимые компоненты установлены и гоовы к работе!")
         return True
 
     def load_config(self):
-        if os.path.exists(self.config_file):
-            with open(self.config_file, 'r') as f:
-                self.config = json.load(f)
-        else:
-            self.config = {"bots": {}}
+        self.store = open_config_store(self.config_file, echo=self.echo)
+        self.config = {"bots": self.store}
 
     def save_config(self):
-        with open(self.config_file, 'w') as f:
-            json.dump(self.config, f, indent=2)
+        self.store.commit()
+
+    def _drop_broken_bots(self):
+        """Удаляет записи, которые нельзя безопасно вывести, не трогая остальные"""
+        broken = []
+        for bot_id, bot_data in self.config["bots"].items():
+            try:
+                bot_id.encode('ascii', 'ignore')
+                bot_data['email'].encode('ascii', 'ignore')
+                bot_data['proxy_file'].encode('ascii', 'ignore')
+            except Exception:
+                broken.append(bot_id)
+        if broken:
+            with self.store.batch():
+                for bot_id in broken:
+                    del self.config["bots"][bot_id]
+        return broken
 
-    def convert_proxy_format(self, proxy_string):
+    def convert_proxy_format(self, proxy_string, verbose=True):
         """Конвертирует прокси из формата host:port:username:password в socks5 формат"""
+        say = self.echo if verbose else (lambda *args, **kwargs: None)
         try:
             if 'socks5://' in proxy_string:
                 return proxy_string
@@ -144,20 +2888,20 @@ class BotManager:
             parts = proxy_string.split(':')
             if len(parts) == 4:
                 host, port, username, password = parts
-                print(f"\nПроверка компонентов прокси:")
-                print(f"Host: {host}")
-                print(f"Port: {port}")
-                print(f"Username: {username}")
-                print(f"Password: {password}")
+                say(f"\nПроверка компонентов прокси:")
+                say(f"Host: {host}")
+                say(f"Port: {port}")
+                say(f"Username: {username}")
+                say(f"Password: {password}")
                 
                 result = f"socks5://{username}:{password}@{host}:{port}"
-                print(f"Сконвертированный прокси: {result}")
+                say(f"Сконвертированный прокси: {result}")
                 return result
             else:
-                print("Ошибка: неверный формат прокси (нужно 4 компонента, разделенных двоеточием)")
+                self.echo("Ошибка: неверный формат прокси (нужно 4 компонента, разделенных двоеточием)")
                 return None
         except Exception as e:
-            print(f"Ошибка при конвертации прокси: {e}")
+            self.echo(f"Ошибка при конвертации прокси: {e}")
             return None
 
     def clean_bot_id(self, bot_id):
@@ -165,35 +2909,35 @@ class BotManager:
         # Оставляем только разрешенные символы: буквы, цифры, подчеркивание, точка и дефис
         cleaned = re.sub(r'[^a-zA-Z0-9_.-]', '', bot_id)
         if cleaned != bot_id:
-            print(f"ID бота был очищен от недопустимых символов: {cleaned}")
+            self.echo(f"ID бота был очищен от недопустимых символов: {cleaned}")
         return cleaned
 
     def add_bot(self):
-        print("\n=== Добавление нового бота ===")
+        self.echo("\n=== Добавление нового бота ===")
         bot_id = input("Введите ID для бота (разрешены только латинские буквы, цифры, -, _ и .): ").strip()
         bot_id = self.clean_bot_id(bot_id)
         
         if not bot_id:
-            print("Ошибка: ID бота не может быть пустым после очистки")
+            self.echo("Ошибка: ID бота не может быть пустым после очистки")
             return
         
         if bot_id in self.config["bots"]:
-            print(f"Ошибка: Бот с ID {bot_id} уже существует")
+            self.echo(f"Ошибка: Бот с ID {bot_id} уже существует")
             return
         
         email = input("Введите email: ").strip()
         password = getpass.getpass("Введите пароль: ").strip()
-        print()
+        self.echo()
         proxy = input("Введите прокси (формат: host:port:username:password): ").strip()
         
         converted_proxy = self.convert_proxy_format(proxy)
         if not converted_proxy:
-            print("Ошибка при обработке прокси. Бот не будет добавлен.")
+            self.echo("Ошибка при обработке прокси. Бот не будет добавлен.")
             return
         
         # Тестируем прокси перед добавлением бота
         if not self.test_proxy(converted_proxy):
-            print("Прокси не работает. Бот не будет добавлен.")
+            self.echo("Прокси не работает. Бот не будет добавлен.")
             return
         
         # Создаем отдельный proxies.txt для этого бота
@@ -204,12 +2948,13 @@ class BotManager:
         self.config["bots"][bot_id] = {
             "email": email,
             "password": password,
-            "proxy_file": proxy_file
+            "proxy_file": proxy_file,
+            "spec_hash": spec_hash(email, password, converted_proxy)
         }
         
         if self.start_bot(bot_id):
             self.save_config()
-            print(f"\nБот {bot_id} успешно добавлен и запущен!")
+            self.echo(f"\nБот {bot_id} успешно добавлен и запущен!")
         else:
             # Удаляем конфигурацию и файл прокси если запуск не удался
             del self.config["bots"][bot_id]
@@ -217,248 +2962,1199 @@ class BotManager:
                 os.remove(proxy_file)
             except:
                 pass
-            print(f"\nБот {bot_id} не был добавлен из-за ошибок при запуске")
+            self.echo(f"\nБот {bot_id} не был добавлен из-за ошибок при запуске")
+
+    def start_bot(self, bot_id, timeout=None, verbose=True):
+        return self._start_bot(bot_id, timeout, verbose) == STATUS_STARTED
+
+    def _start_bot(self, bot_id, timeout=None, verbose=True, wait_capacity=False):
+        """Запускает контейнер бота и ждет подключения, возвращает STATUS_*
+
+        Если на хосте не хватает ресурсов, запуск отклоняется, а с
+        wait_capacity ждет освобождения ресурсов в пределах таймаута.
+        """
+        say = self.echo if verbose else (lambda *args, **kwargs: None)
+        timeout = timeout or START_TIMEOUT
+        created = time.time()
+        phases = {}
+
+        def finish(status, cause=None):
+            self.metrics.record(bot_id, created, phases, status, cause)
+            self._status_cache = None
+            return status
 
-    def start_bot(self, bot_id):
         if bot_id not in self.config["bots"]:
-            print(f"Бот с ID {bot_id} не найден!")
-            return
+            self.echo(f"Бот с ID {bot_id} не найден!")
+            return STATUS_FAILED
+
+        try:
+            host = self._placed_host(bot_id)
+        except DockerError as e:
+            self.echo(f"Не удалось выбрать хост для бота {bot_id}: {e}")
+            return finish(STATUS_FAILED, "docker")
+        # Скачивание образа и расширения не входит в таймаут готовности
+        host.images.wait()
+        if host.local:
+            self.extension_cache.wait()
+        deadline = time.monotonic() + timeout
         
         bot = self.config["bots"][bot_id]
         proxy_file_path = os.path.abspath(bot['proxy_file'])
         
         # Проверяем файл прокси
         if not os.path.exists(proxy_file_path):
-            print(f"Ошибка: файл прокси {proxy_file_path} не найден!")
-            return
+            self.echo(f"Ошибка: файл прокси {proxy_file_path} не найден!")
+            return finish(STATUS_FAILED, "proxy_file")
         
         with open(proxy_file_path, 'r') as f:
             proxy_content = f.read().strip()
             if not proxy_content:
-                print("Ошибка: файл прокси пустой!")
-                return
-            print(f"Прокси для запуска: {proxy_content}")
-        
-        cmd = [
-            "docker", "run", "-d",
-            "--name", f"gradient-bot-{bot_id}",
-            "-e", f"APP_USER={bot['email']}",
-            "-e", f"APP_PASS={bot['password']}",
-            "-v", f"{proxy_file_path}:/app/proxies.txt",
-            "overtrue/gradient-bot"
-        ]
+                self.echo("Ошибка: файл прокси пустой!")
+                return finish(STATUS_FAILED, "proxy_file")
+            say(f"Прокси для запуска: {proxy_content}")
         
+        if not host.resources.acquire(deadline if wait_capacity else None):
+            self.echo(f"Недостаточно ресурсов хоста {host.name} для запуска бота {bot_id} (см. оценку емкости)")
+            return finish(STATUS_FAILED, "capacity")
         try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-            container_id = result.stdout.strip()
-            print(f"Бот {bot_id} запущен, ID контейнера: {container_id[:12]}")
+            try:
+                created = time.time()
+                pack = bot.get("pack")
+                if pack:
+                    # Бот живет в контейнере-паке: запускается его процесс pm2
+                    container_id, since = self._start_packed_bot(bot_id, bot, deadline, host)
+                    say(f"Бот {bot_id} запущен в паке {pack}, ID контейнера: {container_id[:12]}")
+                else:
+                    container_id, since = self._run_bot_container(bot_id, bot, proxy_file_path, deadline, host), None
+                    say(f"Бот {bot_id} запущен, ID контейнера: {container_id[:12]}")
+                if len(self.hosts) > 1:
+                    say(f"Хост: {host.name}")
             
-            print("Проверка запуска (ожидание до 180 секунд)...")
-            for i in range(18):  # 18 проверок по 10 секунд
-                time.sleep(10)
-                print(f"Прошло {(i+1)*10} секунд...")
-                
-                logs = subprocess.run(["docker", "logs", container_id], 
-                                    capture_output=True, text=True).stdout
-                
-                # Проверяем успешный вход
-                if "Logged in! Waiting for open extension..." in logs:
-                    print("Бот успешно вошел в систему...")
-                
-                # Проверяем загрузку расширения
-                if "Extension loaded!" in logs:
-                    print("Расширение успешно загружено...")
-                
-                # Проверяем подключение
-                if "Connected! Starting rolling..." in logs:
-                    print("Бот подключился к сервису...")
+                say(f"Проверка запуска (ожидание до {timeout} секунд)...")
+                status, logs, parser = self._wait_ready(container_id, deadline, say, phases,
+                                                        process=bot_id if pack else None, since=since,
+                                                        docker=host.docker)
+
+                if status == STATUS_STARTED:
+                    self._remember_support_status(bot_id, parser.support_status)
+                    say("Бот подключился к сервису...")
                     # Даже если статус Disconnected, продолжаем работу
-                    print("\nПолные логи запуска:")
-                    print(logs)
-                    if "{ support_status: 'Disconnected' }" in logs:
-                        print("\n⚠️ Предупреждение: Бот запущен со статусом Disconnected")
-                        print("Это нормально, статус может измениться позже")
-                    else:
-                        print("\nБот успешно запущен и работает!")
-                    return True
-                
-                # Проверяем критические ошибки
-                if "No proxies.txt found" in logs or "Please set APP_USER" in logs:
-                    print("\nКритическая ошибка в конфигурации!")
-                    print(logs)
-                    print("\nОстанавливаем бота...")
-                    subprocess.run(["docker", "stop", container_id])
-                    subprocess.run(["docker", "rm", container_id])
-                    return False
-            
-            # Если дошли сюда - бот не смог подключиться совсем
-            print("\nПолные логи запуска:")
-            print(logs)
-            print("\nБот не смог подключиться к сервису за отведенное время")
-            print("Останавливаем бота...")
-            subprocess.run(["docker", "stop", container_id])
-            subprocess.run(["docker", "rm", container_id])
-            return False
+                    say("\nПолные логи запуска:")
+                    say(logs)
+                    if parser.disconnected:
+                        self.echo(f"\n⚠️ Предупреждение: Бот {bot_id} запущен со статусом Disconnected")
+                        self.echo("Это нормально, статус может измениться позже")
+                        return finish(STATUS_STARTED, "disconnected")
+                    say("\nБот успешно запущен и работает!")
+                    return finish(STATUS_STARTED)
+
+                if status == STATUS_FAILED:
+                    self.echo(f"\nКритическая ошибка в конфигурации бота {bot_id}!")
+                    self.echo(logs)
+                else:
+                    # Если дошли сюда - бот не смог подключиться совсем
+                    say("\nПолные логи запуска:")
+                    say(logs)
+                    self.echo(f"\nБот {bot_id} не смог подключиться к сервису за отведенное время")
+                self.echo("Останавливаем бота...")
+                if pack:
+                    self._stop_packed_bots(container_id, [bot_id], host.docker)
+                else:
+                    self._remove_container(container_id, host.docker)
+                    self._forget_container(bot_id)
+                return finish(status, "config" if status == STATUS_FAILED else "not_connected")
             
-        except subprocess.CalledProcessError as e:
-            print(f"Ошибка при запуске бота: {e}")
-            print(f"Stderr: {e.stderr}")
+            except TimeoutError:
+                self.echo(f"Таймаут при создании контейнера бота {bot_id}")
+                return finish(STATUS_TIMEOUT, "create_timeout")
+            except DockerError as e:
+                self.echo(f"Ошибка при запуске бота {bot_id}: {e}")
+                return finish(STATUS_FAILED, "docker")
+        finally:
+            host.resources.release()
+
+    def _remember_support_status(self, bot_id, support_status):
+        """Сохраняет в конфигурации последний support_status из логов запуска"""
+        if not support_status or bot_id not in self.config["bots"]:
+            return
+        bot = self.config["bots"][bot_id]
+        bot["support_status"] = support_status
+        self.config["bots"][bot_id] = bot
+
+    def _run_bot_container(self, bot_id, bot, proxy_file_path, deadline, host):
+        options = dict(
+            env={"APP_USER": bot['email'], "APP_PASS": bot['password'], **lean_env()},
+            binds=[f"{proxy_file_path}:/app/proxies.txt"],
+            labels={LABEL_MANAGED: "true", LABEL_BOT_ID: bot_id, **lean_label()},
+            memory=BOT_MEMORY_LIMIT or None,
+            cpus=BOT_CPU_LIMIT or None,
+            **container_health_options(),
+        )
+        if not host.local:
+            # Удаленный демон не видит файлы менеджера - прокси передается через окружение
+            with open(proxy_file_path, 'r', encoding='utf-8') as f:
+                options["env"]["PROXY"] = f.read().strip()
+            options["binds"] = []
+        elif self.extension_cache.enabled:
+            options["binds"].append(self.extension_cache.bind())
+        # Свободный контейнер из пула быстрее, чем docker run
+        container_id = host.pool.claim(bot_id, bot, proxy_file_path, deadline)
+        if container_id is None:
+            container_id = self._run_named_container(f"gradient-bot-{bot_id}", deadline, options, host.docker)
+        with self._config_lock:
+            self._container_ids[bot_id] = container_id
+        return container_id
+
+    def _run_named_container(self, name, deadline, options, docker):
+        try:
+            container_id = docker.run(name, BOT_IMAGE, timeout=max(deadline - time.monotonic(), 1), **options)
+        except DockerError as e:
+            if "409" not in str(e) and "already in use" not in str(e):
+                raise
+            # От прошлого запуска остался контейнер с тем же именем - заменяем его
+            self.echo(f"Удаляем старый контейнер {name}...")
+            self._remove_container(name, docker)
+            container_id = docker.run(name, BOT_IMAGE, timeout=max(deadline - time.monotonic(), 1), **options)
+        return container_id
+
+    def host_of(self, bot_id):
+        """Хост, на котором работает бот (по конфигурации)"""
+        bot = self.config["bots"].get(bot_id) or {}
+        return self.hosts.get(bot.get("host")) or self.default_host
+
+    def docker_for(self, bot_id):
+        return self.host_of(bot_id).docker
+
+    def _needs_host(self, bot):
+        host = self.hosts.get(bot.get("host"))
+        return host is None or (not host.available() and host.failed_over())
+
+    def _placed_host(self, bot_id):
+        """Хост бота; если хоста нет или он давно недоступен, бот (с паком) размещается заново"""
+        bot = self.config["bots"][bot_id]
+        if self._needs_host(bot):
+            self.place_bots([self.pack_members(bot["pack"]) if bot.get("pack") else [bot_id]])
+        return self.host_of(bot_id)
+
+    def place_bots(self, units):
+        """Назначает хосты ботам, у которых хоста нет или он недоступен дольше HOST_FAILOVER
+
+        units - списки ботов, которые должны оказаться на одном хосте (пак).
+        Каждая группа уходит на доступный хост с наибольшим запасом емкости.
+        Возвращает {ID бота: имя хоста} для размещенных ботов.
+        """
+        with self._placement_lock:
+            units = [[bot_id for bot_id in unit if self._needs_host(self.config["bots"][bot_id])] for unit in units]
+            units = [unit for unit in units if unit]
+            if not units:
+                return {}
+            hosts = [host for host in self.hosts.values() if host.available()]
+            if not hosts:
+                raise DockerError("нет доступных Docker-хостов")
+
+            free = {}
+            for host in hosts:
+                if len(hosts) == 1:
+                    free[host.name] = 0
+                    break
+                try:
+                    host.resources.sample()
+                except (DockerError, TimeoutError):
+                    pass
+                plan = host.resources.plan()
+                free[host.name] = plan["fits"] if plan else 0
+
+            placed = {}
+            with self.store.batch():
+                for unit in units:
+                    # При равенстве побеждает хост, указанный раньше
+                    name = max(free, key=free.get)
+                    free[name] -= len(unit)
+                    for bot_id in unit:
+                        bot = self.config["bots"][bot_id]
+                        if bot.get("host") and bot["host"] != name:
+                            self.echo(f"Бот {bot_id} переносится с хоста {bot['host']} на {name}")
+                            self._forget_container(bot_id)
+                        bot["host"] = name
+                        self.config["bots"][bot_id] = bot
+                        placed[bot_id] = name
+            self.save_config()
+            return placed
+
+    def _pack_lock(self, pack):
+        with self._config_lock:
+            return self._pack_locks.setdefault(pack, threading.Lock())
+
+    def _pack_index(self):
+        """Возвращает {пак: [ID ботов]} по конфигурации"""
+        packs = {}
+        for bot_id, bot in self.config["bots"].items():
+            if bot.get("pack"):
+                packs.setdefault(bot["pack"], []).append(bot_id)
+        return packs
+
+    def pack_members(self, pack):
+        return self._pack_index().get(pack, [])
+
+    def _pack_accounts(self, pack):
+        accounts = []
+        for bot_id in self.pack_members(pack):
+            bot = self.config["bots"][bot_id]
+            with open(bot["proxy_file"], 'r', encoding='utf-8') as f:
+                proxy = f.read().strip()
+            accounts.append({"name": bot_id, "user": bot["email"], "pass": bot["password"], "proxy": proxy})
+        return accounts
+
+    def _write_pack_accounts(self, pack):
+        """Пишет accounts.json пака по конфигурации, возвращает путь к файлу"""
+        accounts = self._pack_accounts(pack)
+        os.makedirs(PACK_DIR, exist_ok=True)
+        path = os.path.abspath(os.path.join(PACK_DIR, f"{pack}.json"))
+        # Файл смонтирован в работающий контейнер - пишем на месте, чтобы не сменился inode
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(accounts, f, ensure_ascii=False, indent=2)
+        return path
+
+    def _run_pack_container(self, pack, deadline, host):
+        bot_ids = self.pack_members(pack)
+        options = dict(
+            labels={LABEL_MANAGED: "true", LABEL_PACK: pack, LABEL_PACK_BOTS: ",".join(bot_ids), **lean_label()},
+            # start.js передает окружение контейнера процессам pm2 всех аккаунтов
+            env=lean_env(),
+            # Ограничения заданы на одного бота - пак получает их сумму
+            memory=parse_size(BOT_MEMORY_LIMIT) * len(bot_ids) if BOT_MEMORY_LIMIT else None,
+            cpus=float(BOT_CPU_LIMIT) * len(bot_ids) if BOT_CPU_LIMIT else None,
+            **container_health_options(),
+        )
+        if host.local:
+            options["binds"] = [f"{self._write_pack_accounts(pack)}:/app/accounts.json"]
+            if self.extension_cache.enabled:
+                options["binds"].append(self.extension_cache.bind())
+        else:
+            options["env"]["ACCOUNTS"] = json.dumps(self._pack_accounts(pack), ensure_ascii=False)
+        container_id = self._run_named_container(f"gradient-pack-{pack}", deadline, options, host.docker)
+        with self._config_lock:
+            for bot_id in bot_ids:
+                self._container_ids[bot_id] = container_id
+        return container_id
+
+    def _start_packed_bot(self, bot_id, bot, deadline, host):
+        """Запускает бота в его паке: весь контейнер пака или один процесс pm2 в работающем
+
+        Возвращает (ID контейнера, since) - с какого момента смотреть логи.
+        """
+        pack = bot["pack"]
+        with self._pack_lock(pack):
+            containers = host.docker.ps(all=True, filters={"label": [f"{LABEL_PACK}={pack}"]})
+            container = next((c for c in containers if c["state"] == "running"), None)
+            if container is None:
+                for stale in containers:
+                    self._remove_container(stale["id"], host.docker)
+                return self._run_pack_container(pack, deadline, host), None
+
+            with self._config_lock:
+                self._container_ids[bot_id] = container["id"]
+            process = self.pack_processes(container["id"], host.docker).get(bot_id)
+            if process and process["status"] == "online":
+                # Процесс уже поднят (например, вместе со всем паком) - только ждем готовности
+                return container["id"], process["started"]
+            env = {"ONLY": bot_id}
+            if host.local:
+                self._write_pack_accounts(pack)
+            else:
+                env["ACCOUNTS"] = json.dumps(self._pack_accounts(pack), ensure_ascii=False)
+            since = time.time() - 1
+            host.docker.exec(container["id"], ["node", "/app/start.js"], env=env,
+                             timeout=max(deadline - time.monotonic(), 1))
+            return container["id"], since
+
+    def pack_processes(self, container_id, docker):
+        """Процессы pm2 контейнера-пака: {имя: {"status", "started", "restarts"}}"""
+        output = docker.exec(container_id, ["pm2", "jlist"], timeout=30)
+        listing = next((line for line in reversed(output.splitlines()) if line.startswith("[")), "[]")
+        try:
+            processes = json.loads(listing)
+        except ValueError:
+            raise DockerError(f"pm2 jlist: неожиданный ответ: {output[:200]}")
+        return {
+            process["name"]: {
+                "status": process.get("pm2_env", {}).get("status", ""),
+                "started": (process.get("pm2_env", {}).get("pm_uptime") or 0) / 1000,
+                "restarts": process.get("pm2_env", {}).get("restart_time", 0),
+            }
+            for process in processes
+        }
+
+    def _stop_packed_bots(self, container_id, bot_ids, docker):
+        """Останавливает процессы ботов в контейнере-паке, не трогая остальных"""
+        def stop(bot_id):
+            try:
+                docker.exec(container_id, ["pm2", "delete", bot_id], timeout=STOP_TIMEOUT + 30)
+                result = TEARDOWN_REMOVED
+            except DockerError as e:
+                result = TEARDOWN_NOT_FOUND if "not found" in str(e) else str(e)
+            except TimeoutError as e:
+                result = str(e)
+            self._forget_container(bot_id)
+            return bot_id, result
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(bot_ids), BULK_WORKERS))) as pool:
+            return dict(pool.map(stop, bot_ids))
+
+    def _start_pack(self, pack, timeout=None):
+        """Запускает контейнер-пак и ждет подключения каждого бота, возвращает {ID бота: STATUS_*}"""
+        timeout = timeout or START_TIMEOUT
+        bot_ids = self.pack_members(pack)
+        created = time.time()
+        phases = {bot_id: {} for bot_id in bot_ids}
+
+        def finish(statuses, causes):
+            for bot_id, status in statuses.items():
+                self.metrics.record(bot_id, created, phases[bot_id], status, causes.get(bot_id))
+            self._status_cache = None
+            return statuses
+
+        try:
+            host = self._placed_host(bot_ids[0])
+        except DockerError as e:
+            self.echo(f"Не удалось выбрать хост для пака {pack}: {e}")
+            return finish(dict.fromkeys(bot_ids, STATUS_FAILED), dict.fromkeys(bot_ids, "docker"))
+        host.images.wait()
+        if host.local:
+            self.extension_cache.wait()
+        deadline = time.monotonic() + timeout
+
+        if not host.resources.acquire(deadline, count=len(bot_ids)):
+            self.echo(f"Недостаточно ресурсов хоста {host.name} для запуска пака {pack} ({len(bot_ids)} ботов)")
+            return finish(dict.fromkeys(bot_ids, STATUS_FAILED), dict.fromkeys(bot_ids, "capacity"))
+        try:
+            with self._pack_lock(pack):
+                try:
+                    container_id = self._run_pack_container(pack, deadline, host)
+                except OSError as e:
+                    self.echo(f"Ошибка: не удалось подготовить аккаунты пака {pack}: {e}")
+                    return finish(dict.fromkeys(bot_ids, STATUS_FAILED), dict.fromkeys(bot_ids, "proxy_file"))
+                except TimeoutError:
+                    self.echo(f"Таймаут при создании контейнера пака {pack}")
+                    return finish(dict.fromkeys(bot_ids, STATUS_TIMEOUT), dict.fromkeys(bot_ids, "create_timeout"))
+                except DockerError as e:
+                    self.echo(f"Ошибка при запуске пака {pack}: {e}")
+                    return finish(dict.fromkeys(bot_ids, STATUS_FAILED), dict.fromkeys(bot_ids, "docker"))
+            results = self._watch_logs(container_id, deadline, lambda *args, **kwargs: None, phases,
+                                       docker=host.docker)
+        finally:
+            host.resources.release(len(bot_ids))
+
+        statuses, causes = {}, {}
+        for bot_id, (status, logs, parser) in results.items():
+            statuses[bot_id] = status
+            if status == STATUS_STARTED:
+                self._remember_support_status(bot_id, parser.support_status)
+                causes[bot_id] = "disconnected" if parser.disconnected else None
+            elif status == STATUS_FAILED:
+                self.echo(f"\nКритическая ошибка в конфигурации бота {bot_id}!")
+                self.echo(logs)
+                causes[bot_id] = "config"
+            else:
+                self.echo(f"\nБот {bot_id} не смог подключиться к сервису за отведенное время")
+                causes[bot_id] = "not_connected"
+        failed = [bot_id for bot_id, status in statuses.items() if status != STATUS_STARTED]
+        if failed:
+            self._stop_packed_bots(container_id, failed, host.docker)
+        return finish(statuses, causes)
+
+    def _remove_container(self, container_id, docker=None):
+        docker = docker or self.docker
+        try:
+            docker.stop(container_id)
+        except (DockerError, TimeoutError):
+            pass
+        try:
+            docker.remove(container_id, force=True)
+            return True
+        except DockerError as e:
+            self.echo(f"Не удалось удалить контейнер {container_id[:12]}: {e}")
             return False
 
+    def find_container(self, bot_id):
+        """Возвращает ID контейнера бота: из кэша или одним запросом по метке"""
+        with self._config_lock:
+            container_id = self._container_ids.get(bot_id)
+        if container_id:
+            return container_id
+
+        pack = self.config["bots"].get(bot_id, {}).get("pack")
+        label = f"{LABEL_PACK}={pack}" if pack else f"{LABEL_BOT_ID}={bot_id}"
+        host = self.host_of(bot_id)
+        if self.events.synced(host.name):
+            key, _, value = label.partition("=")
+            containers = [c for c in self.events.containers([host.name]) if c["labels"].get(key) == value]
+            if containers:
+                containers.sort(key=lambda container: container["state"] != "running")
+                return containers[0]["id"]
+        docker = host.docker
+        containers = docker.ps(all=True, filters={"label": [label]})
+        if not containers and not pack:
+            # Контейнеры, созданные до появления меток, ищем по имени
+            containers = docker.ps(all=True, filters={"name": [f"^/?gradient-bot-{re.escape(bot_id)}$"]})
+        if not containers:
+            return None
+
+        # Предпочитаем запущенный контейнер
+        containers.sort(key=lambda container: container["state"] != "running")
+        container_id = containers[0]["id"]
+        with self._config_lock:
+            self._container_ids[bot_id] = container_id
+        return container_id
+
+    def _forget_container(self, bot_id):
+        with self._config_lock:
+            self._container_ids.pop(bot_id, None)
+
+    def _wait_ready(self, container_id, deadline, say=None, phases=None, process=None, since=None, docker=None):
+        """Следит за логами бота до подключения, критической ошибки или дедлайна
+
+        В phases (если передан) записывается время входа, загрузки
+        расширения и подключения по меткам console-stamp. process - имя
+        процесса pm2, если бот работает в контейнере-паке. Возвращает
+        (STATUS_*, логи, LogParser).
+        """
+        phases = {} if phases is None else phases
+        return self._watch_logs(container_id, deadline, say or self.echo, {process: phases}, since, docker)[process]
+
+    def _watch_logs(self, container_id, deadline, say, phases, since=None, docker=None):
+        """Следит за логами контейнера, пока каждый процесс не подключится или не упадет
+
+        phases - {имя процесса pm2: словарь фаз}; имя None означает весь
+        контейнер без разбора префиксов pm2. С since учитываются только
+        строки с меткой времени не раньше since. Каждая строка разбирается
+        один раз LogParser процесса. Возвращает {имя: (STATUS_*, логи, LogParser)}.
+        """
+        pending = {name: [] for name in phases}
+        parsers = {name: LogParser(bot_phases) for name, bot_phases in phases.items()}
+        results = {}
+        started = time.monotonic()
+        last_report = started
+
+        stream = (docker or self.docker).follow_logs(container_id, deadline,
+                                                     tail=None if since is None else PACK_LOG_TAIL)
+        try:
+            for line in stream:
+                if line is None:
+                    # Ничего нового за интервал - просто сообщаем о прогрессе
+                    now = time.monotonic()
+                    if now - last_report >= 10:
+                        say(f"Прошло {int(now - started)} секунд...")
+                        last_report = now
+                    continue
+
+                name = None
+                if None not in pending:
+                    match = PM2_LOG_PREFIX.match(line)
+                    name = match.group("name") if match else None
+                lines = pending.get(name)
+                if lines is None:
+                    continue
+                if since is not None:
+                    stamp = parse_log_timestamp(line)
+                    if stamp is not None and stamp < since:
+                        continue
+                lines.append(line)
+                parser = parsers[name]
+                event = parser.feed(line)
+                if event is None:
+                    continue
+
+                if event.kind == LOG_EVENT_LOGIN:
+                    say("Бот успешно вошел в систему...")
+                elif event.kind == LOG_EVENT_EXTENSION:
+                    say("Расширение успешно загружено...")
+
+                if parser.connected:
+                    status = STATUS_STARTED
+                elif parser.failed:
+                    # Критическая ошибка
+                    status = STATUS_FAILED
+                else:
+                    continue
+                results[name] = (status, "".join(pending.pop(name)), parser)
+                if not pending:
+                    break
+        finally:
+            stream.close()
+
+        for name, lines in pending.items():
+            results[name] = (STATUS_TIMEOUT, "".join(lines), parsers[name])
+        return results
+
     def stop_bot(self, bot_id):
         if bot_id not in self.config["bots"]:
-            print(f"Бот с ID {bot_id} не найден!")
+            self.echo(f"Бот с ID {bot_id} не найден!")
             return
         
-        # Получаем список всех контейнеров
-        result = subprocess.run(["docker", "ps", "-a", "--format", "{{.ID}} {{.Image}}"], 
-                              capture_output=True, text=True)
-        
-        stopped = False
-        for line in result.stdout.splitlines():
-            container_id, image = line.split()
-            if image == "overtrue/gradient-bot":
-                print(f"Останавливаем контейнер {container_id[:12]}...")
-                subprocess.run(["docker", "stop", container_id])
-                subprocess.run(["docker", "rm", container_id])
-                stopped = True
-        
-        if stopped:
-            print(f"Бот {bot_id} остановлен и контейнеры удалены")
+        result = self.teardown_bots([bot_id])[bot_id]
+        if result == TEARDOWN_REMOVED:
+            self.echo(f"Бот {bot_id} остановлен и контейнер удален")
+        elif result == TEARDOWN_NOT_FOUND:
+            self.echo(f"Не найдено запущенных контейнеров для бота {bot_id}")
+        else:
+            self.echo(f"Ошибка при остановке бота {bot_id}: {result}")
+        return result == TEARDOWN_REMOVED
+
+    def _container_bot_id(self, container):
+        """Определяет ID бота по метке контейнера или по его имени"""
+        bot_id = container["labels"].get(LABEL_BOT_ID)
+        if bot_id:
+            return bot_id
+        if container["name"].startswith("gradient-bot-"):
+            return container["name"][len("gradient-bot-"):]
+        return container["name"]
+
+    def _container_bot_ids(self, container, packs):
+        """ID ботов контейнера: все боты пака (по конфигурации или метке) или один бот"""
+        if container["labels"].get(LABEL_POOL) and container["name"].startswith("gradient-pool-"):
+            # Свободный контейнер пула еще не принадлежит ни одному боту
+            return []
+        pack = container["labels"].get(LABEL_PACK)
+        if not pack:
+            return [self._container_bot_id(container)]
+        return packs.get(pack) or [bot_id for bot_id in container["labels"].get(LABEL_PACK_BOTS, "").split(",") if bot_id]
+
+    def _resolve_containers(self, bot_ids):
+        """Возвращает [(bot_id, контейнер)] для набора ботов или для всех (ALL_BOTS)"""
+        if bot_ids != ALL_BOTS and len(bot_ids) == 1 and not self.config["bots"].get(next(iter(bot_ids)), {}).get("pack"):
+            bot_id = next(iter(bot_ids))
+            container_id = self.find_container(bot_id)
+            if not container_id:
+                return []
+            return [(bot_id, {"id": container_id, "state": "running", "labels": {}, "host": self.host_of(bot_id).name})]
+
+        # Один запрос на каждый хост вместо отдельного поиска для каждого бота
+        containers = {c["id"]: c for c in self._managed_containers()}
+        if bot_ids == ALL_BOTS:
+            # Контейнеры, созданные до появления меток (в том числе из прежнего образа)
+            for container in self._fleet_ps({"ancestor": list(dict.fromkeys([BOT_IMAGE, LEGACY_BOT_IMAGE]))}):
+                containers.setdefault(container["id"], container)
+        wanted = None if bot_ids == ALL_BOTS else set(bot_ids)
+        packs = self._pack_index()
+        return [
+            (bot_id, container)
+            for container in containers.values()
+            for bot_id in self._container_bot_ids(container, packs)
+            if wanted is None or bot_id in wanted
+        ]
+
+    def _fleet_ps(self, filters, hosts=None):
+        """docker ps на всех (или перечисленных) хостах; у контейнеров появляется поле host
+
+        Недоступный хост пропускается, если ответил хотя бы один другой.
+        """
+        targets = [self.hosts[name] for name in hosts] if hosts else list(self.hosts.values())
+
+        def ps(host):
+            try:
+                containers = host.docker.ps(all=True, filters=filters)
+            except (DockerError, TimeoutError) as e:
+                host.mark(False)
+                return host, e, []
+            host.mark(True)
+            return host, None, [dict(container, host=host.name) for container in containers]
+
+        if len(targets) == 1:
+            results = [ps(targets[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+                results = list(pool.map(ps, targets))
+        errors = [(host, error) for host, error, _ in results if error]
+        if errors and len(errors) == len(results):
+            raise errors[0][1]
+        for host, error in errors:
+            self.echo(f"Docker-хост {host.name} недоступен: {error}")
+        return [container for _, _, containers in results for container in containers]
+
+    def _managed_containers(self, hosts=None):
+        """Управляемые контейнеры всех (или перечисленных) хостов
+
+        Для хостов с живой подпиской на docker events состояние берется из
+        памяти, остальные опрашиваются через docker ps.
+        """
+        names = list(hosts) if hosts else list(self.hosts)
+        synced = [name for name in names if self.events.synced(name)]
+        rest = [name for name in names if name not in synced]
+        containers = self.events.containers(synced)
+        if rest:
+            containers += self._fleet_ps({"label": [LABEL_MANAGED]}, rest)
+        return containers
+
+    def watch_events(self):
+        """Включает состояние контейнеров в памяти по docker events (BOT_WATCH_EVENTS)"""
+        if WATCH_EVENTS:
+            self.events.start()
+
+    def _bot_hosts(self):
+        """{bot_id: имя хоста}; боты без известного хоста относятся к хосту по умолчанию"""
+        return {
+            bot_id: bot["host"] if bot.get("host") in self.hosts else self.default_host.name
+            for bot_id, bot in self.config["bots"].items()
+        }
+
+    def container_states(self, processes=False, strays=None, hosts=None):
+        """Возвращает {bot_id: контейнер} для всех ботов одним запросом docker ps на хост
+
+        С processes для ботов в работающих паках состояние берется из pm2
+        (один вызов pm2 jlist на пак). Контейнеры бота на чужом хосте
+        (остались после переноса) не учитываются, а добавляются в strays
+        как (bot_id, контейнер), если список передан.
+        """
+        states = {}
+        packs = self._pack_index()
+        assigned = self._bot_hosts() if len(self.hosts) > 1 else {}
+        for container in self._managed_containers(hosts):
+            for bot_id in self._container_bot_ids(container, packs):
+                if assigned.get(bot_id, container["host"]) != container["host"]:
+                    if strays is not None:
+                        strays.append((bot_id, container))
+                    continue
+                current = states.get(bot_id)
+                # Если у бота несколько контейнеров, важен работающий
+                if current is None or (current["state"] != "running" and container["state"] == "running"):
+                    states[bot_id] = container
+        if not processes:
+            return states
+
+        running_packs = {container["id"]: container for container in states.values()
+                         if container["labels"].get(LABEL_PACK) and container["state"] == "running"}
+        for container_id, container in running_packs.items():
+            try:
+                pm2 = self.pack_processes(container_id, self.hosts[container["host"]].docker)
+            except (DockerError, TimeoutError) as e:
+                self.echo(f"Не удалось получить процессы пака {container['labels'][LABEL_PACK]}: {e}")
+                continue
+            for bot_id in self._container_bot_ids(container, packs):
+                process = pm2.get(bot_id, {})
+                status = process.get("status")
+                states[bot_id] = dict(container, state="running" if status == "online" else "exited",
+                                      status=f"pm2: {status or 'нет процесса'}",
+                                      started=process.get("started"), restarts=process.get("restarts"))
+        return states
+
+    def fleet_status(self, max_age=STATUS_CACHE_TTL):
+        """Живое состояние ботов: {bot_id: {"state", "status", "host", "uptime", "restarts", "health"}}
+
+        Весь парк - один docker ps и один docker inspect на хост (у ботов в
+        паках время запуска и перезапуски берутся из pm2). Для хостов с
+        подпиской на docker events одиночные контейнеры берутся из памяти,
+        inspect нужен только пакам (отчет healthcheck). health - состояние
+        healthcheck (healthy, unhealthy, starting или None); у бота в паке -
+        по его собственному пульсу. Результат кэшируется на max_age секунд.
+        """
+        cached = self._status_cache
+        if cached and time.monotonic() - cached[0] < max_age:
+            return cached[1]
+
+        states = self.container_states(processes=True)
+        by_host = {}
+        details = {}
+        for container in states.values():
+            if self.events.synced(container["host"]) and not container["labels"].get(LABEL_PACK):
+                details[container["id"]] = container
+                continue
+            by_host.setdefault(container["host"], set()).add(container["id"])
+        for name, container_ids in by_host.items():
+            try:
+                details.update(self.hosts[name].docker.inspect_many(sorted(container_ids)))
+            except (DockerError, TimeoutError) as e:
+                self.echo(f"Не удалось получить подробности контейнеров на хосте {name}: {e}")
+
+        now = time.time()
+        fleet = {}
+        for bot_id, container in states.items():
+            info = details.get(container["id"], {})
+            started = container.get("started", info.get("started"))
+            running = container["state"] in ("running", "restarting")
+            fleet[bot_id] = {
+                "state": container["state"],
+                "status": container["status"],
+                "host": container["host"],
+                "uptime": max(now - started, 0) if running and started else None,
+                "restarts": container.get("restarts", info.get("restarts")),
+                "health": self._bot_health(bot_id, container, info) if running else None,
+            }
+        self._status_cache = (time.monotonic(), fleet)
+        return fleet
+
+    @staticmethod
+    def _bot_health(bot_id, container, info):
+        """Здоровье бота по healthcheck контейнера; у пака - по строке бота в отчете healthcheck.js"""
+        health = info.get("health")
+        report = info.get("health_report")
+        if health and container["labels"].get(LABEL_PACK) and report is not None:
+            beat = report.get(bot_id)
+            if beat is None:
+                # Пульса еще нет - бот входит в аккаунт, если запущен недавно
+                started = container.get("started")
+                recent = started and time.time() - started < START_TIMEOUT
+                return "starting" if container["state"] == "running" and recent else "unhealthy"
+            return "healthy" if beat.get("ok") else "unhealthy"
+        return health
+
+    def teardown_bots(self, bot_ids=ALL_BOTS, timeout=None, batch_size=None):
+        """Останавливает и удаляет контейнеры ботов пачками параллельно
+
+        Возвращает {bot_id: результат}, где результат - TEARDOWN_REMOVED,
+        TEARDOWN_NOT_FOUND или текст ошибки.
+        """
+        results = {} if bot_ids == ALL_BOTS else {bot_id: TEARDOWN_NOT_FOUND for bot_id in bot_ids}
+        self._status_cache = None
+        containers = self._resolve_containers(bot_ids)
+        if not containers:
+            return results
+
+        # Если из пака останавливается только часть ботов, контейнер остается работать,
+        # а у этих ботов удаляются процессы pm2
+        if bot_ids != ALL_BOTS:
+            packs = self._pack_index()
+            wanted = set(bot_ids)
+            partial = {}
+            for bot_id, container in containers:
+                if container["labels"].get(LABEL_PACK) and not wanted.issuperset(self._container_bot_ids(container, packs)):
+                    partial.setdefault(container["id"], (container, []))[1].append(bot_id)
+            for container_id, (container, pack_bots) in partial.items():
+                # В остановленном паке процессов нет - такие боты остаются TEARDOWN_NOT_FOUND
+                if container["state"] == "running":
+                    docker = self.hosts[container["host"]].docker
+                    results.update(self._stop_packed_bots(container_id, pack_bots, docker))
+            containers = [(bot_id, container) for bot_id, container in containers if container["id"] not in partial]
+
+        by_host = {}
+        for bot_id, container in containers:
+            by_host.setdefault(container["host"], []).append((bot_id, container))
+        for name, host_containers in by_host.items():
+            self.teardown_containers(self.hosts[name].docker, host_containers, timeout, batch_size, results)
+        return results
+
+    def teardown_containers(self, docker, containers, timeout=None, batch_size=None, results=None):
+        """Останавливает и удаляет контейнеры [(bot_id, контейнер)] одного хоста пачками параллельно"""
+        timeout = STOP_TIMEOUT if timeout is None else timeout
+        batch_size = max(1, batch_size or STOP_BATCH)
+        results = {} if results is None else results
+
+        # Остановка нужна только работающим контейнерам
+        # Контейнер пака встречается по разу на каждого бота - останавливаем и удаляем его один раз
+        running = list(dict.fromkeys(c["id"] for _, c in containers if c["state"] in ("running", "restarting", "paused")))
+        batches = [running[i:i + batch_size] for i in range(0, len(running), batch_size)]
+        errors = {}
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(len(batches), BULK_WORKERS)) as pool:
+                for batch_errors in pool.map(lambda batch: docker.stop_many(batch, timeout), batches):
+                    errors.update(batch_errors)
+
+        # Удаляем все контейнеры одним вызовом, force добивает не остановившиеся
+        remove_errors = docker.remove_many(list(dict.fromkeys(c["id"] for _, c in containers)), force=True)
+
+        for bot_id, container in containers:
+            error = remove_errors.get(container["id"])
+            if error and "No such container" in error and container["id"] in errors:
+                error = errors[container["id"]]
+            if results.get(bot_id) not in (None, TEARDOWN_NOT_FOUND, TEARDOWN_REMOVED):
+                continue
+            results[bot_id] = error or TEARDOWN_REMOVED
+            self._forget_container(bot_id)
+        return results
+
+    def capacity_report(self):
+        """Показывает потребление ресурсов ботами и оценку емкости каждого хоста
+
+        Возвращает {имя хоста: оценка емкости или None}.
+        """
+        plans = {}
+        for host in self.hosts.values():
+            if len(self.hosts) > 1:
+                self.echo(f"\n##### Хост {host.name} #####")
+            if not host.available(force=True):
+                self.echo("Хост недоступен")
+                plans[host.name] = None
+                continue
+            plans[host.name] = self._host_capacity_report(host)
+        return plans
+
+    def _host_capacity_report(self, host):
+        self.echo("\n=== Ресурсы ботов и емкость хоста ===")
+        host.resources.sample(force=True)
+        usage = host.resources.per_bot()
+        if usage:
+            self.echo(f"{'ID':<30} {'CPU, %':>8} {'Память, МБ':>12} {'Режим':>10}")
+            for bot_id, (cpu, memory) in sorted(usage.items()):
+                mode = "экономный" if host.resources.is_lean(bot_id) else "обычный"
+                self.echo(f"{bot_id:<30} {cpu:>8.1f} {memory / 2**20:>12.0f} {mode:>10}")
+            # Замеренная память на бота по режимам браузера - видно, сколько дает LEAN_MODE
+            modes = host.resources.per_mode()
+            for mode, title in (("full", "обычный режим"), ("lean", "экономный режим")):
+                if mode in modes:
+                    count, memory = modes[mode]
+                    self.echo(f"Память на бота, {title}: {memory / 2**20:.0f} МБ (ботов: {count})")
+            if len(modes) == 2:
+                saving = 1 - modes["lean"][1] / modes["full"][1]
+                self.echo(f"Экономия памяти в экономном режиме: {saving:.0%}")
         else:
-            print(f"Не найдено запущенных контейнеров для бота {bot_id}")
+            self.echo("Нет работающих ботов для замера")
+
+        plan = host.resources.plan()
+        if plan is None:
+            self.echo("Не удалось прочитать ресурсы хоста (/proc/meminfo)" if host.local
+                      else "Не удалось прочитать ресурсы хоста (docker info)")
+            return None
+        self.echo(f"\nХост: {plan['cpus']} CPU, память {plan['mem_available'] / 2**30:.1f} "
+                  f"из {plan['mem_total'] / 2**30:.1f} ГБ свободно")
+        self.echo(f"На одного бота: CPU {plan['bot_cpu']:.1f}%, память {plan['bot_memory'] / 2**20:.0f} МБ"
+                  + ("" if plan["running"] else " (ожидаемое значение, замеров еще нет)"))
+        self.echo(f"Запас: память {MEMORY_HEADROOM:.0%}, CPU {CPU_HEADROOM:.0%}")
+        self.echo(f"Поместится еще ботов: {plan['fits']} (по памяти: {plan['fit_memory']}, по CPU: {plan['fit_cpu']})")
+        return plan
+
+    def print_teardown_summary(self, results):
+        removed = sum(1 for result in results.values() if result == TEARDOWN_REMOVED)
+        missing = sum(1 for result in results.values() if result == TEARDOWN_NOT_FOUND)
+        for bot_id, result in sorted(results.items()):
+            if result not in (TEARDOWN_REMOVED, TEARDOWN_NOT_FOUND):
+                self.echo(f"  {bot_id}: {result}")
+        self.echo(f"Остановлено: {removed}, без контейнера: {missing}, "
+                  f"ошибок: {len(results) - removed - missing}")
 
     def list_bots(self, return_mapping=False):
-        print("\n=== Список ботов ===")
+        self.echo("\n=== Список ботов ===")
         bot_mapping = {}
         
         if not self.config["bots"]:
-            print("Список ботов пуст")
+            self.echo("Список ботов пуст")
             if return_mapping:
                 return bot_mapping
             return
+
+        # Состояние контейнеров всего парка одним запросом; без Docker показываем только конфигурацию
+        try:
+            fleet = self.fleet_status()
+        except (DockerError, TimeoutError) as e:
+            self.echo(f"Не удалось получить состояние контейнеров: {e}")
+            fleet = None
         
         try:
-            for index, (bot_id, bot_data) in enumerate(self.config["bots"].items(), 1):
+            bots = list(self.config["bots"].items())
+            width = max(len(bot_id) for bot_id, _ in bots)
+            packs = any(bot_data.get("pack") for _, bot_data in bots)
+            header = (f"{'№':>4}  {'ID':<{width}} {'Состояние':<14} {'Аптайм':>8} {'Рестарты':>8} "
+                      f"{'Статус':<14} {'Email':<30}" + (" Pack      " if packs else "")
+                      + (" Host" if len(self.hosts) > 1 else ""))
+            lines = [header.rstrip()]
+            for index, (bot_id, bot_data) in enumerate(bots, 1):
                 bot_mapping[str(index)] = bot_id
                 # Используем encode/decode для очистки строк от проблемных символов
                 safe_bot_id = bot_id.encode('ascii', 'ignore').decode('ascii')
                 safe_email = bot_data['email'].encode('ascii', 'ignore').decode('ascii')
-                safe_proxy = bot_data['proxy_file'].encode('ascii', 'ignore').decode('ascii')
-                
-                print(f"{index}. ID: {safe_bot_id}")
-                print(f"   Email: {safe_email}")
-                print(f"   Proxy file: {safe_proxy}")
-                print("   ---")
+                support = (bot_data.get("support_status") or "-").encode('ascii', 'ignore').decode('ascii')
+
+                live = fleet.get(bot_id) if fleet is not None else None
+                if fleet is None:
+                    state = "?"
+                elif live is None:
+                    state = "нет контейнера"
+                elif live["health"] in CONTAINER_HEALTH:
+                    state = CONTAINER_HEALTH[live["health"]]
+                else:
+                    state = CONTAINER_STATES.get(live["state"], live["state"])
+                restarts = live["restarts"] if live and live["restarts"] is not None else "-"
+                line = (f"{index:>4}. {safe_bot_id:<{width}} {state:<14} "
+                        f"{format_duration(live and live['uptime']):>8} {restarts:>8} {support[:14]:<14} {safe_email:<30}")
+                if packs:
+                    line += f" {bot_data.get('pack') or '-':<10}"
+                if len(self.hosts) > 1:
+                    line += f" {self.host_of(bot_id).name}"
+                lines.append(line.rstrip())
+            # Один вывод на весь список - тысяча ботов печатается без задержек
+            self.echo("\n".join(lines))
         except Exception as e:
-            print(f"Ошибк при выводе списка: {e}")
+            self.echo(f"Ошибк при выводе списка: {e}")
             # Очищаем конфигурацию от проблемных записей
-            clean_bots = {}
-            for bot_id, bot_data in self.config["bots"].items():
-                try:
-                    # Проверяем, можно ли безопасно вывести данные
-                    bot_id.encode('ascii', 'ignore')
-                    bot_data['email'].encode('ascii', 'ignore')
-                    bot_data['proxy_file'].encode('ascii', 'ignore')
-                    clean_bots[bot_id] = bot_data
-                except:
-                    print(f"Удалена проблемная запись для бота")
-                    continue
-            
-            self.config["bots"] = clean_bots
-            self.save_config()
+            for _ in self._drop_broken_bots():
+                self.echo(f"Удалена проблемная запись для бота")
         
         if return_mapping:
             return bot_mapping
 
     def delete_bot(self, bot_id):
         if bot_id not in self.config["bots"]:
-            print(f"Бот с ID {bot_id} не найден!")
+            self.echo(f"Бот с ID {bot_id} не найден!")
             return
         
-        # Останавливаем бота
-        self.stop_bot(bot_id)
+        self.delete_bots([bot_id])
+        self.echo(f"Бот {bot_id} успешно удален")
+
+    def delete_bots(self, bot_ids):
+        """Удаляет ботов: останавливает контейнеры одной пачкой и чистит конфигурацию"""
+        bot_ids = [bot_id for bot_id in bot_ids if bot_id in self.config["bots"]]
+        packs = {self.config["bots"][bot_id].get("pack") for bot_id in bot_ids} - {None}
         
-        # Удаляем файл прокси
-        proxy_file = self.config["bots"][bot_id]["proxy_file"]
-        try:
-            os.remove(proxy_file)
-        except FileNotFoundError:
-            pass
+        # Останавливаем ботов
+        results = self.teardown_bots(bot_ids)
         
-        # Удаляем из конфигурации
-        del self.config["bots"][bot_id]
+        with self.store.batch():
+            for bot_id in bot_ids:
+                # Удаляем файл прокси
+                proxy_file = self.config["bots"][bot_id]["proxy_file"]
+                try:
+                    os.remove(proxy_file)
+                except FileNotFoundError:
+                    pass
+                
+                # Удаляем из конфигурации
+                del self.config["bots"][bot_id]
         self.save_config()
-        print(f"Бот {bot_id} успешно удален")
+
+        # Удаленные боты не должны вернуться при пересоздании пака
+        for pack in packs:
+            if self.pack_members(pack):
+                self._write_pack_accounts(pack)
+            else:
+                try:
+                    os.remove(os.path.join(PACK_DIR, f"{pack}.json"))
+                except FileNotFoundError:
+                    pass
+        return results
+
 
     def change_proxy(self, bot_id):
         if bot_id not in self.config["bots"]:
-            print(f"Бот с ID {bot_id} не найден!")
+            self.echo(f"Бот с ID {bot_id} не найден!")
             return
         
-        print(f"\nИзменение прокси для бота {bot_id}")
+        self.echo(f"\nИзменение прокси для бота {bot_id}")
         proxy = input("Введите новый прокси (формат: host:port:username:password): ").strip()
         
         converted_proxy = self.convert_proxy_format(proxy)
         if not converted_proxy:
-            print("Ошибка при обработке прокси. Прокси не будет изменен.")
+            self.echo("Ошибка при обработке прокси. Прокси не будет изменен.")
             return
         
-        # Обновляем файл прокси
-        proxy_file = self.config["bots"][bot_id]["proxy_file"]
-        with open(proxy_file, 'w', encoding='utf-8') as f:
-            f.write(converted_proxy)
-        
-        print("Прокси обновлен. Перезапускаем бота...")
-        self.stop_bot(bot_id)
-        self.start_bot(bot_id)
-        print(f"Бот {bot_id} перезапущен с новым прокси")
-
-    def view_logs(self, bot_id):
-        # Получаем список контейнеров
-        result = subprocess.run(["docker", "ps", "-a", "--format", "{{.ID}} {{.Image}} {{.Status}}"], 
-                              capture_output=True, text=True)
-        
-        containers = []
-        for line in result.stdout.splitlines():
-            container_id, image, status = line.split(None, 2)
-            if image == "overtrue/gradient-bot":
-                containers.append((container_id, status))
-        
-        if not containers:
-            print(f"Не найдено запущенных контейнеров для ота {bot_id}")
+        if not self.test_proxy(converted_proxy):
+            self.echo("Прокси не работает. Прокси не будет изменен.")
             return
         
-        print("\nДоступные контейнеры:")
-        for i, (container_id, status) in enumerate(containers, 1):
-            print(f"{i}. ID: {container_id[:12]} - Статус: {status}")
-        
-        if len(containers) > 1:
-            choice = input("\nВыберите номер контейнера для просмотра логов (Enter для последнего): ").strip()
-            if choice and choice.isdigit() and 1 <= int(choice) <= len(containers):
-                container_id = containers[int(choice)-1][0]
+        self.echo("Прокси обновлен. Перезапускаем бота...")
+        result = self.rolling_restart([bot_id], proxies={bot_id: converted_proxy})[bot_id]
+        if result == ROLL_RESTARTED:
+            self.echo(f"Бот {bot_id} перезапущен с новым прокси")
+        elif result == ROLL_ROLLED_BACK:
+            self.echo(f"С новым прокси бот {bot_id} не подключился, он работает с прежним прокси")
+        else:
+            self.echo(f"Бот {bot_id} не запустился")
+
+    def rolling_restart(self, bot_ids=ALL_BOTS, max_unavailable=None, proxies=None, pull=False, timeout=None):
+        """Перезапускает ботов пачками, не больше max_unavailable недоступных одновременно
+
+        Следующая пачка начинается, только когда боты предыдущей подключились.
+        proxies - {ID бота: новый прокси}; если с новым прокси бот не
+        подключился, возвращается прежний прокси и бот запускается с ним.
+        Если бот пачки так и не поднялся, остальные боты не трогаются.
+        С pull сначала скачивается свежий образ. Возвращает {ID бота: ROLL_*}.
+        """
+        titles = {
+            ROLL_RESTARTED: "перезапущен",
+            ROLL_ROLLED_BACK: "возвращен прежний прокси",
+            ROLL_FAILED: "не запустился",
+            ROLL_SKIPPED: "пропущен",
+        }
+        if bot_ids == ALL_BOTS:
+            bot_ids = list(self.config["bots"])
+        bot_ids = [bot_id for bot_id in dict.fromkeys(bot_ids) if bot_id in self.config["bots"]]
+        proxies = proxies or {}
+        max_unavailable = max(1, max_unavailable or ROLLING_MAX_UNAVAILABLE)
+        results = dict.fromkeys(bot_ids, ROLL_SKIPPED)
+        if not bot_ids:
+            return results
+        if pull:
+            self._upgrade_image({self.host_of(bot_id).name for bot_id in bot_ids})
+
+        batches = self._rolling_batches(bot_ids, max_unavailable)
+        if len(bot_ids) > 1:
+            self.echo(f"\nПлавный перезапуск {len(bot_ids)} ботов "
+                      f"(пачек: {len(batches)}, недоступно одновременно: до {max_unavailable})...")
+        for number, batch in enumerate(batches, 1):
+            members = [bot_id for _, unit in batch for bot_id in unit]
+            if len(batches) > 1:
+                self.echo(f"Пачка {number}/{len(batches)}: {', '.join(members)}")
+            previous = {bot_id: self._swap_proxy(bot_id, proxies[bot_id]) for bot_id in members if bot_id in proxies}
+            self.save_config()
+            self.teardown_bots(members)
+            with ThreadPoolExecutor(max_workers=len(batch)) as pool:
+                for outcome in pool.map(lambda unit: self._roll_unit(unit, previous, timeout), batch):
+                    results.update(outcome)
+            self.save_config()
+            for bot_id in members:
+                self.echo(f"  Бот {bot_id}: {titles[results[bot_id]]}")
+            failed = [bot_id for bot_id in members if results[bot_id] == ROLL_FAILED]
+            if failed and number < len(batches):
+                self.echo(f"Не поднялись боты {', '.join(failed)} - перезапуск остановлен, остальные боты не тронуты")
+                break
+        return results
+
+    def _rolling_batches(self, bot_ids, max_unavailable):
+        """Делит ботов на пачки из единиц (пак или None, [ID ботов]) по max_unavailable ботов
+
+        Пак, все боты которого перезапускаются, идет одной единицей: его
+        контейнер пересоздается целиком. Единица больше max_unavailable
+        занимает отдельную пачку.
+        """
+        wanted = set(bot_ids)
+        packs = self._pack_index()
+        units, covered = [], set()
+        for bot_id in bot_ids:
+            if bot_id in covered:
+                continue
+            pack = self.config["bots"][bot_id].get("pack")
+            if pack and wanted.issuperset(packs[pack]):
+                units.append((pack, packs[pack]))
+                covered.update(packs[pack])
             else:
-                container_id = containers[-1][0]
+                units.append((None, [bot_id]))
+
+        batches, size = [], 0
+        for unit in units:
+            if batches and size + len(unit[1]) <= max_unavailable:
+                batches[-1].append(unit)
+                size += len(unit[1])
+            else:
+                batches.append([unit])
+                size = len(unit[1])
+        return batches
+
+    def _roll_unit(self, unit, previous, timeout):
+        """Запускает остановленного бота или пак; не подключившимся с новым прокси возвращает прежний"""
+        pack, bot_ids = unit
+        if pack:
+            statuses = self._start_pack(pack, timeout=timeout)
         else:
-            container_id = containers[0][0]
+            statuses = {bot_ids[0]: self._start_bot(bot_ids[0], timeout, verbose=False, wait_capacity=True)}
+        results = {}
+        for bot_id, status in statuses.items():
+            if status == STATUS_STARTED:
+                results[bot_id] = ROLL_RESTARTED
+            elif previous.get(bot_id) is None:
+                results[bot_id] = ROLL_FAILED
+            else:
+                self.echo(f"Бот {bot_id} не подключился с новым прокси, возвращаем прежний")
+                self._swap_proxy(bot_id, previous[bot_id])
+                status = self._start_bot(bot_id, timeout, verbose=False, wait_capacity=True)
+                results[bot_id] = ROLL_ROLLED_BACK if status == STATUS_STARTED else ROLL_FAILED
+        return results
+
+    def _swap_proxy(self, bot_id, proxy):
+        """Пишет прокси в файл бота, возвращает прежний прокси (None, если файла не было)"""
+        bot = self.config["bots"][bot_id]
+        try:
+            with open(bot["proxy_file"], 'r', encoding='utf-8') as f:
+                previous = f.read().strip() or None
+        except OSError:
+            previous = None
+        with open(bot["proxy_file"], 'w', encoding='utf-8') as f:
+            f.write(proxy)
+        bot["spec_hash"] = spec_hash(bot["email"], bot["password"], proxy)
+        self.config["bots"][bot_id] = bot
+        return previous
+
+    def _upgrade_image(self, host_names):
+        """Скачивает свежий образ на хосты и удаляет свободные контейнеры пула со старым образом"""
+        def pull(host):
+            try:
+                if is_registry_image(BOT_IMAGE):
+                    self.echo(f"Обновление образа {BOT_IMAGE} ({host.name})...")
+                    host.docker.pull(BOT_IMAGE)
+                    host.images._save_pull()
+                if host.pool.size > 0:
+                    host.pool.drain()
+            except (DockerError, TimeoutError) as e:
+                self.echo(f"Не удалось обновить образ {BOT_IMAGE} ({host.name}): {e}")
+
+        if not is_registry_image(BOT_IMAGE):
+            self.echo(f"Образ {BOT_IMAGE} собран локально и не скачивается - "
+                      f"пересоберите его на хостах: docker build -t {BOT_IMAGE} .")
+        hosts = [self.hosts[name] for name in host_names if self.hosts[name].available()]
+        if hosts:
+            with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+                list(pool.map(pull, hosts))
+
+    def view_logs(self, bot_id):
+        container_id = self.find_container(bot_id)
+        if not container_id:
+            self.echo(f"Не найдено контейнеров для бота {bot_id}")
+            return
         
-        print("\nПоследние логи (Ctrl+C для выхода):")
+        # В логах пака строки всех его ботов - показываем только строки этого бота
+        pack = self.config["bots"].get(bot_id, {}).get("pack")
+
+        def own(line):
+            match = PM2_LOG_PREFIX.match(line)
+            return not pack or (match is not None and match.group("name") == bot_id)
+
+        docker = self.docker_for(bot_id)
+        self.echo("\nПоследние логи (Ctrl+C для выхода):")
+        try:
+            try:
+                stream = docker.follow_logs(container_id)
+                line = next(stream, None)
+            except DockerError:
+                # ID из кэша мог устареть - ищем контейнер заново
+                self._forget_container(bot_id)
+                container_id = self.find_container(bot_id)
+                if not container_id:
+                    self.echo(f"Не найдено контейнеров для бота {bot_id}")
+                    return
+                stream = docker.follow_logs(container_id)
+                line = next(stream, None)
+            while True:
+                if line is not None and own(line):
+                    self.echo(line, end="")
+                line = next(stream)
+        except StopIteration:
+            pass
+        except KeyboardInterrupt:
+            self.echo("\nПросмотр логов завершен")
+
+    def tail_logs(self, bot_ids=ALL_BOTS, pattern=None, lines=LOG_BUFFER_LINES):
+        """Логи нескольких ботов в одном потоке; строки помечаются ID бота
+
+        pattern - регулярное выражение: показываются только совпавшие строки.
+        """
+        bot_ids = list(self.config["bots"]) if bot_ids == ALL_BOTS else list(bot_ids)
+        try:
+            aggregator = LogAggregator(self, bot_ids, pattern, lines)
+        except re.error as e:
+            self.echo(f"Неверный фильтр {pattern!r}: {e}")
+            return
+        missing = aggregator.start()
+        if missing:
+            self.echo(f"Нет контейнеров у ботов: {', '.join(missing)}")
+        if len(missing) == len(bot_ids):
+            return
+        width = max(len(bot_id) for bot_id in bot_ids)
+        self.echo(f"\nЛоги {len(bot_ids) - len(missing)} ботов" + (f" (фильтр: {pattern})" if pattern else "")
+                  + " (Ctrl+C для выхода):")
         try:
-            subprocess.run(["docker", "logs", "-f", container_id])
+            for bot_id, line in aggregator.follow():
+                self.echo(f"[{bot_id:<{width}}] {line}")
         except KeyboardInterrupt:
-            print("\nПросмотр логов завершен")
+            self.echo("\nПросмотр логов завершен")
+        finally:
+            aggregator.stop()
 
     def cleanup_containers(self):
-        print("\nОчистка старых контейнеров...")
-        # Останавливаем все контейнеры с нашим образом
-        subprocess.run(["docker", "ps", "-a", "-q", "-f", "ancestor=overtrue/gradient-bot"], 
-                      capture_output=True, text=True)
-        
-        # Удаляем все остановленные контейнеры
-        subprocess.run(["docker", "container", "prune", "-f"])
-        print("Очистка завершена")
+        self.echo("\nОчистка старых контейнеров...")
+        # Останавливаем и удаляем все контейнеры ботов
+        results = self.teardown_bots(ALL_BOTS)
+        self.print_teardown_summary(results)
+        self.echo("Очистка завершена")
 
     def show_menu(self):
+        self.watch_events()
         while True:
             menu_items = [
                 "=== Меню управления ботами ===",
@@ -470,92 +4166,132 @@ class BotManager:
                 "6. Добавить ботов из списка",
                 "7. Удалить бота",
                 "8. Изменить пркси у бота",
-                "9. Просмотр логов бота",
+                "9. Просмотр логов ботов",
                 "10. Очистить старые контейнеры",
+                "11. Ресурсы и емкость хоста",
+                "12. Плавный перезапуск ботов",
                 "0. Выход"
             ]
             
             # Печатаем меню с правильной кодировкой
-            print("\n".join(item.encode('utf-8', 'ignore').decode('utf-8') for item in menu_items))
+            self.echo("\n".join(item.encode('utf-8', 'ignore').decode('utf-8') for item in menu_items))
             
             choice = input("\nВыберите действие: ").strip()
+            try:
             
-            if choice == "1":
-                self.check_and_install_requirements()
-            elif choice == "2":
-                self.add_bot()
-            elif choice == "3":
-                bot_mapping = self.list_bots(return_mapping=True)
-                if not bot_mapping:
-                    print("Нет доступных ботов!")
-                    continue
-                print("\nВведите номер бота из списка выше:")
-                bot_number = input("Номер: ")
-                if bot_number in bot_mapping:
-                    self.start_bot(bot_mapping[bot_number])
-                else:
-                    print("Неверный номер бота!")
-            elif choice == "4":
-                bot_mapping = self.list_bots(return_mapping=True)
-                if not bot_mapping:
-                    print("Нет доступных ботов!")
-                    continue
-                print("\nВведите номер бота из списка выше:")
-                bot_number = input("Номер: ")
-                if bot_number in bot_mapping:
-                    self.stop_bot(bot_mapping[bot_number])
-                else:
-                    print("Неверный номер бота!")
-            elif choice == "5":
-                self.list_bots()
-            elif choice == "6":
-                self.bulk_add_bots()
-            elif choice == "7":
-                bot_mapping = self.list_bots(return_mapping=True)
-                if not bot_mapping:
-                    print("Нет доступных ботов!")
-                    continue
-                print("\nВведите номер бота для удаления из списка выше:")
-                bot_number = input("Номер: ")
-                if bot_number in bot_mapping:
-                    self.delete_bot(bot_mapping[bot_number])
-                else:
-                    print("Неверный номер бота!")
-            elif choice == "8":
-                bot_mapping = self.list_bots(return_mapping=True)
-                if not bot_mapping:
-                    print("Нет доступных ботов!")
-                    continue
-                print("\nВвдите номер бота для изменения прокси из списка выше:")
-                bot_number = input("Номер: ")
-                if bot_number in bot_mapping:
-                    self.change_proxy(bot_mapping[bot_number])
-                else:
-                    print("Неверный номер бота!")
-            elif choice == "9":
-                bot_mapping = self.list_bots(return_mapping=True)
-                if not bot_mapping:
-                    print("Нт доступных ботов!")
-                    continue
-                print("\nВведите номер бота для просмотра логов из списка выше:")
-                bot_number = input("Номер: ")
-                if bot_number in bot_mapping:
-                    self.view_logs(bot_mapping[bot_number])
-                else:
-                    print("Неверный номер бота!")
-            elif choice == "10":
-                self.cleanup_containers()
-            elif choice == "0":
-                break
+                if choice == "1":
+                    self.check_and_install_requirements()
+                elif choice == "2":
+                    self.add_bot()
+                elif choice == "3":
+                    bot_mapping = self.list_bots(return_mapping=True)
+                    if not bot_mapping:
+                        self.echo("Нет доступных ботов!")
+                        continue
+                    self.echo("\nВведите номер бота из списка выше:")
+                    bot_number = input("Номер: ")
+                    if bot_number in bot_mapping:
+                        self.start_bot(bot_mapping[bot_number])
+                    else:
+                        self.echo("Неверный номер бота!")
+                elif choice == "4":
+                    bot_mapping = self.list_bots(return_mapping=True)
+                    if not bot_mapping:
+                        self.echo("Нет доступных ботов!")
+                        continue
+                    self.echo("\nВведите номер бота из списка выше (несколько через запятую или all):")
+                    bot_ids = self._select_bots(bot_mapping, input("Номер: "))
+                    if len(bot_ids) == 1:
+                        self.stop_bot(bot_ids[0])
+                    elif bot_ids:
+                        self.print_teardown_summary(self.teardown_bots(bot_ids))
+                    else:
+                        self.echo("Неверный номер бота!")
+                elif choice == "5":
+                    self.list_bots()
+                elif choice == "6":
+                    self.bulk_add_bots()
+                elif choice == "7":
+                    bot_mapping = self.list_bots(return_mapping=True)
+                    if not bot_mapping:
+                        self.echo("Нет доступных ботов!")
+                        continue
+                    self.echo("\nВведите номер бота для удаления из списка выше (несколько через запятую или all):")
+                    bot_ids = self._select_bots(bot_mapping, input("Номер: "))
+                    if len(bot_ids) == 1:
+                        self.delete_bot(bot_ids[0])
+                    elif bot_ids:
+                        self.print_teardown_summary(self.delete_bots(bot_ids))
+                    else:
+                        self.echo("Неверный номер бота!")
+                elif choice == "8":
+                    bot_mapping = self.list_bots(return_mapping=True)
+                    if not bot_mapping:
+                        self.echo("Нет доступных ботов!")
+                        continue
+                    self.echo("\nВвдите номер бота для изменения прокси из списка выше:")
+                    bot_number = input("Номер: ")
+                    if bot_number in bot_mapping:
+                        self.change_proxy(bot_mapping[bot_number])
+                    else:
+                        self.echo("Неверный номер бота!")
+                elif choice == "9":
+                    bot_mapping = self.list_bots(return_mapping=True)
+                    if not bot_mapping:
+                        self.echo("Нт доступных ботов!")
+                        continue
+                    self.echo("\nВведите номер бота для просмотра логов из списка выше (несколько через запятую или all):")
+                    bot_ids = self._select_bots(bot_mapping, input("Номер: "))
+                    if len(bot_ids) == 1:
+                        self.view_logs(bot_ids[0])
+                    elif bot_ids:
+                        pattern = input("Фильтр строк (регулярное выражение, Enter - без фильтра): ").strip()
+                        self.tail_logs(bot_ids, pattern or None)
+                    else:
+                        self.echo("Неверный номер бота!")
+                elif choice == "10":
+                    self.cleanup_containers()
+                elif choice == "11":
+                    self.capacity_report()
+                elif choice == "12":
+                    bot_mapping = self.list_bots(return_mapping=True)
+                    if not bot_mapping:
+                        self.echo("Нет доступных ботов!")
+                        continue
+                    self.echo("\nВведите номер бота из списка выше (несколько через запятую или all):")
+                    bot_ids = self._select_bots(bot_mapping, input("Номер: "))
+                    if not bot_ids:
+                        self.echo("Неверный номер бота!")
+                        continue
+                    answer = input(f"Сколько ботов перезапускать одновременно [{ROLLING_MAX_UNAVAILABLE}]: ").strip()
+                    max_unavailable = int(answer) if answer.isdigit() else None
+                    pull = input("Скачать свежий образ перед перезапуском? (y/N): ").strip().lower() == "y"
+                    self.rolling_restart(bot_ids, max_unavailable, pull=pull)
+                elif choice == "0":
+                    break
+            except DockerError as e:
+                self.echo(f"Ошибка Docker: {e}")
 
-    def bulk_add_bots(self):
-        print("\n=== Массовое добавление ботов ===")
-        print("Введите данные в формате: bot_id|email|password|host:port:username:password")
-        print("Пример:")
-        print("bot1|email1@example.com|password1|proxy.example.com:1080:user1:pass1")
-        print("bot2|email2@example.com|password2|proxy.example.com:1080:user2:pass2")
-        print("\nПо одной записи на строку. Для завершения введите пустую строку.")
+    def _select_bots(self, bot_mapping, answer):
+        """Разбирает ответ вида "1,3,5" или "all" в список ID ботов"""
+        answer = answer.strip()
+        if answer.lower() == ALL_BOTS:
+            return list(bot_mapping.values())
+        numbers = [number.strip() for number in answer.split(",") if number.strip()]
+        if not numbers or any(number not in bot_mapping for number in numbers):
+            return []
+        return [bot_mapping[number] for number in dict.fromkeys(numbers)]
+
+    def bulk_add_bots(self, workers=None, timeout=None):
+        self.echo("\n=== Массовое добавление ботов ===")
+        self.echo("Введите данные в формате: bot_id|email|password|host:port:username:password")
+        self.echo("Пример:")
+        self.echo("bot1|email1@example.com|password1|proxy.example.com:1080:user1:pass1")
+        self.echo("bot2|email2@example.com|password2|proxy.example.com:1080:user2:pass2")
+        self.echo("\nПо одной записи на строку. Для завершения введите пустую строку.")
         
+        new_bots = {}
+        proxies = {}
         while True:
             line = input()
             if not line:
@@ -566,66 +4302,522 @@ class BotManager:
                 
                 converted_proxy = self.convert_proxy_format(proxy)
                 if not converted_proxy:
-                    print(f"Ошибка при обработке прокси для бота {bot_id}. Пропускаем...")
+                    self.echo(f"Ошибка при обработке прокси для бота {bot_id}. Пропускаем...")
                     continue
                 
                 proxy_file = f'proxies_{bot_id}.txt'
                 with open(proxy_file, 'w', encoding='utf-8') as f:
                     f.write(converted_proxy)
                 
-                self.config["bots"][bot_id] = {
+                new_bots[bot_id] = {
                     "email": email,
                     "password": password,
-                    "proxy_file": proxy_file
+                    "proxy_file": proxy_file,
+                    "spec_hash": spec_hash(email, password, converted_proxy)
                 }
-                
-                self.start_bot(bot_id)
-                print(f"Бот {bot_id} добавлен и запущен")
+                proxies[bot_id] = converted_proxy
                 
             except ValueError:
-                print("Неверный формат! Пропускаем...")
+                self.echo("Неверный формат! Пропускаем...")
                 continue
         
+        # Все прокси проверяются разом, параллельно
+        if new_bots:
+            working = self.test_proxies(list(proxies.values()))
+            for bot_id, proxy in proxies.items():
+                if not working[proxy]:
+                    self.echo(f"Прокси бота {bot_id} не работает. Пропускаем...")
+                    os.remove(new_bots.pop(bot_id)["proxy_file"])
+
+        # Все новые записи сохраняются одной транзакцией
+        with self.store.batch():
+            for bot_id, bot in new_bots.items():
+                self.config["bots"][bot_id] = bot
+        self.save_config()
+        if new_bots:
+            self.provision_bots(list(new_bots), workers=workers, timeout=timeout)
+        self.echo("\nМассовое добавление завершено!")
+
+    def provision_bots(self, bot_ids, workers=None, timeout=None, pack_size=None):
+        """Параллельно запускает ботов с ограничением числа одновременных запусков
+
+        При pack_size > 1 боты без пака раскладываются по контейнерам-пакам
+        по pack_size аккаунтов, и каждый пак запускается одной задачей.
+        """
+        timeout = timeout or START_TIMEOUT
+        pack_size = pack_size or PACK_SIZE
+        packs = self._assign_packs(bot_ids, pack_size) if pack_size > 1 else {}
+        packed = {bot_id for members in packs.values() for bot_id in members}
+        try:
+            # Пак целиком попадает на один хост
+            self.place_bots(list(packs.values()) + [[bot_id] for bot_id in bot_ids if bot_id not in packed])
+        except DockerError as e:
+            self.echo(f"Не удалось распределить ботов по хостам: {e}")
+        tasks = [(self._timed_start_pack, pack, members) for pack, members in packs.items()]
+        tasks += [(self._timed_start, bot_id, [bot_id]) for bot_id in bot_ids if bot_id not in packed]
+        workers = max(1, min(workers or BULK_WORKERS, len(tasks)))
+        self.echo(f"\nЗапуск {len(bot_ids)} ботов (параллельно: {workers}, таймаут: {timeout} сек"
+                  + (f", паков: {len(packs)}" if packs else "") + ")...")
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(start, target, timeout): members for start, target, members in tasks}
+            for future in as_completed(futures):
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    self.echo(f"Ошибка при запуске ботов {', '.join(futures[future])}: {e}")
+                    outcome = {bot_id: (STATUS_FAILED, 0.0) for bot_id in futures[future]}
+                # Сохраняем конфигурацию по мере готовности каждого бота
+                self.save_config()
+                for bot_id, (status, elapsed) in outcome.items():
+                    results[bot_id] = (status, elapsed)
+                    self.echo(f"[{len(results)}/{len(bot_ids)}] Бот {bot_id}: {status} ({elapsed:.1f} сек)")
+
+        # Метрики всей пачки записываются одним разом
+        self.metrics.flush()
+        self.print_provision_summary(bot_ids, results)
+        return results
+
+    def _timed_start(self, bot_id, timeout):
+        started = time.monotonic()
+        status = self._start_bot(bot_id, timeout=timeout, verbose=False, wait_capacity=True)
+        return {bot_id: (status, time.monotonic() - started)}
+
+    def _timed_start_pack(self, pack, timeout):
+        started = time.monotonic()
+        statuses = self._start_pack(pack, timeout=timeout)
+        elapsed = time.monotonic() - started
+        return {bot_id: (status, elapsed) for bot_id, status in statuses.items()}
+
+    def _assign_packs(self, bot_ids, pack_size):
+        """Раскладывает ботов без пака по новым пакам, возвращает {пак: [ID ботов]}"""
+        fresh = [bot_id for bot_id in bot_ids if not self.config["bots"][bot_id].get("pack")]
+        packs = {}
+        with self.store.batch():
+            for start in range(0, len(fresh), pack_size):
+                members = fresh[start:start + pack_size]
+                pack = hashlib.sha1(",".join(members).encode()).hexdigest()[:10]
+                for bot_id in members:
+                    bot = self.config["bots"][bot_id]
+                    bot["pack"] = pack
+                    self.config["bots"][bot_id] = bot
+                packs[pack] = members
+        self.save_config()
+        return packs
+
+    def print_provision_summary(self, bot_ids, results):
+        titles = {
+            STATUS_STARTED: "запущен",
+            STATUS_FAILED: "ошибка",
+            STATUS_TIMEOUT: "таймаут",
+        }
+        self.echo("\n=== Итоги запуска ===")
+        self.echo(f"{'ID':<30} {'Статус':<10} {'Время, сек':>10}")
+        for bot_id in bot_ids:
+            status, elapsed = results.get(bot_id, (STATUS_FAILED, 0.0))
+            self.echo(f"{bot_id:<30} {titles.get(status, status):<10} {elapsed:>10.1f}")
+        counts = {status: 0 for status in titles}
+        for status, _ in results.values():
+            counts[status] = counts.get(status, 0) + 1
+        self.echo(f"\nЗапущено: {counts[STATUS_STARTED]}, "
+                  f"ошибок: {counts[STATUS_FAILED]}, "
+                  f"таймаутов: {counts[STATUS_TIMEOUT]}")
+
+    def _stored_spec_hash(self, bot):
+        """Хэш сохраненного бота; для записей без spec_hash считается по файлу прокси"""
+        if bot.get("spec_hash"):
+            return bot["spec_hash"]
+        try:
+            with open(bot["proxy_file"], 'r', encoding='utf-8') as f:
+                proxy = f.read().strip()
+        except OSError:
+            return None
+        return spec_hash(bot["email"], bot["password"], proxy)
+
+    def apply_manifest(self, path, dry_run=False, prune=True, check_proxies=True, workers=None, timeout=None,
+                       pack_size=None, force_prune=False):
+        """Приводит парк ботов к манифесту: запускает новых, перезапускает измененных, удаляет лишних
+
+        Записи манифеста сравниваются с сохраненными по хэшу содержимого,
+        поэтому неизмененные боты не трогаются вовсе. Если в манифесте нет
+        ни одной верной записи или есть ошибочные, лишние боты удаляются
+        только с force_prune: неверный заголовок или разделитель иначе
+        удалил бы весь парк.
+        """
+        self.echo(f"\n=== Применение манифеста {path} ===")
+        stored = {bot_id: self._stored_spec_hash(bot) for bot_id, bot in self.config["bots"].items()}
+
+        seen = set()
+        added, changed = {}, {}
+        invalid = 0
+        for line_number, record in enumerate(read_manifest(path), 1):
+            proxy = bot_id = None
+            if isinstance(record, dict):
+                try:
+                    bot_id = re.sub(r'[^a-zA-Z0-9_.-]', '', record["bot_id"].strip())
+                    email = record["email"].strip()
+                    password = record["password"].strip()
+                    proxy = self.convert_proxy_format(record["proxy"].strip(), verbose=False)
+                except (KeyError, AttributeError):
+                    proxy = bot_id = None
+            if not bot_id or not proxy or bot_id in seen:
+                self.echo(f"Запись {line_number}: неверный формат или повторный ID. Пропускаем...")
+                invalid += 1
+                continue
+            seen.add(bot_id)
+
+            digest = spec_hash(email, password, proxy)
+            if stored.get(bot_id) == digest:
+                continue
+            target = changed if bot_id in stored else added
+            target[bot_id] = {"email": email, "password": password, "proxy": proxy, "spec_hash": digest}
+
+        removed = [bot_id for bot_id in stored if bot_id not in seen] if prune else []
+        if removed and (invalid or not seen) and not force_prune:
+            self.echo(f"В манифесте {'есть ошибочные записи' if seen else 'нет ни одной верной записи'} - "
+                      f"{len(removed)} ботов не удаляются (удалить: --force-prune)")
+            removed = []
+        self.echo(f"Записей в манифесте: {len(seen)}, без изменений: {len(seen) - len(added) - len(changed)}")
+        self.echo(f"Новых: {len(added)}, измененных: {len(changed)}, к удалению: {len(removed)}, ошибок: {invalid}")
+        if dry_run:
+            for title, bot_ids in (("+", added), ("~", changed), ("-", removed)):
+                for bot_id in bot_ids:
+                    self.echo(f"  {title} {bot_id}")
+            return {"added": list(added), "changed": list(changed), "removed": removed, "invalid": invalid}
+
+        if removed:
+            self.echo(f"\nУдаление {len(removed)} ботов...")
+            self.print_teardown_summary(self.delete_bots(removed))
+
+        updates = dict(added, **changed)
+        if check_proxies and updates:
+            working = self.test_proxies([spec["proxy"] for spec in updates.values()])
+            for bot_id in [bot_id for bot_id, spec in updates.items() if not working[spec["proxy"]]]:
+                self.echo(f"Прокси бота {bot_id} не работает. Пропускаем...")
+                updates.pop(bot_id)
+                added.pop(bot_id, None)
+                changed.pop(bot_id, None)
+
+        # Старые контейнеры измененных ботов останавливаем одной пачкой
+        if changed:
+            self.teardown_bots(list(changed))
+
+        with self.store.batch():
+            for bot_id, spec in updates.items():
+                proxy_file = f'proxies_{bot_id}.txt'
+                with open(proxy_file, 'w', encoding='utf-8') as f:
+                    f.write(spec["proxy"])
+                bot = {
+                    "email": spec["email"],
+                    "password": spec["password"],
+                    "proxy_file": proxy_file,
+                    "spec_hash": spec["spec_hash"],
+                }
+                # Измененный бот остается в своем паке и на своем хосте
+                for key in ("pack", "host"):
+                    value = self.config["bots"].get(bot_id, {}).get(key)
+                    if value:
+                        bot[key] = value
+                self.config["bots"][bot_id] = bot
         self.save_config()
-        print("\nМассовое добавление завершено!")
+
+        results = self.provision_bots(list(updates), workers=workers, timeout=timeout,
+                                      pack_size=pack_size) if updates else {}
+        return {"added": list(added), "changed": list(changed), "removed": removed,
+                "invalid": invalid, "results": results}
 
     def test_proxy(self, proxy_string):
         """Тестирует прокси перед использованием"""
-        print("\nТестирование прокси...")
-        
-        # Делаем несколько проверок для подтверждения ротации
-        for i in range(2):
-            cmd = [
-                "docker", "run", "--rm",
-                "-e", "PROXY_TEST=true",
-                "-e", f"PROXY={proxy_string}",
-                "alpine/curl", "-x", proxy_string, "https://api.ipify.org?format=json"
-            ]
-            
-            try:
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-                if result.returncode == 0:
-                    print(f"✓ Тест {i+1}: Прокси работает!")
-                    print(f"Ответ: {result.stdout}")
-                    if i == 0:
-                        print("Ожидание 5 секунд перед повторной проверкой...")
-                        time.sleep(5)  # Ждем немного для возможной ротации IP
+        self.echo("\nТестирование прокси...")
+        result = self.proxy_checker.check(proxy_string)
+        if result["ok"]:
+            source = " (из кэша)" if result["cached"] else ""
+            self.echo(f"✓ Прокси работает{source}! IP: {result['ip']}, задержка: {result['latency']} сек")
+            return True
+        self.echo(f"✗ Ошибка при проверке прокси: {result['error']}")
+        return False
+
+    def test_proxies(self, proxies):
+        """Проверяет несколько прокси параллельно, возвращает {прокси: работает}"""
+        self.echo(f"\nТестирование {len(set(proxies))} прокси...")
+        results = self.proxy_checker.check_many(proxies)
+        for proxy, result in results.items():
+            if not result["ok"]:
+                self.echo(f"✗ {proxy}: {result['error']}")
+        working = sum(1 for result in results.values() if result["ok"])
+        self.echo(f"Рабочих прокси: {working} из {len(results)}")
+        return {proxy: result["ok"] for proxy, result in results.items()}
+
+
+class AsyncBotManager:
+    """Асинхронный API менеджера для встраивания в другие сервисы
+
+    Операции BotManager выполняются в пуле потоков, так что из одного
+    цикла событий можно одновременно запускать, останавливать и проверять
+    многих ботов. Результаты возвращаются словарями, а вывод менеджера по
+    умолчанию отключен (echo=print включает его).
+    """
+
+    def __init__(self, manager=None, workers=None, echo=None):
+        self.manager = manager or BotManager(echo=echo)
+        self.manager.watch_events()
+        self._executor = ThreadPoolExecutor(max_workers=workers or max(BULK_WORKERS, 32))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _call(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+
+    async def start(self, bot_id, timeout=None):
+        """Запускает бота и ждет подключения: {"bot_id", "status", "cause", "elapsed"}"""
+        started, created = time.monotonic(), time.time()
+        status = await self._call(self.manager._start_bot, bot_id, timeout, verbose=False, wait_capacity=True)
+        record = self.manager.metrics.bot_record(bot_id) or {}
+        # Запись метрик могла остаться от прошлого запуска
+        fresh = record.get("created", 0) >= created
+        return {
+            "bot_id": bot_id,
+            "status": status,
+            "cause": record.get("cause") if fresh else None,
+            "elapsed": time.monotonic() - started,
+        }
+
+    async def start_many(self, bot_ids, timeout=None):
+        """Запускает ботов одновременно, возвращает {ID бота: результат start}"""
+        results = await asyncio.gather(*(self.start(bot_id, timeout) for bot_id in bot_ids))
+        return {result["bot_id"]: result for result in results}
+
+    async def stop(self, bot_ids, timeout=None):
+        """Останавливает ботов, возвращает {ID бота: TEARDOWN_REMOVED, TEARDOWN_NOT_FOUND или ошибка}"""
+        if isinstance(bot_ids, str) and bot_ids != ALL_BOTS:
+            bot_ids = [bot_ids]
+        return await self._call(self.manager.teardown_bots, bot_ids, timeout)
+
+    async def restart(self, bot_ids=ALL_BOTS, max_unavailable=None, proxies=None, pull=False, timeout=None):
+        """Плавный перезапуск (см. BotManager.rolling_restart), возвращает {ID бота: ROLL_*}"""
+        return await self._call(self.manager.rolling_restart, bot_ids, max_unavailable, proxies, pull, timeout)
+
+    async def status(self, bot_ids=ALL_BOTS, max_age=STATUS_CACHE_TTL):
+        """Состояние ботов: {ID бота: {"state", "status", "host", "uptime", "restarts", "pack", "support_status"}}
+
+        У ботов без контейнера state - None.
+        """
+        fleet = await self._call(self.manager.fleet_status, max_age)
+        bots = self.manager.config["bots"]
+        bot_ids = list(bots) if bot_ids == ALL_BOTS else [bot_id for bot_id in bot_ids if bot_id in bots]
+        empty = {"state": None, "status": "", "host": None, "uptime": None, "restarts": None}
+        return {
+            bot_id: dict(fleet.get(bot_id, empty), pack=bots[bot_id].get("pack"),
+                         support_status=bots[bot_id].get("support_status"))
+            for bot_id in bot_ids
+        }
+
+    async def logs(self, bot_id, lines=LOG_BUFFER_LINES):
+        """Последние строки лога бота: {"bot_id", "lines", "error", "state"}
+
+        state - состояние бота по этим строкам (см. LogParser.summary).
+        """
+        return await self._call(self._logs, bot_id, lines)
+
+    def _logs(self, bot_id, lines):
+        manager = self.manager
+        try:
+            container_id = manager.find_container(bot_id)
+            if not container_id:
+                return {"bot_id": bot_id, "lines": [], "error": "контейнер не найден", "state": None}
+            pack = manager.config["bots"].get(bot_id, {}).get("pack")
+            # В логе пака перемешаны строки всех его ботов
+            tail = lines * max(len(manager.pack_members(pack)), 1) if pack else lines
+            text = manager.docker_for(bot_id).logs(container_id, tail=tail)
+        except (DockerError, TimeoutError) as e:
+            return {"bot_id": bot_id, "lines": [], "error": str(e), "state": None}
+        own = []
+        parser = LogParser()
+        for line in text.splitlines():
+            if pack:
+                match = PM2_LOG_PREFIX.match(line)
+                if match is None or match.group("name") != bot_id:
                     continue
-                else:
-                    print("✗ Ошибка при проверке прокси")
-                    print(f"Ошибка: {result.stderr}")
-                    return False
-            except subprocess.TimeoutExpired:
-                print("✗ Таймаут при проверке прокси")
-                return False
-            except Exception as e:
-                print(f"✗ Ошибка при тестировании прокси: {e}")
-                return False
-        
-        return True
+                line = line[match.end():]
+            parser.feed(line)
+            own.append(line)
+        return {"bot_id": bot_id, "lines": own[-lines:] if lines else own, "error": None, "state": parser.summary()}
+
+    async def follow_logs(self, bot_ids=ALL_BOTS, pattern=None, lines=LOG_BUFFER_LINES):
+        """Асинхронный генератор (ID бота, строка) по логам нескольких ботов; pattern - фильтр строк"""
+        bot_ids = list(self.manager.config["bots"]) if bot_ids == ALL_BOTS else list(bot_ids)
+        aggregator = LogAggregator(self.manager, bot_ids, pattern, lines)
+        await self._call(aggregator.start)
+        loop = asyncio.get_running_loop()
+        received = asyncio.Queue()
+
+        def pump():
+            try:
+                for item in aggregator.follow():
+                    loop.call_soon_threadsafe(received.put_nowait, item)
+                loop.call_soon_threadsafe(received.put_nowait, None)
+            except RuntimeError:
+                # Цикл событий уже закрыт
+                aggregator.stop()
+
+        threading.Thread(target=pump, daemon=True).start()
+        try:
+            while True:
+                item = await received.get()
+                if item is None:
+                    return
+                yield item
+        finally:
+            aggregator.stop()
+
+    async def check_proxies(self, proxies, use_cache=True):
+        """Проверяет прокси в этом же цикле событий: {прокси: {"ok", "latency", "ip", "error", ...}}"""
+        return await self.manager.proxy_checker.check_many_async(proxies, use_cache)
+
+
+def setup_console():
+    """Настройка кодировки вывода для запуска из консоли (при импорте модуля не выполняется)"""
+    # Устанавливаем локаль
+    locale.setlocale(locale.LC_ALL, 'C.UTF-8')
+
+    # Кодировка stdout и stderr меняется на месте, без новой обертки поверх буфера
+    for stream in (sys.stdout, sys.stderr):
+        if hasattr(stream, "reconfigure"):
+            stream.reconfigure(encoding='utf-8', errors='replace', line_buffering=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Менеджер ботов gradient (без аргументов - интерактивное меню)")
+    commands = parser.add_subparsers(dest="command")
+
+    apply_parser = commands.add_parser("apply", help="привести парк ботов к манифесту (CSV или JSONL)")
+    apply_parser.add_argument("manifest", help="файл с полями bot_id, email, password, proxy")
+    apply_parser.add_argument("--dry-run", action="store_true", help="только показать изменения")
+    apply_parser.add_argument("--no-prune", action="store_true", help="не удалять ботов, которых нет в манифесте")
+    apply_parser.add_argument("--force-prune", action="store_true",
+                              help="удалять ботов, которых нет в манифесте, даже если в нем есть ошибки")
+    apply_parser.add_argument("--skip-proxy-check", action="store_true", help="не проверять новые прокси")
+    apply_parser.add_argument("--workers", type=int, help="число параллельных запусков")
+    apply_parser.add_argument("--timeout", type=int, help="таймаут запуска одного бота, сек")
+    apply_parser.add_argument("--pack-size", type=int, help="сколько новых ботов запускать в одном контейнере")
+
+    supervise_parser = commands.add_parser("supervise", help="следить за ботами и перезапускать упавших")
+    supervise_parser.add_argument("--interval", type=int, default=SUPERVISE_INTERVAL, help="период проверки, сек")
+    supervise_parser.add_argument("--max-restarts", type=int, default=MAX_CONCURRENT_RESTARTS,
+                                  help="число одновременных перезапусков")
+    supervise_parser.add_argument("--once", action="store_true", help="выполнить одну проверку и выйти")
+    supervise_parser.add_argument("--prune-orphans", action="store_true",
+                                  help="удалять контейнеры ботов, которых нет в конфигурации")
+
+    commands.add_parser("capacity", help="показать потребление ресурсов и оценку емкости хоста")
+
+    logs_parser = commands.add_parser("logs", help="логи нескольких ботов в одном потоке")
+    logs_parser.add_argument("bot_ids", nargs="*", help="ID ботов (по умолчанию все)")
+    logs_parser.add_argument("--grep", metavar="PATTERN", help="показывать только строки, совпавшие с выражением")
+    logs_parser.add_argument("--lines", type=int, default=LOG_BUFFER_LINES, help="сколько последних строк бота показать сразу")
+
+    restart_parser = commands.add_parser("restart", help="плавно перезапустить ботов пачками")
+    restart_parser.add_argument("bot_ids", nargs="*", help="ID ботов (по умолчанию все)")
+    restart_parser.add_argument("--max-unavailable", type=int, default=ROLLING_MAX_UNAVAILABLE,
+                                help="сколько ботов может быть недоступно одновременно")
+    restart_parser.add_argument("--pull", action="store_true", help="скачать свежий образ перед перезапуском")
+    restart_parser.add_argument("--timeout", type=int, help="таймаут запуска одного бота, сек")
+
+    warmup_parser = commands.add_parser("warmup", help="скачать образ бота и расширение, заполнить пул контейнеров")
+    warmup_parser.add_argument("--pool-size", type=int, default=POOL_SIZE, help="размер пула контейнеров")
+    warmup_parser.add_argument("--drain", action="store_true", help="удалить свободные контейнеры пула")
+
+    metrics_parser = commands.add_parser("metrics", help="вывести метрики запуска в формате Prometheus")
+    metrics_parser.add_argument("--serve", type=int, metavar="PORT", help="отдавать метрики по HTTP на этом порту")
+    metrics_parser.add_argument("--bind", default="127.0.0.1", help="адрес для --serve")
+
+    args = parser.parse_args(argv)
+    setup_console()
+
+    if args.command == "metrics":
+        metrics = StartupMetrics()
+        if args.serve:
+            metrics.serve(args.serve, args.bind)
+        else:
+            print(metrics.render(), end="")
+        return
 
-if __name__ == "__main__":
     manager = BotManager()
+
+    if args.command == "capacity":
+        manager.capacity_report()
+        return
+
+    if args.command == "logs":
+        unknown = [bot_id for bot_id in args.bot_ids if bot_id not in manager.config["bots"]]
+        if unknown:
+            print(f"Неизвестные боты: {', '.join(unknown)}")
+            sys.exit(1)
+        manager.tail_logs(args.bot_ids or ALL_BOTS, args.grep, args.lines)
+        return
+
+    if args.command == "restart":
+        unknown = [bot_id for bot_id in args.bot_ids if bot_id not in manager.config["bots"]]
+        if unknown:
+            print(f"Неизвестные боты: {', '.join(unknown)}")
+            sys.exit(1)
+        results = manager.rolling_restart(args.bot_ids or ALL_BOTS, args.max_unavailable, pull=args.pull,
+                                          timeout=args.timeout)
+        if ROLL_FAILED in results.values() or ROLL_SKIPPED in results.values():
+            sys.exit(1)
+        return
+
+    if args.command == "warmup":
+        hosts = [host for host in manager.hosts.values() if host.available()]
+        if args.drain:
+            print(f"Удалено контейнеров пула: {sum(host.pool.drain() for host in hosts)}")
+            return
+        # Образ скачивается на все хосты одновременно
+        for host in hosts:
+            host.images.start()
+        manager.extension_cache.start()
+        for host in hosts:
+            host.images.wait()
+            if host.local:
+                host.pool.size = args.pool_size
+                print(f"Свободных контейнеров в пуле ({host.name}): {host.pool.fill()}")
+        manager.extension_cache.wait()
+        manifest = manager.extension_cache.manifest()
+        if manifest:
+            print(f"Расширение в кэше: {manifest['file']} (sha256 {manifest['sha256'][:12]}...)")
+        return
+
+    if args.command == "supervise":
+        Supervisor(manager, interval=args.interval, max_restarts=args.max_restarts,
+                   prune_orphans=args.prune_orphans).run(once=args.once)
+        return
+
+    if args.command == "apply":
+        manager.apply_manifest(
+            args.manifest,
+            dry_run=args.dry_run,
+            prune=not args.no_prune,
+            force_prune=args.force_prune,
+            check_proxies=not args.skip_proxy_check,
+            workers=args.workers,
+            timeout=args.timeout,
+            pack_size=args.pack_size,
+        )
+        return
+
     print("Добро пожаловать в менеджер ботов!")
     print("Если это первый запуск, рекмендуется выбрать пункт 1 для проверки и установки требований.")
-    manager.show_menu() 
\ No newline at end of file
+    manager.show_menu()
+
+
+if __name__ == "__main__":
+    main() 
\ No newline at end of file
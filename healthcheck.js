@@ -0,0 +1,34 @@
+// docker healthcheck: every app.js process writes a heartbeat file every 30 s
+// usage: node healthcheck.js [max heartbeat age, seconds]
+// prints { "<pm2 process>": { ok, age, status } } - the manager reads it from docker inspect
+// only a stale heartbeat is unhealthy: a "Disconnected" status is reported but, as in the
+// manager's start check, it is normal and may change later, so the bot is not restarted for it
+const fs = require('fs')
+const path = require('path')
+
+const HEARTBEAT_DIR = process.env.HEARTBEAT_DIR || '/tmp/gradient-health'
+const MAX_AGE = Number(process.argv[2] || process.env.HEARTBEAT_MAX_AGE || 90)
+
+let files = []
+try {
+  files = fs.readdirSync(HEARTBEAT_DIR).filter((file) => file.endsWith('.json'))
+} catch (error) {
+  // no heartbeat yet
+}
+
+const report = {}
+for (const file of files) {
+  const name = path.basename(file, '.json')
+  try {
+    const beat = JSON.parse(fs.readFileSync(path.join(HEARTBEAT_DIR, file), 'utf-8'))
+    const age = Math.round((Date.now() - beat.time) / 1000)
+    const ok = age <= MAX_AGE
+    report[name] = { ok, age, status: beat.status || '' }
+  } catch (error) {
+    report[name] = { ok: false, age: null, status: error.message }
+  }
+}
+
+console.log(JSON.stringify(report))
+const healthy = files.length > 0 && Object.values(report).every((beat) => beat.ok)
+process.exit(healthy ? 0 : 1)
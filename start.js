@@ -4,19 +4,59 @@ const path = require('path')
 require('console-stamp')(console, {
   format: ':date(yyyy/mm/dd HH:MM:ss.l)'
 })
+// credentials of a pre-created (pooled) container are written to .env right before it starts
+require('dotenv').config({ path: path.resolve(__dirname, '.env'), override: true })
 
 let proxies = []
 
-try {
-  proxies = fs.readFileSync(path.resolve(__dirname, 'proxies.txt'), 'utf-8').split('\n').filter(Boolean)
-} catch (error) {
-  console.log('-> No proxies.txt found, or error reading file, will start app without proxy...')
+// on a remote docker host the manager passes proxies via env instead of a mounted file
+if (process.env.PROXY) {
+  proxies = process.env.PROXY.split('\n').filter(Boolean)
+} else {
+  try {
+    proxies = fs.readFileSync(path.resolve(__dirname, 'proxies.txt'), 'utf-8').split('\n').filter(Boolean)
+  } catch (error) {
+    console.log('-> No proxies.txt found, or error reading file, will start app without proxy...')
+  }
 }
 
 // 2. start pm2 with PROXY env
-const { execSync } = require('child_process')
+const { execSync, execFileSync } = require('child_process')
 const USER = process.env.APP_USER || ''
 const PASSWORD = process.env.APP_PASS || ''
+const ACCOUNTS_FILE = process.env.ACCOUNTS_FILE || path.resolve(__dirname, 'accounts.json')
+// start (or restart) only one account from accounts.json
+const ONLY = process.env.ONLY || ''
+
+// pack mode: several accounts in one container, one pm2 process per account
+// accounts.json: [{ "name": "bot1", "user": "...", "pass": "...", "proxy": "socks5://..." }, ...]
+// the same list may come in the ACCOUNTS env (remote docker host)
+if (process.env.ACCOUNTS || fs.existsSync(ACCOUNTS_FILE)) {
+  const accounts = JSON.parse(process.env.ACCOUNTS || fs.readFileSync(ACCOUNTS_FILE, 'utf-8'))
+    .filter((account) => !ONLY || account.name === ONLY)
+
+  if (ONLY && accounts.length === 0) {
+    console.error(`No account ${ONLY} in ${ACCOUNTS_FILE}`)
+    process.exit(1)
+  }
+
+  console.log(`-> Found ${accounts.length} accounts in ${ACCOUNTS_FILE}`)
+  for (const account of accounts) {
+    const env = { ...process.env, ACCOUNTS: '', APP_USER: account.user, APP_PASS: account.pass, PROXY: account.proxy || '' }
+    if (ONLY) {
+      try {
+        execFileSync('pm2', ['delete', account.name], { stdio: 'ignore' })
+      } catch (error) {
+        // not started yet
+      }
+    }
+    execFileSync('pm2', ['start', path.resolve(__dirname, 'app.js'), '--name', account.name, '-l', `${account.name}.log`], { env })
+    console.log(`-> Started ${account.name} with proxy ${account.proxy || '-'}`)
+  }
+  console.log('-> √ All accounts started!')
+  execSync('pm2 status')
+  process.exit()
+}
 
 if (!USER || !PASSWORD) {
   console.error("Please set APP_USER and APP_PASS env variables")
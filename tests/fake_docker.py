@@ -0,0 +1,516 @@
+"""Поддельный Docker Engine API для тестов и benchmark.py: контейнеры хранятся в памяти
+
+Демон слушает unix-сокет или tcp-порт и обслуживает то, что использует
+bot_manager.py: создание, запуск, остановку, переименование, список,
+inspect, stats, логи и удаление контейнеров, скачивание образов, info и
+_ping. Запущенный контейнер пишет логи в формате app.js и "подключается"
+через start_latency секунд; доля fail_rate контейнеров падает с
+критической ошибкой. Утилита docker для DockerCLI - см. install_cli.
+"""
+
+import hashlib
+import http.server
+import json
+import os
+import re
+import socket
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+def _frame(text):
+    """Кадр мультиплексированного потока логов (stdout)"""
+    data = text.encode("utf-8")
+    return bytes([1, 0, 0, 0]) + len(data).to_bytes(4, "big") + data
+
+
+def _stamp(moment):
+    return time.strftime("%Y/%m/%d %H:%M:%S", time.gmtime(moment)) + f".{int(moment % 1 * 1000):03d}"
+
+
+def _docker_time(moment):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(moment or 0)) + "Z"
+
+
+class FakeDockerHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=None):
+        data = b"" if body is None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        # Утилита docker может выйти, прочитав заголовки ответа 204
+        if data:
+            self.wfile.write(data)
+
+    def _reply_raw(self, content_type, data):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        # Клиенты docker добавляют к пути версию API: /v1.43/containers/json
+        path = re.sub(r"^/v[\d.]+/", "/", url.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        daemon = self.server.daemon
+        daemon.requests.append((method, path))
+        if daemon.api_delay:
+            time.sleep(daemon.api_delay)
+        if path == "/_ping":
+            return self._reply_raw("text/plain", b"OK")
+        if path == "/info":
+            return self._reply(200, {"MemTotal": daemon.mem_total, "NCPU": daemon.cpus, "Name": "fake"})
+        if method == "GET" and path.startswith("/images/") and path.endswith("/json"):
+            image = unquote(path[len("/images/"):-len("/json")])
+            if not daemon.has_image(image):
+                return self._reply(404, {"message": f"No such image: {image}"})
+            return self._reply(200, {"Id": "sha256:" + hashlib.sha256(image.encode("utf-8")).hexdigest()})
+        if method == "POST" and path == "/images/create":
+            tag = params.get("tag", "")
+            image = params["fromImage"] + (("@" if tag.startswith("sha256:") else ":") + tag if tag else "")
+            return self._reply_raw("application/json", daemon.pull(image))
+        if path.startswith("/exec/") or re.match(r"^/containers/[^/]+/exec$", path):
+            # Процессы pm2 (режим паков) демон не изображает
+            return self._reply(404, {"message": "exec is not supported by the fake daemon"})
+        if method == "GET" and path == "/containers/json":
+            filters = json.loads(params.get("filters", "{}"))
+            with daemon.lock:
+                containers = list(daemon.containers.values())
+            return self._reply(200, [{
+                "Id": container["id"], "Image": container["image"], "Names": ["/" + container["name"]],
+                "State": container["state"], "Status": daemon.status(container),
+                "Labels": container["labels"], "Created": int(container["created"]),
+            } for container in containers
+                if (params.get("all") == "1" or container["state"] == "running") and daemon.matches(container, filters)])
+        if method == "POST" and path == "/containers/create":
+            with daemon.lock:
+                name = params.get("name")
+                if name in {container["name"] for container in daemon.containers.values()}:
+                    return self._reply(409, {"message": f"Conflict. The container name \"/{name}\" is already in use"})
+                if not daemon.has_image(body["Image"]):
+                    return self._reply(404, {"message": f"No such image: {body['Image']}"})
+                container_id = uuid.uuid4().hex * 2
+                daemon.containers[container_id] = {
+                    "id": container_id, "name": name or container_id[:12], "image": body["Image"],
+                    "state": "created", "labels": body.get("Labels") or {}, "env": body.get("Env") or [],
+                    "created": time.time(), "started": None,
+                }
+            return self._reply(201, {"Id": container_id, "Warnings": []})
+
+        match = re.match(r"^/containers/([^/]+)(?:/(\w+))?$", path)
+        if not match:
+            return self._reply(404, {"message": f"page not found: {method} {path}"})
+        action = match.group(2)
+        with daemon.lock:
+            container_id = daemon.resolve(unquote(match.group(1)))
+            if container_id is None:
+                return self._reply(404, {"message": f"No such container: {unquote(match.group(1))}"})
+            container = daemon.containers[container_id]
+            if method == "POST" and action == "start":
+                container["state"] = "running"
+                container["started"] = time.time()
+                return self._reply(204)
+            if method == "POST" and action in ("stop", "kill"):
+                container["state"] = "exited"
+                return self._reply(204)
+            if method == "POST" and action == "rename":
+                if params["name"] in {other["name"] for other in daemon.containers.values()}:
+                    return self._reply(409, {"message": f"Conflict. The name \"/{params['name']}\" is already in use"})
+                container["name"] = params["name"]
+                return self._reply(204)
+            if method == "DELETE" and action is None:
+                if container["state"] == "running" and params.get("force") != "1":
+                    return self._reply(409, {"message": "You cannot remove a running container"})
+                del daemon.containers[container_id]
+                # Закрывает поток логов удаленного контейнера
+                container["state"] = "removing"
+                return self._reply(204)
+            if method == "GET" and action == "json":
+                return self._reply(200, {
+                    "Id": container_id, "Name": "/" + container["name"], "RestartCount": 0,
+                    "State": {"Status": container["state"], "Running": container["state"] == "running",
+                              "StartedAt": _docker_time(container["started"]), "ExitCode": 0},
+                    "Config": {"Labels": container["labels"], "Image": container["image"], "Env": container["env"]},
+                })
+            if method == "GET" and action == "stats":
+                return self._reply(200, {
+                    "cpu_stats": {"cpu_usage": {"total_usage": 0}, "system_cpu_usage": 1000, "online_cpus": 1},
+                    "precpu_stats": {"cpu_usage": {"total_usage": 0}, "system_cpu_usage": 0},
+                    "memory_stats": {"usage": 1 << 20, "limit": daemon.mem_total, "stats": {}},
+                })
+        if method == "GET" and action == "logs":
+            # Поток логов держит соединение - отдаем его вне блокировки демона
+            return self._send_logs(daemon, container, params)
+        self._reply(404, {"message": f"page not found: {method} {path}"})
+
+    def _send_logs(self, daemon, container, params):
+        lines = daemon.log_lines(container)
+        if params.get("tail") not in (None, "all"):
+            lines = lines[-int(params["tail"]):] if int(params["tail"]) else []
+        if params.get("follow") != "1":
+            return self._reply_raw("application/vnd.docker.multiplexed-stream",
+                                   b"".join(_frame(text) for moment, text in lines if moment <= time.time()))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.docker.multiplexed-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for moment, text in lines:
+                if moment > time.time():
+                    time.sleep(moment - time.time())
+                self.wfile.write(_frame(text))
+                self.wfile.flush()
+            # Поток закрывается, когда контейнер останавливается
+            while container["state"] == "running":
+                time.sleep(0.2)
+        except OSError:
+            pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class _ConnectionsMixIn(socketserver.ThreadingMixIn):
+    """Запоминает открытые соединения, чтобы остановка демона рвала и keep-alive"""
+
+    daemon_threads = True
+    # Массовый запуск открывает сотни соединений одновременно
+    request_queue_size = 1024
+
+    def process_request(self, request, client_address):
+        self.connections.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        self.connections.discard(request)
+        super().shutdown_request(request)
+
+
+class _UnixServer(_ConnectionsMixIn, socketserver.UnixStreamServer):
+    def get_request(self):
+        request, _ = super().get_request()
+        # http.server ждет адрес клиента в виде (хост, порт)
+        return request, ("local", 0)
+
+
+class _TCPServer(_ConnectionsMixIn, http.server.HTTPServer):
+    pass
+
+
+class FakeDockerd:
+    """Поддельный демон; start() возвращает его адрес, stop() останавливает
+
+    images - локальные образы (None - есть любой), registry - образы, которые
+    можно скачать. start_latency - через сколько секунд после запуска бот
+    подключается, fail_rate - доля падающих контейнеров, api_delay -
+    задержка каждого запроса.
+    """
+
+    def __init__(self, mem_total=8 << 30, cpus=4, images=None, registry=(), start_latency=0.0, fail_rate=0.0,
+                 api_delay=0.0):
+        self.mem_total = mem_total
+        self.cpus = cpus
+        self.images = None if images is None else set(images)
+        self.registry = set(registry)
+        self.start_latency = start_latency
+        self.fail_rate = fail_rate
+        self.api_delay = api_delay
+        self.lock = threading.Lock()
+        self.containers = {}
+        self.requests = []
+        self.pulls = []
+        self._server = None
+
+    def has_image(self, image):
+        return self.images is None or image in self.images
+
+    def pull(self, image):
+        """Поток прогресса /images/create; ошибку, как и настоящий демон, сообщает внутри ответа 200"""
+        self.pulls.append(image)
+        progress = [{"status": f"Pulling from {image}"}]
+        if image in self.registry:
+            if self.images is not None:
+                self.images.add(image)
+            progress.append({"status": f"Status: Downloaded newer image for {image}"})
+        else:
+            progress.append({"errorDetail": {"message": f"manifest for {image} not found"},
+                             "error": f"manifest for {image} not found"})
+        return "".join(json.dumps(line) + "\r\n" for line in progress).encode("utf-8")
+
+    def fails(self, name):
+        # Падающие контейнеры выбираются по имени - одинаково во всех прогонах
+        return int(hashlib.md5(name.encode("utf-8")).hexdigest(), 16) % 10000 < self.fail_rate * 10000
+
+    def log_lines(self, container):
+        """[(время, строка)] логов app.js запущенного контейнера"""
+        started = container["started"]
+        if started is None:
+            return []
+        latency = self.start_latency
+        lines = [(0, "-> Starting..."), (latency * 0.3, "-> Logged in! Waiting for open extension..."),
+                 (latency * 0.6, "-> Extension loaded!")]
+        if self.fails(container["name"]):
+            lines.append((latency * 0.7, "Please set APP_USER and APP_PASS env variables"))
+        else:
+            lines += [(latency, "-> Status: Good"), (latency, "-> Connected! Starting rolling..."),
+                      (latency, "{ support_status: 'Good' }")]
+        return [(started + offset, f"[{_stamp(started + offset)}] {text}\n") for offset, text in lines]
+
+    @staticmethod
+    def status(container):
+        if container["state"] == "running":
+            return "Up 1 second"
+        return "Created" if container["state"] == "created" else "Exited (0) 1 second ago"
+
+    @staticmethod
+    def is_ancestor(container, image):
+        # Образ без тега означает :latest
+        def normalize(name):
+            return name if ":" in name.rsplit("/", 1)[-1] else f"{name}:latest"
+        return normalize(container["image"]) == normalize(image)
+
+    @classmethod
+    def matches(cls, container, filters):
+        """Фильтры /containers/json, как у Docker: все метки должны совпасть, для остальных - хотя бы одно значение"""
+        def check(key, value):
+            if key == "label":
+                label, _, expected = value.partition("=")
+                return label in container["labels"] and (not expected or container["labels"][label] == expected)
+            if key == "name":
+                return re.search(value, "/" + container["name"]) is not None
+            if key == "ancestor":
+                return cls.is_ancestor(container, value)
+            if key == "id":
+                return container["id"].startswith(value)
+            if key == "status":
+                return container["state"] == value
+            raise ValueError(f"unsupported filter: {key}")
+
+        for key, values in filters.items():
+            combine = all if key == "label" else any
+            if values and not combine(check(key, value) for value in values):
+                return False
+        return True
+
+    def resolve(self, name_or_id):
+        for container_id, container in self.containers.items():
+            if name_or_id in (container_id, container["name"]) or (
+                    len(name_or_id) >= 12 and container_id.startswith(name_or_id)):
+                return container_id
+        return None
+
+    def start(self, socket_path=None):
+        """Слушает unix-сокет socket_path или, без него, tcp-порт на 127.0.0.1"""
+        if socket_path:
+            self._server = _UnixServer(socket_path, FakeDockerHandler)
+            address = socket_path
+        else:
+            self._server = _TCPServer(("127.0.0.1", 0), FakeDockerHandler)
+            address = self._server.server_address
+        self._server.daemon = self
+        self._server.connections = set()
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return address
+
+    def stop(self):
+        """Останавливает демон и закрывает открытые соединения; повторный вызов ничего не делает"""
+        server, self._server = self._server, None
+        if server is None:
+            return
+        server.shutdown()
+        server.server_close()
+        for request in list(server.connections):
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if isinstance(server, _UnixServer):
+            os.remove(server.server_address)
+
+
+# Утилита docker для DockerCLI: разбирает команды, которые вызывает bot_manager.py, и обращается
+# к демону по сокету SOCKET (см. install_cli). Вывод - в тех форматах, что разбирает DockerCLI.
+CLI_SCRIPT = r'''
+import http.client, json, socket, sys
+from urllib.parse import quote, urlencode
+
+
+class Connection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def send(method, path, params=None, body=None):
+    conn = Connection(SOCKET)
+    conn.request(method, path + ("?" + urlencode(params) if params else ""),
+                 body=json.dumps(body) if body is not None else None, headers={"Content-Type": "application/json"})
+    return conn.getresponse()
+
+
+def fail(response, suffix=""):
+    sys.stderr.write(f"Error response from daemon: {json.loads(response.read())['message']}{suffix}\n")
+
+
+def request(method, path, params=None, body=None):
+    response = send(method, path, params, body)
+    if response.status >= 400:
+        fail(response)
+        sys.exit(1)
+    data = response.read()
+    return json.loads(data) if data else None
+
+
+def pull(image):
+    for line in send("POST", "/images/create", {"fromImage": image}).read().decode().splitlines():
+        error = json.loads(line).get("error")
+        if error:
+            sys.stderr.write(error + "\n")
+            sys.exit(1)
+
+
+def frames(response):
+    """Данные кадров мультиплексированного потока логов"""
+    while True:
+        header = response.read(8)
+        if len(header) < 8:
+            return
+        yield response.read(int.from_bytes(header[4:], "big")).decode("utf-8", "replace")
+
+
+def take(args, flag):
+    values = []
+    while flag in args:
+        index = args.index(flag)
+        values.append(args[index + 1])
+        del args[index:index + 2]
+    return values
+
+
+def each(container_ids, action):
+    """Как docker stop/rm: печатает ID каждого обработанного контейнера, ошибки - в stderr"""
+    failed = False
+    for container_id in container_ids:
+        response = action(container_id)
+        if response.status >= 400:
+            fail(response, f" ({container_id})")
+            failed = True
+        else:
+            response.read()
+            print(container_id)
+    sys.exit(1 if failed else 0)
+
+
+args = sys.argv[1:]
+command = args.pop(0)
+take(args, "--format")
+if command == "version":
+    print("fake")
+elif command == "info":
+    print(json.dumps(request("GET", "/info")))
+elif command == "image" and args[0] == "inspect":
+    print(request("GET", f"/images/{args[-1]}/json")["Id"])
+elif command == "pull":
+    pull(args[-1])
+elif command == "ps":
+    filters = {}
+    for value in take(args, "-f"):
+        key, _, value = value.partition("=")
+        filters.setdefault(key, []).append(value)
+    for item in request("GET", "/containers/json", {"all": 1 if "-a" in args else 0, "filters": json.dumps(filters)}):
+        print(json.dumps({"ID": item["Id"], "Image": item["Image"], "Names": item["Names"][0].lstrip("/"),
+                          "State": item["State"], "Status": item["Status"],
+                          "Labels": ",".join(f"{key}={value}" for key, value in item["Labels"].items())}))
+elif command in ("run", "create"):
+    name = take(args, "--name")
+    env = take(args, "-e")
+    labels = dict(value.split("=", 1) for value in take(args, "--label"))
+    binds = take(args, "-v")
+    never_pull = take(args, "--pull") == ["never"]
+    for flag in ("--memory", "--cpus", "--restart", "--health-cmd", "--health-interval", "--health-timeout",
+                 "--health-retries", "--health-start-period"):
+        take(args, flag)
+    if command == "run":
+        args.remove("-d")
+    if len(args) != 1:
+        sys.stderr.write(f"unexpected arguments: {args}\n")
+        sys.exit(2)
+    image = args[0]
+    if not never_pull and send("GET", f"/images/{image}/json").status == 404:
+        # Как настоящий docker run, скачиваем отсутствующий образ
+        pull(image)
+    container_id = request("POST", "/containers/create", {"name": name[0]} if name else None,
+                           {"Image": image, "Env": env, "Labels": labels, "HostConfig": {"Binds": binds}})["Id"]
+    if command == "run":
+        request("POST", f"/containers/{container_id}/start")
+    print(container_id)
+elif command == "start":
+    request("POST", f"/containers/{quote(args[0])}/start")
+elif command == "rename":
+    request("POST", f"/containers/{quote(args[0])}/rename", {"name": args[1]})
+elif command == "inspect":
+    for container_id in args:
+        print(json.dumps(request("GET", f"/containers/{quote(container_id)}/json")))
+elif command == "stats":
+    for container_id in [arg for arg in args if not arg.startswith("-")]:
+        memory = request("GET", f"/containers/{quote(container_id)}/stats", {"stream": 0})["memory_stats"]
+        print(json.dumps({"ID": container_id, "CPUPerc": "0.00%",
+                          "MemUsage": f"{memory['usage'] / 2**20:.2f}MiB / {memory['limit'] / 2**30:.2f}GiB"}))
+elif command == "logs":
+    params = {"stdout": 1, "stderr": 1, "follow": 1 if "-f" in args else 0}
+    tail = take(args, "--tail")
+    if tail:
+        params["tail"] = tail[0]
+    response = send("GET", f"/containers/{quote(args[-1])}/logs", params)
+    if response.status >= 400:
+        fail(response)
+        sys.exit(1)
+    for text in frames(response):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+elif command == "stop":
+    timeout = take(args, "-t")
+    each(args, lambda container_id: send("POST", f"/containers/{quote(container_id)}/stop",
+                                         {"t": timeout[0]} if timeout else None))
+elif command == "rm":
+    force = "-f" in args
+    each([arg for arg in args if arg != "-f"],
+         lambda container_id: send("DELETE", f"/containers/{quote(container_id)}", {"force": 1 if force else 0}))
+else:
+    sys.stderr.write(f"unsupported command: {command}\n")
+    sys.exit(2)
+'''
+
+
+def install_cli(directory, socket_path):
+    """Кладет в directory исполняемый docker, работающий с демоном на socket_path"""
+    path = os.path.join(directory, "docker")
+    with open(path, "w") as f:
+        f.write(f"#!{sys.executable}\nSOCKET = {socket_path!r}\n{CLI_SCRIPT}")
+    os.chmod(path, 0o755)
+    return path
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import bot_manager
+from bot_manager import ALL_BOTS, LABEL_BOT_ID, LABEL_MANAGED, BotManager
+from tests.fake_docker import FakeDockerd, install_cli
+
+
+class LocalManagerTest(unittest.TestCase):
+    """BotManager на локальном поддельном демоне (unix-сокет)"""
+
+    def setUp(self):
+        workdir = tempfile.mkdtemp(prefix="bot-manager-")
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        self.addCleanup(os.chdir, cwd)
+        self.daemon = FakeDockerd()
+        socket_path = self.daemon.start(os.path.join(workdir, "docker.sock"))
+        self.addCleanup(self.daemon.stop)
+        install_cli(workdir, socket_path)
+        path = mock.patch.dict(os.environ, {"PATH": workdir + os.pathsep + os.environ.get("PATH", "")})
+        path.start()
+        self.addCleanup(path.stop)
+        for name, value in (("DOCKER_HOSTS", ""), ("DOCKER_BACKEND", "api"), ("DOCKER_SOCKET", socket_path)):
+            patch = mock.patch.object(bot_manager, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.manager = BotManager(echo=None)
+        self.docker = self.manager.docker
+
+    def test_cleanup_finds_unlabeled_containers(self):
+        self.docker.run("gradient-bot-new", bot_manager.BOT_IMAGE, labels={LABEL_MANAGED: "1", LABEL_BOT_ID: "new"})
+        # Контейнеры без меток: из прежнего образа и из текущего
+        self.docker.run("gradient-bot-old", "overtrue/gradient-bot", labels={})
+        self.docker.run("gradient-bot-local", bot_manager.BOT_IMAGE, labels={})
+        self.docker.run("web", "nginx", labels={})
+
+        for backend in ("api", "cli"):
+            with self.subTest(backend=backend), mock.patch.object(bot_manager, "DOCKER_BACKEND", backend):
+                manager = BotManager(echo=None)
+                found = {bot_id for bot_id, _ in manager._resolve_containers(ALL_BOTS)}
+                self.assertEqual(found, {"new", "old", "local"})
+
+
+if __name__ == "__main__":
+    unittest.main()
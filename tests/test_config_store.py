@@ -0,0 +1,56 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from bot_manager import SQLiteBotStore
+
+
+class SQLiteBotStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="bot-store-")
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.db = os.path.join(self.workdir, "bot_config.db")
+        self.legacy = os.path.join(self.workdir, "bot_config.json")
+        self.messages = []
+
+    def store(self):
+        store = SQLiteBotStore(self.db, legacy_json=self.legacy, echo=self.messages.append)
+        self.addCleanup(store.close)
+        return store
+
+    def test_reads_do_not_create_database(self):
+        store = self.store()
+        self.assertEqual((len(store), list(store), "bot1" in store), (0, [], False))
+        with self.assertRaises(KeyError):
+            store["bot1"]
+        self.assertEqual(os.listdir(self.workdir), [])
+
+        store["bot1"] = {"email": "a@example.com", "proxy_file": "proxies_bot1.txt"}
+        self.assertTrue(os.path.exists(self.db))
+        self.assertEqual(self.store()["bot1"]["email"], "a@example.com")
+
+    def test_legacy_config_migrated_on_first_write(self):
+        bots = {"bot1": {"email": "a@example.com", "proxy_file": "proxies_bot1.txt"}, "broken": {"email": 1}}
+        with open(self.legacy, "w") as f:
+            json.dump({"bots": bots}, f)
+
+        store = self.store()
+        # До первой записи боты читаются из bot_config.json, а файлы не меняются
+        self.assertEqual(store.items(), [("bot1", bots["bot1"])])
+        store["bot1"]["email"] = "changed"
+        self.assertEqual(store["bot1"], bots["bot1"])
+        self.assertEqual(os.listdir(self.workdir), ["bot_config.json"])
+        self.assertEqual(self.messages, [])
+
+        store["bot2"] = {"email": "b@example.com", "proxy_file": "proxies_bot2.txt"}
+        self.assertEqual(list(store), ["bot1", "bot2"])
+        self.assertFalse(os.path.exists(self.legacy))
+        self.assertTrue(os.path.exists(self.legacy + ".migrated"))
+        self.assertEqual(len(self.messages), 2)
+        self.assertEqual(list(self.store()), ["bot1", "bot2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import bot_manager
+from bot_manager import LABEL_BOT_ID, LABEL_MANAGED, DockerAPI, DockerCLI, DockerError
+from tests.fake_docker import FakeDockerd, install_cli
+
+
+class DockerBackendsTest(unittest.TestCase):
+    """DockerAPI через unix-сокет и DockerCLI видят поддельный демон одинаково"""
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="fake-docker-")
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.daemon = FakeDockerd()
+        socket_path = self.daemon.start(os.path.join(self.workdir, "docker.sock"))
+        self.addCleanup(self.daemon.stop)
+        install_cli(self.workdir, socket_path)
+        path = mock.patch.dict(os.environ, {"PATH": self.workdir + os.pathsep + os.environ.get("PATH", "")})
+        path.start()
+        self.addCleanup(path.stop)
+        self.api = DockerAPI(socket_path, timeout=10)
+        self.cli = DockerCLI()
+
+    @staticmethod
+    def labels(bot_id):
+        return {LABEL_MANAGED: "1", LABEL_BOT_ID: bot_id}
+
+    def test_run_ps_rm(self):
+        for backend in (self.api, self.cli):
+            with self.subTest(backend=backend.name):
+                container_id = backend.run(f"gradient-{backend.name}", "gradient-bot:local", env={"APP_USER": "u"},
+                                           labels=self.labels(backend.name))
+                containers = backend.ps(filters={"label": [f"{LABEL_BOT_ID}={backend.name}"]})
+                self.assertEqual([(c["id"], c["name"], c["image"], c["state"]) for c in containers],
+                                 [(container_id, f"gradient-{backend.name}", "gradient-bot:local", "running")])
+                self.assertEqual(containers[0]["labels"], self.labels(backend.name))
+
+                with self.assertRaises(DockerError):
+                    backend.remove(container_id)
+                backend.remove(container_id, force=True)
+                self.assertEqual(backend.ps(filters={"label": [f"{LABEL_BOT_ID}={backend.name}"]}), [])
+                with self.assertRaises(DockerError):
+                    backend.remove(container_id, force=True)
+
+    def test_backends_agree(self):
+        for index in range(3):
+            self.api.run(f"gradient-bot{index}", "gradient-bot:local", labels=self.labels(f"bot{index}"))
+        self.daemon.containers[self.api.create("unmanaged", "other", labels={})]["state"] = "exited"
+
+        def view(backend, **kwargs):
+            return sorted((c["id"], c["name"], c["image"], c["state"], sorted(c["labels"].items()))
+                          for c in backend.ps(**kwargs))
+
+        for kwargs in ({}, {"all": False}, {"filters": {"label": [LABEL_MANAGED]}}):
+            with self.subTest(**kwargs):
+                self.assertEqual(view(self.api, **kwargs), view(self.cli, **kwargs))
+        self.assertEqual(len(view(self.api)), 4)
+        self.assertEqual(len(view(self.api, all=False)), 3)
+
+        ids = [c["id"] for c in self.api.ps(filters={"label": [LABEL_MANAGED]})]
+        self.assertEqual(self.cli.remove_many(ids[:2] + ["missing"], force=True),
+                         {"missing": mock.ANY})
+        self.assertEqual(self.api.remove_many(ids[2:], force=True), {})
+        self.assertEqual(view(self.api), view(self.cli))
+        self.assertEqual([c["name"] for c in self.api.ps()], ["unmanaged"])
+
+    def test_local_image_not_pulled(self):
+        self.daemon.images = set()
+        for backend in (self.api, self.cli):
+            with self.subTest(backend=backend.name):
+                with self.assertRaises(DockerError) as error:
+                    backend.run(f"local-{backend.name}", "gradient-bot:local", labels={})
+                self.assertNotIn("pull", str(error.exception))
+        self.assertEqual(self.daemon.pulls, [])
+
+    def test_pull(self):
+        self.daemon.images = set()
+        self.daemon.registry = {"ubuntu:22.04", "registry:5000/org/img:1.0"}
+        self.api.run("ubuntu", "ubuntu:22.04", labels={})
+        self.api.pull("registry:5000/org/img:1.0")
+        self.assertEqual(self.daemon.images, self.daemon.registry)
+        # Ошибка приходит в потоке прогресса ответа 200
+        for image in ("registry:5000/org/img", "ubuntu@sha256:" + "0" * 64):
+            with self.subTest(image=image), self.assertRaisesRegex(DockerError, "not found"):
+                self.api.pull(image)
+        self.assertEqual(self.daemon.pulls, ["ubuntu:22.04", "registry:5000/org/img:1.0",
+                                             "registry:5000/org/img:latest", "ubuntu@sha256:" + "0" * 64])
+
+    def test_api_faster_than_cli(self):
+        # Ради этого и нужен DockerAPI: запрос по keep-alive соединению вместо процесса docker на каждый вызов
+        self.api.run("gradient-bot1", "gradient-bot:local", labels=self.labels("bot1"))
+
+        def per_call(backend, calls=10):
+            backend.ps()
+            started = time.perf_counter()
+            for _ in range(calls):
+                backend.ps(filters={"label": [LABEL_MANAGED]})
+            return (time.perf_counter() - started) / calls
+
+        api, cli = per_call(self.api), per_call(self.cli)
+        self.assertLess(api, cli, f"api {api * 1000:.1f} мс, cli {cli * 1000:.1f} мс на вызов")
+
+    def test_keep_alive(self):
+        # Все запросы потока идут по одному соединению
+        self.assertTrue(self.api.ping())
+        conn = self.api._connection()
+        self.api.ps()
+        self.assertIs(self.api._connection(), conn)
+        self.assertEqual(self.daemon.requests[-2:], [("GET", "/_ping"), ("GET", "/containers/json")])
+
+
+class ImageNameTest(unittest.TestCase):
+    def test_is_registry_image(self):
+        for image, expected in (("gradient-bot:local", False), ("registry:5000/team/bot:local", False),
+                                ("ubuntu:22.04", True), ("ubuntu", True), ("overtrue/gradient-bot", True),
+                                ("registry:5000/local", True), ("bot:local@sha256:" + "0" * 64, True)):
+            with self.subTest(image=image):
+                self.assertEqual(bot_manager.is_registry_image(image), expected)
+
+
+    def test_split_image(self):
+        digest = "sha256:" + "0" * 64
+        for image, expected in (("ubuntu", ("ubuntu", "", "")), ("ubuntu:22.04", ("ubuntu", "22.04", "")),
+                                ("registry:5000/org/img", ("registry:5000/org/img", "", "")),
+                                ("registry:5000/org/img:1.0", ("registry:5000/org/img", "1.0", "")),
+                                (f"registry:5000/org/img:1.0@{digest}", ("registry:5000/org/img", "1.0", digest))):
+            with self.subTest(image=image):
+                self.assertEqual(bot_manager.split_image(image), expected)
+
+
+class DockerClientTest(unittest.TestCase):
+    def setUp(self):
+        workdir = tempfile.mkdtemp(prefix="fake-docker-")
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        daemon = FakeDockerd()
+        self.socket_path = daemon.start(os.path.join(workdir, "docker.sock"))
+        self.addCleanup(daemon.stop)
+
+    def test_auto_backend_prefers_socket(self):
+        environ = {key: value for key, value in os.environ.items() if key != "DOCKER_HOST"}
+        with mock.patch.dict(os.environ, environ, clear=True), \
+                mock.patch.object(bot_manager, "DOCKER_BACKEND", "auto"), \
+                mock.patch.object(bot_manager, "DOCKER_SOCKET", self.socket_path):
+            self.assertIsInstance(bot_manager.get_docker_client(), DockerAPI)
+
+    def test_unix_endpoint(self):
+        with mock.patch.object(bot_manager, "DOCKER_BACKEND", "auto"):
+            docker = bot_manager.get_docker_client(f"unix://{self.socket_path}")
+        self.assertIsInstance(docker, DockerAPI)
+        self.assertEqual(docker.ps(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
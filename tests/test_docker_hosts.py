@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import bot_manager
+from bot_manager import LABEL_BOT_ID, LABEL_MANAGED, BotManager, DockerAPI
+from tests.fake_docker import FakeDockerd
+
+
+class DockerHostsTest(unittest.TestCase):
+    """Парк на двух удаленных хостах (tcp://) с поддельными демонами"""
+
+    def setUp(self):
+        workdir = tempfile.mkdtemp(prefix="fake-hosts-")
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        self.addCleanup(os.chdir, cwd)
+
+        # На small помещается 5 ботов по 700m, на big - 21
+        self.daemons = {"small": FakeDockerd(mem_total=4 << 30, cpus=2), "big": FakeDockerd(mem_total=16 << 30, cpus=8)}
+        endpoints = []
+        for name, daemon in self.daemons.items():
+            host, port = daemon.start()
+            self.addCleanup(daemon.stop)
+            endpoints.append(f"{name}=tcp://{host}:{port}")
+        for name, value in (("DOCKER_HOSTS", ",".join(endpoints)), ("DOCKER_BACKEND", "auto"),
+                            ("EXPECTED_BOT_MEMORY", "700m"), ("EXPECTED_BOT_CPU", 25), ("BOT_MEMORY_LIMIT", "")):
+            patch = mock.patch.object(bot_manager, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.manager = BotManager(echo=None)
+
+    def add_bots(self, bot_ids, pack=None):
+        with self.manager.store.batch():
+            for bot_id in bot_ids:
+                bot = {"email": f"{bot_id}@example.com", "password": "p", "proxy_file": f"proxies_{bot_id}.txt"}
+                if pack:
+                    bot["pack"] = pack
+                self.manager.config["bots"][bot_id] = bot
+
+    def test_hosts(self):
+        self.assertEqual(list(self.manager.hosts), ["small", "big"])
+        for name, host in self.manager.hosts.items():
+            self.assertIsInstance(host.docker, DockerAPI)
+            self.assertFalse(host.local)
+            self.assertTrue(host.available())
+        self.assertEqual(self.manager.hosts["big"].host_resources(), {"mem_total": 16 << 30, "cpus": 8})
+
+    def test_place_bots_by_capacity(self):
+        packs = {f"pack{index}": [f"pack{index}-bot{number}" for number in range(10)] for index in range(3)}
+        for pack, bot_ids in packs.items():
+            self.add_bots(bot_ids, pack)
+
+        placed = self.manager.place_bots(list(packs.values()))
+        # Первые два пака уходят на big (21 -> 11 -> 1), третий - на small, где места больше
+        self.assertEqual({pack: {placed[bot_id] for bot_id in bot_ids} for pack, bot_ids in packs.items()},
+                         {"pack0": {"big"}, "pack1": {"big"}, "pack2": {"small"}})
+        self.assertEqual(self.manager.host_of("pack2-bot0").name, "small")
+        # Уже размещенные боты повторно не размещаются
+        self.assertEqual(self.manager.place_bots(list(packs.values())), {})
+
+    def test_failover(self):
+        self.add_bots(["bot1", "bot2"])
+        self.assertEqual(set(self.manager.place_bots([["bot1"], ["bot2"]]).values()), {"big"})
+
+        big = self.manager.hosts["big"]
+        self.daemons["big"].stop()
+        self.assertFalse(big.available(force=True))
+        # Пока хост недоступен меньше HOST_FAILOVER, боты остаются на нем
+        self.assertEqual(self.manager.place_bots([["bot1"]]), {})
+        with mock.patch.object(bot_manager, "HOST_FAILOVER", 0):
+            self.assertEqual(self.manager._placed_host("bot1").name, "small")
+            self.assertEqual(self.manager.place_bots([["bot2"]]), {"bot2": "small"})
+
+    def test_container_states_per_host(self):
+        self.add_bots(["bot1", "bot2"])
+        self.manager.place_bots([["bot1"], ["bot2"]])
+        small = self.manager.hosts["small"].docker
+        big = self.manager.hosts["big"].docker
+        big.run("gradient-bot1", "gradient-bot:local", labels={LABEL_MANAGED: "1", LABEL_BOT_ID: "bot1"})
+        # Копия бота на хосте, откуда его перенесли
+        small.run("gradient-bot2", "gradient-bot:local", labels={LABEL_MANAGED: "1", LABEL_BOT_ID: "bot2"})
+
+        strays = []
+        states = self.manager.container_states(strays=strays)
+        self.assertEqual({bot_id: container["host"] for bot_id, container in states.items()}, {"bot1": "big"})
+        self.assertEqual([(bot_id, container["host"]) for bot_id, container in strays], [("bot2", "small")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import bot_manager
+from bot_manager import BotManager, spec_hash
+
+
+class ApplyManifestTest(unittest.TestCase):
+    """Ошибочный манифест не должен удалять парк"""
+
+    def setUp(self):
+        workdir = tempfile.mkdtemp(prefix="manifest-")
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        self.addCleanup(os.chdir, cwd)
+        for name, value in (("DOCKER_HOSTS", ""), ("DOCKER_BACKEND", "cli")):
+            patch = mock.patch.object(bot_manager, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.manager = BotManager(echo=None)
+        self.manager.delete_bots = mock.Mock(return_value={})
+        self.manager.provision_bots = mock.Mock(return_value={})
+
+        with self.manager.store.batch():
+            for index in (1, 2):
+                proxy = self.manager.convert_proxy_format(f"10.0.0.{index}:1080:u:p", verbose=False)
+                with open(f"proxies_bot{index}.txt", "w") as f:
+                    f.write(proxy)
+                self.manager.config["bots"][f"bot{index}"] = {
+                    "email": f"bot{index}@example.com", "password": "p", "proxy_file": f"proxies_bot{index}.txt",
+                    "spec_hash": spec_hash(f"bot{index}@example.com", "p", proxy),
+                }
+
+    def write(self, name, text):
+        with open(name, "w", encoding="utf-8") as f:
+            f.write(text)
+        return name
+
+    def test_wrong_delimiter_keeps_fleet(self):
+        path = self.write("bots.csv", "bot_id;email;password;proxy\nbot1;bot1@example.com;p;10.0.0.1:1080:u:p\n")
+        result = self.manager.apply_manifest(path)
+        self.assertEqual((result["removed"], result["invalid"]), ([], 1))
+        self.manager.delete_bots.assert_not_called()
+        self.assertEqual(sorted(self.manager.config["bots"]), ["bot1", "bot2"])
+        self.assertTrue(os.path.exists("proxies_bot2.txt"))
+
+    def test_empty_manifest_keeps_fleet(self):
+        result = self.manager.apply_manifest(self.write("bots.jsonl", "\n"))
+        self.assertEqual((result["removed"], result["invalid"]), ([], 0))
+        self.manager.delete_bots.assert_not_called()
+
+    def test_invalid_lines_block_prune(self):
+        path = self.write("bots.jsonl", '{"bot_id": "bot1", "email": "bot1@example.com", "password": "p", '
+                                        '"proxy": "10.0.0.1:1080:u:p"}\n{broken\n[1, 2]\n')
+        result = self.manager.apply_manifest(path)
+        self.assertEqual((result["added"], result["changed"], result["removed"], result["invalid"]),
+                         ([], [], [], 2))
+        self.manager.delete_bots.assert_not_called()
+        self.assertIn("bot2", self.manager.config["bots"])
+
+        result = self.manager.apply_manifest(path, force_prune=True)
+        self.assertEqual(result["removed"], ["bot2"])
+        self.manager.delete_bots.assert_called_once_with(["bot2"])
+
+    def test_valid_manifest_prunes(self):
+        path = self.write("bots.csv", "bot_id,email,password,proxy\nbot1,bot1@example.com,p,10.0.0.1:1080:u:p\n")
+        self.assertEqual(self.manager.apply_manifest(path, dry_run=True)["removed"], ["bot2"])
+
+
+if __name__ == "__main__":
+    unittest.main()